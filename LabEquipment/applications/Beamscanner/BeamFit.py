@@ -0,0 +1,213 @@
+#############################################################
+# Complex Gaussian beam fitting for the Beamscanner         #
+#                                                           #
+# Fits a 2-D complex Gaussian beam to measured amplitude    #
+# and phase maps, for one or many scans.                    #
+#############################################################
+"""Fit a complex Gaussian beam to Beamscanner data.
+
+The beam model is
+
+    E = exp(amp + j phase) exp(-(u**2/wx**2 + v**2/wy**2))
+        exp(-j (cx u**2 + cy v**2)) exp(-j (tx x + ty y))
+
+where u, v are the coordinates about the center x0, y0 rotated by angle
+(radians), wx, wy the 1/e amplitude radii along u and v, cx, cy the phase
+curvatures in rad/mm**2 (k/2R for a radius of curvature R), and tx, ty the
+phase tilts in rad/mm (k sin(theta) for a beam tilted by theta).  Positions
+are in mm.  The fit minimizes the complex residual with
+scipy.optimize.least_squares, using the analytic Jacobian.
+
+fitMany fits many maps (e.g. one per frequency, or per scan) in parallel in
+a process pool.
+
+    fit = BeamFit.fit(x, y, trans)
+    fit.report()
+    fits = BeamFit.fitMany(transCube, x, y)
+"""
+
+from __future__ import print_function, division
+
+import concurrent.futures
+import sys
+
+import numpy as np
+from scipy.optimize import least_squares
+
+params = ("amp", "phase", "x0", "y0", "wx", "wy", "angle", "cx", "cy", "tx", "ty")
+
+
+def _frame(p, x, y):
+    c, s = np.cos(p[6]), np.sin(p[6])
+    dx, dy = x - p[2], y - p[3]
+    return c, s, c*dx + s*dy, -s*dx + c*dy
+
+
+def model(p, x, y):
+    """Return the complex field of the beam with parameters p at x, y"""
+    c, s, u, v = _frame(p, x, y)
+    return np.exp(p[0] + 1j*p[1]
+                  - u**2*(1/p[4]**2 + 1j*p[7]) - v**2*(1/p[5]**2 + 1j*p[8])
+                  - 1j*(p[9]*x + p[10]*y))
+
+
+def jacobian(p, x, y, E=None):
+    """Return the derivatives of model(p, x, y) with respect to each of the
+    parameters, shape (len(x), len(params))"""
+    if E is None:
+        E = model(p, x, y)
+    c, s, u, v = _frame(p, x, y)
+    qu = 2*u*(1/p[4]**2 + 1j*p[7])
+    qv = 2*v*(1/p[5]**2 + 1j*p[8])
+    d = np.empty((len(x), len(params)), dtype=complex)
+    d[:, 0] = 1
+    d[:, 1] = 1j
+    d[:, 2] = qu*c - qv*s
+    d[:, 3] = qu*s + qv*c
+    d[:, 4] = 2*u**2/p[4]**3
+    d[:, 5] = 2*v**2/p[5]**3
+    d[:, 6] = -qu*v + qv*u
+    d[:, 7] = -1j*u**2
+    d[:, 8] = -1j*v**2
+    d[:, 9] = -1j*x
+    d[:, 10] = -1j*y
+    return d*E[:, None]
+
+
+def initialGuess(x, y, trans):
+    """Estimate the beam parameters from the moments of the power and, if x,
+    y and trans are 2-D grids, the mean phase gradient"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    trans = np.asarray(trans, dtype=complex)
+    power = np.abs(trans)**2
+    total = power.sum()
+    x0 = (power*x).sum()/total
+    y0 = (power*y).sum()/total
+    # |E|**2 ~ exp(-2 r**2/w**2) has a variance of w**2/4
+    wx = 2*np.sqrt((power*(x - x0)**2).sum()/total)
+    wy = 2*np.sqrt((power*(y - y0)**2).sum()/total)
+
+    # Phase gradients between neighbouring points, so the phase needn't be unwrapped
+    tilt = [0.0, 0.0]
+    if trans.ndim == 2:
+        pairs = ((x[:, 1:] - x[:, :-1], trans[:, :-1], trans[:, 1:]),
+                 (y[1:, :] - y[:-1, :], trans[:-1, :], trans[1:, :]))
+        for i, (dpos, a, b) in enumerate(pairs):
+            w = np.where(dpos != 0, np.abs(a*b), 0)
+            slope = -np.angle(b*np.conj(a))/np.where(dpos != 0, dpos, 1)
+            if w.sum() > 0:
+                tilt[i] = (w*slope).sum()/w.sum()
+
+    peak = np.unravel_index(np.argmax(power), power.shape)
+    p = np.array([np.log(np.abs(trans[peak])), 0.0, x0, y0, wx, wy, 0.0, 0.0, 0.0, tilt[0], tilt[1]])
+    p[1] = np.angle(trans[peak]/model(p, x[peak], y[peak]))
+    return p
+
+
+class BeamFit(object):
+    """Result of fitting the beam model to a map.
+
+    wx is the larger of the two radii, and angle is in (-pi/2, pi/2].
+    values and errors are dicts of the fitted parameters and their standard
+    deviations, residualRms the rms of the complex residual, and
+    relativeResidual that relative to the peak amplitude"""
+    def __init__(self, result, x, y, trans):
+        self.p = result.x
+        self.success = result.success
+        self.message = result.message
+        self.nfev = result.nfev
+        n, m = len(self.p), 2*trans.size
+        self.residualRms = np.sqrt(2*result.cost/trans.size)
+        self.relativeResidual = self.residualRms/np.abs(trans).max()
+
+        # Covariance from the Jacobian at the solution, scaled by the residual variance
+        dof = max(m - n, 1)
+        s2 = 2*result.cost/dof
+        self.covariance = s2*np.linalg.pinv(result.jac.T.dot(result.jac))
+
+        # The same beam is described with u and v swapped, so make wx the larger radius
+        if self.p[4] < self.p[5]:
+            swap = np.array([0, 1, 2, 3, 5, 4, 6, 8, 7, 9, 10])
+            self.p = self.p[swap]
+            self.p[6] += np.pi/2
+            self.covariance = self.covariance[np.ix_(swap, swap)]
+        self.p[4:6] = np.abs(self.p[4:6])
+        self.p[6] = (self.p[6] + np.pi/2) % np.pi - np.pi/2
+        self.p[1] = np.angle(np.exp(1j*self.p[1]))
+        self.values = dict(zip(params, self.p))
+        self.errors = dict(zip(params, np.sqrt(np.abs(np.diag(self.covariance)))))
+
+    def __call__(self, x, y):
+        """Return the fitted field at x, y"""
+        return model(self.p, np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+    def radius(self, freq):
+        """Return the radii of curvature in mm along u and v at frequency freq
+        in Hz (inf for a flat phase front)"""
+        k = 2*np.pi*freq/299792458e3
+        with np.errstate(divide="ignore"):
+            return k/(2*self.values["cx"]), k/(2*self.values["cy"])
+
+    def report(self, file=None):
+        """Print the fitted parameters, their uncertainties and the fit quality"""
+        if file is None:
+            file = sys.stdout
+        print("\nBeam fit: {}, {:d} evaluations".format("converged" if self.success else self.message, self.nfev),
+              file=file)
+        for name in params:
+            print("    {:6s} {:14.6g} +/- {:.3g}".format(name, self.values[name], self.errors[name]), file=file)
+        print("    Residual rms {:.4g} ({:.3%} of peak)".format(self.residualRms, self.relativeResidual), file=file)
+
+
+def fit(x, y, trans, p0=None, weights=None, **kwargs):
+    """Fit the beam model to trans measured at x, y (arrays of the same
+    shape, in mm) and return a BeamFit.
+
+    p0 is the starting point (default: initialGuess), weights optional
+    weights of each point.  Other keyword arguments are passed to
+    scipy.optimize.least_squares"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    trans = np.asarray(trans, dtype=complex)
+    if p0 is None:
+        p0 = initialGuess(x, y, trans)
+    x, y, data = x.ravel(), y.ravel(), trans.ravel()
+    w = np.ones(len(data)) if weights is None else np.asarray(weights, dtype=float).ravel()
+
+    def residuals(p):
+        r = w*(model(p, x, y) - data)
+        return np.concatenate((r.real, r.imag))
+
+    def jac(p):
+        d = w[:, None]*jacobian(p, x, y)
+        return np.vstack((d.real, d.imag))
+
+    kwargs.setdefault("x_scale", "jac")
+    result = least_squares(residuals, p0, jac=jac, **kwargs)
+    return BeamFit(result, x, y, trans)
+
+
+def _fitOne(args):
+    x, y, trans, kwargs = args
+    return fit(x, y, trans, **kwargs)
+
+
+def fitMany(maps, x, y, processes=None, **kwargs):
+    """Fit each of maps (an array of shape (n, ...) or a sequence of maps),
+    measured at x, y, and return a list of BeamFits.
+
+    x and y are arrays the shape of one map, or sequences of them, one per
+    map.  The fits are done in a pool of <processes> processes (default: one
+    per CPU), or in this process if processes is 1.  Other keyword arguments
+    are passed to fit()"""
+    n = len(maps)
+    if np.ndim(x) == np.ndim(maps[0]):
+        x = [x]*n
+    if np.ndim(y) == np.ndim(maps[0]):
+        y = [y]*n
+    args = [(x[i], y[i], maps[i], kwargs) for i in range(n)]
+    if processes == 1 or n == 1:
+        return [_fitOne(a) for a in args]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_fitOne, args))
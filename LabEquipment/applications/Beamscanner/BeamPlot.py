@@ -0,0 +1,202 @@
+#############################################################
+# Plotting of Beamscanner data                              #
+#                                                           #
+# Contour plots on the native scan grid, and live plots     #
+# updated in place during a scan.                           #
+#############################################################
+"""Plot Beamscanner scans.
+
+Raster scans are measured on a regular grid in serpentine order, so rather
+than interpolating them onto a fine mesh, regularGrid() detects the grid and
+puts the rows back in order, and they are plotted directly with contourf.
+Irregular scans (e.g. from PathPlanner) are contoured on a Delaunay
+triangulation of the points, which is cached so that plotting the amplitude
+and phase of the same scan triangulates it only once.
+
+LivePlot shows a scan as it is measured, updating the colours of a
+pcolormesh (or scatter plot, for irregular scans) in place and redrawing
+only the axes with blitting.
+
+    BeamPlot.contourPlot(x, y, dB, title="Amplitude vs. Position", filename="scan_dB.png")
+
+    live = BeamPlot.LivePlot(x, y, title="Amplitude (dB)")
+    live.update(dB)
+"""
+
+from __future__ import print_function, division
+
+import collections
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.tri as mtri
+
+
+def regularGrid(x, y, tolerance=0.25):
+    """If the points x, y (2-D arrays, one row per scan line) lie on a
+    regular grid, return the 1-D grid positions xs and ys and the order of
+    the points in each row that puts them in ascending X, otherwise return
+    None.
+
+    Positions may differ from the grid by up to tolerance times the grid
+    spacing, as when they are read back from the stages"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.ndim != 2 or x.shape != y.shape or min(x.shape) < 2:
+        return None
+    order = np.argsort(x, axis=1)
+    xSorted = np.take_along_axis(x, order, axis=1)
+    xs = xSorted.mean(axis=0)
+    ys = y.mean(axis=1)
+    dx = np.abs(np.diff(xs)).min()
+    dy = np.abs(np.diff(ys)).min()
+    if dx == 0 or dy == 0:
+        return None
+    if np.abs(xSorted - xs).max() > tolerance*dx or np.abs(y - ys[:, None]).max() > tolerance*dy:
+        return None
+    return xs, ys, order
+
+
+def _edges(centers):
+    """Return the cell edges of the grid points centers"""
+    mid = 0.5*(centers[1:] + centers[:-1])
+    return np.concatenate(([2*centers[0] - mid[0]], mid, [2*centers[-1] - mid[-1]]))
+
+
+# Triangulations of recently plotted irregular scans, by point positions
+_triangulations = collections.OrderedDict()
+_maxTriangulations = 8
+
+
+def triangulation(x, y):
+    """Return the (cached) Delaunay triangulation of the points x, y"""
+    x = np.ascontiguousarray(x, dtype=float).ravel()
+    y = np.ascontiguousarray(y, dtype=float).ravel()
+    key = (x.tobytes(), y.tobytes())
+    tri = _triangulations.get(key)
+    if tri is None:
+        tri = mtri.Triangulation(x, y)
+        _triangulations[key] = tri
+        if len(_triangulations) > _maxTriangulations:
+            _triangulations.popitem(last=False)
+    else:
+        _triangulations.move_to_end(key)
+    return tri
+
+
+def contourPlot(x, y, values, title=None, filename=None, xlabel="X Position (mm)", ylabel="Y Position (mm)",
+                fig=None):
+    """Draw a filled contour plot of values measured at x, y with labelled
+    contour lines, in fig (default: the figure "Contours", so as not to
+    disturb a LivePlot), and save it to filename if given.  Returns the axes"""
+    if fig is None:
+        fig = plt.figure("Contours")
+    fig.clf()
+    ax = fig.add_subplot(1, 1, 1)
+    matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
+
+    values = np.asarray(values, dtype=float)
+    grid = regularGrid(x, y)
+    finite = np.isfinite(values)
+    if grid is not None:
+        xs, ys, order = grid
+        z = np.ma.masked_invalid(np.take_along_axis(values, order, axis=1))
+        ax.contourf(xs, ys, z)
+        CL = ax.contour(xs, ys, z, colors='k')
+    else:
+        tri = triangulation(x, y)
+        if not finite.all():
+            tri = mtri.Triangulation(tri.x, tri.y, tri.triangles, mask=~finite.ravel()[tri.triangles].all(axis=1))
+        z = np.where(finite, values, np.nanmin(values)).ravel()
+        ax.tricontourf(tri, z)
+        CL = ax.tricontour(tri, z, colors='k')
+    ax.clabel(CL, colors='k')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_xlim(np.min(x), np.max(x))
+    ax.set_ylim(np.min(y), np.max(y))
+    if title:
+        ax.set_title(title)
+    fig.canvas.draw_idle()
+    plt.pause(0.001)
+    if filename:
+        fig.savefig(filename)
+    return ax
+
+
+class LivePlot(object):
+    """Colour map of a scan that is updated in place as data comes in.
+
+    x and y are the positions of the scan points (in the shape the values
+    will be given in).  Regular grids are drawn with pcolormesh, other scans
+    as a scatter plot.  Points not yet measured are given as NaN.  The
+    colour scale grows to fit the data; while it doesn't change, updates
+    redraw only the plot with blitting, if the backend supports it."""
+    def __init__(self, x, y, title=None, label=None, cmap=None, fig=None, xlabel="X Position (mm)",
+                 ylabel="Y Position (mm)"):
+        if fig is None:
+            fig = plt.figure()
+        self.fig = fig
+        self.ax = fig.add_subplot(1, 1, 1)
+        self.grid = regularGrid(x, y)
+        self.shape = np.shape(x)
+        if self.grid is not None:
+            xs, ys, self.order = self.grid
+            blank = np.ma.masked_all((len(ys), len(xs)))
+            self.artist = self.ax.pcolormesh(_edges(xs), _edges(ys), blank, cmap=cmap)
+        else:
+            self.order = None
+            self.artist = self.ax.scatter(np.ravel(x), np.ravel(y), c=np.zeros(np.size(x)), cmap=cmap,
+                                          plotnonfinite=False)
+            self.artist.set_array(np.ma.masked_all(np.size(x)))
+        # Without blitting the plot is drawn in full on each update
+        self.blit = getattr(fig.canvas, "supports_blit", False)
+        self.artist.set_animated(self.blit)
+        self.colorbar = fig.colorbar(self.artist, ax=self.ax, label=label)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        if title:
+            self.ax.set_title(title)
+        self.clim = None
+        self.background = None
+        self._redraw()
+
+    def _redraw(self):
+        """Draw the whole figure, and keep the background for blitting"""
+        canvas = self.fig.canvas
+        canvas.draw()
+        if self.blit:
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+            self.ax.draw_artist(self.artist)
+            canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+
+    def update(self, values):
+        """Show values, an array in the shape of x and y with NaN for points
+        not yet measured"""
+        values = np.asarray(values, dtype=float).reshape(self.shape)
+        if self.order is not None:
+            values = np.take_along_axis(values, self.order, axis=1)
+        data = np.ma.masked_invalid(values if self.order is not None else values.ravel())
+        self.artist.set_array(data)
+        if data.count() == 0:
+            return
+
+        lo, hi = data.min(), data.max()
+        if self.clim is None or lo < self.clim[0] or hi > self.clim[1]:
+            # The colour bar changes, so the whole figure is redrawn
+            self.clim = (lo, hi if hi > lo else lo + 1)
+            self.artist.set_clim(*self.clim)
+            self._redraw()
+        elif self.blit:
+            canvas = self.fig.canvas
+            canvas.restore_region(self.background)
+            self.ax.draw_artist(self.artist)
+            canvas.blit(self.ax.bbox)
+            canvas.flush_events()
+        else:
+            self._redraw()
+
+    def close(self):
+        plt.close(self.fig)
@@ -5,6 +5,7 @@
 #############################################################
 
 import pyvisa
+import copy
 import os
 import time
 import sys
@@ -12,13 +13,23 @@ import sys
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
 import numpy.polynomial.polynomial as poly
 
 import LabEquipment.drivers.Instrument.HP8508A as HP8508A
 import LabEquipment.drivers.Instrument.HP83630A as HP83630A
 import LabEquipment.drivers.Instrument.HMCT2240 as HMCT2240
 import LabEquipment.drivers.Instrument.MSL as MSL
+from LabEquipment.drivers.Instrument import ResourceRegistry
+from LabEquipment.drivers.Instrument import RetryPolicy
+from LabEquipment.applications.Beamscanner import PathPlanner
+from LabEquipment.applications.Beamscanner import CenterFinder
+from LabEquipment.applications.Beamscanner import Calibration
+from LabEquipment.applications.Beamscanner import NearFarField
+from LabEquipment.applications.Beamscanner import BeamFit
+from LabEquipment.applications.Beamscanner import BeamPlot
+from LabEquipment.applications.Beamscanner import ScanStore
+from LabEquipment.lib import instrumentation
+from LabEquipment.lib import ioTrace
 
 plt.ion()
 plt.show()
@@ -29,6 +40,8 @@ class Beamscanner:
 
         # Instruments
         self.vvm = None
+        # Retry policy for VVM readings, set on the VVM by initVVM
+        self.retryPolicy = RetryPolicy.RetryPolicy(attempts=3)
         self.msl_x = None
         self.msl_y = None
         self.RF = None
@@ -36,11 +49,28 @@ class Beamscanner:
         self.centerBeforeScan = True
         self.verbose = False
         self.plotCenter = True
+        # Show the amplitude live during scans
+        self.plotLive = False
+        self.livePlot = None
+        # "model" to find the center by fitting a few samples, "raster" for repeated raster scans
+        self.centerMethod = "model"
         self.scan_type = "raster"
+        self.trace = None
+
+        # Schedules the drift calibration measurements at the center during scans
+        self.calScheduler = Calibration.CalScheduler()
+        self.transRaw = None
+        # On-disk store the scan is written to point by point, set up by initStore
+        self.store = None
+
+        # Clock used to timestamp readings
+        self.clock = time.time
+        # Sample rate in Hz for on-the-fly scans, or None to measure it
+        self.otfRate = None
 
     def initTime(self):
         # Assigns start time
-        self.start_time = time.time()
+        self.start_time = self.clock()
         print("Starting...\n")
 
     def readUSE(self, useFile=None):
@@ -156,7 +186,23 @@ class Beamscanner:
             Ref IF Frequency    : {:8.4f} MHz
         """.format(self.Testfreq/1e9, self.RFharm, self.RFfreq/1e9, self.IFfreq/1e6, self.multLOfreq/1e9, self.LOharm, self.LOfreq/1e9, self.RFfinalHarm, self.reffreq/1e9, self.multLOfreq/self.RFfinalHarm/1e9, self.IFfreq/self.RFfinalHarm/1e6))
 
-    def initGPIB(self, backend="@py"):
+    def calcFreqPairs(self, testFreqs):
+        """Return an array of the (RF, LO) frequencies for each of the test
+        frequencies in testFreqs, calculated by calcFreqs with the current harmonics
+        and IF frequency"""
+        Testfreq = self.Testfreq
+        pairs = []
+        try:
+            for f in testFreqs:
+                self.Testfreq = f
+                self.calcFreqs()
+                pairs.append((self.RFfreq, self.LOfreq))
+        finally:
+            self.Testfreq = Testfreq
+            self.calcFreqs()
+        return np.array(pairs)
+
+    def initGPIB(self, backend="@py", record=None, replay=None, replaySpeed=None):
         """Initialize PyVisa and check it's working.
 
         "no langid" errors are likely a permissions issue - make sure the current user
@@ -166,18 +212,40 @@ class Beamscanner:
 
         see http://askubuntu.com/questions/705409/udev-rule-to-run-gpib-config and
         https://github.com/pyvisa/pyvisa/issues/212
+
+        If record is a filename, all I/O through the returned resource manager is
+        recorded to that file.  If replay is a filename, the returned resource
+        manager serves the recorded I/O from that file instead of the hardware,
+        at replaySpeed times the recorded speed (None for no delays).
+
+        The returned resource manager shares its ResourceManager, cached
+        resource list and open resources with the rest of the process (see
+        ResourceRegistry).  The "@sim" backend serves simulated instruments at
+        the standard lab addresses (see LabEquipment.drivers.Simulator).
         """
+        if replay:
+            self.trace = ioTrace.TraceReplay(replay, speed=replaySpeed)
+            print("Replaying instrument I/O from {}".format(replay))
+            return self.trace.resourceManager()
+
         # Lists available resources
-        rm = pyvisa.ResourceManager(backend)
+        rm = ResourceRegistry.manager(backend)
         try:
             lr = rm.list_resources()
         except ValueError:
+            lr = ()
             print("pyvisa list_resources failed - likely you have a permissions issue.  See Beamscanner.py Beamscanner.initGPIB() source for solutions")
         print("GPIB devices configured. \nAvailable Resources: "+str(lr))
+        if record:
+            self.trace = ioTrace.TraceRecorder(record)
+            print("Recording instrument I/O to {}".format(record))
+            rm = self.trace.resourceManager(rm)
         return rm
 
     def initVVM(self, format = "LOG,POLAR"):
         # Initializes voltmeter parameters
+        self.retryPolicy.verbose = self.verbose
+        self.vvm.retryPolicy = self.retryPolicy
         self.vvm.setTransmission()
         self.vvm.setFormat(self.Format)
         self.vvm.setAveraging(self.Average)
@@ -247,10 +315,10 @@ class Beamscanner:
         self.pos_x_center = self.xVals[index]
         self.pos_y_center = self.yVals[index]
 
-    def findCenterMM(self, minRes=None, , phaseAfter=None):
-        """Runs a scan over the searchArea & finds maximum amplitude peak.
+    def findCenterMM(self, minRes=None, phaseAfter=None):
+        """Finds the beam center in the search area with findCenter.
 
-        Decreases range and resolution with each iteration until minRes in mm is reached"""
+        minRes defaults to the search minimum resolution from the USE file"""
         if minRes:
             pass
         else:
@@ -259,19 +327,69 @@ class Beamscanner:
         self.findCenter(minRes=minRes, phaseAfter=phaseAfter)
 
 
-    def findCenter(self, minRes=500, phaseAfter=3):
-        """Runs scan over area & finds maximum amplitude peak.
-        Begins at arbitrary position and decreases range and resolution with each iteration.
+    def findCenter(self, minRes=500, phaseAfter=3, method=None):
+        """Finds the beam center to within minRes steps, starting at searchCenter.
 
-        Takes a minimum resolution to search with in steps."""
+        method is "model" (default: self.centerMethod) to fit the amplitude and
+        phase of a few samples with CenterFinder, or "raster" to run repeated raster
+        scans over the search area, decreasing range and resolution with each
+        iteration.  The raster search centers on the minimum phase from iteration
+        phaseAfter on, and the model search uses the phase center unless phaseAfter
+        is 0."""
+        if method is None:
+            method = self.centerMethod
+        if phaseAfter is None:
+            phaseAfter = 3
 
         print("\nFinding center...")
 
-        res = self.searchRes
-        Range = self.searchRange
         self.pos_x_center = self.searchCenter[0]
         self.pos_y_center = self.searchCenter[1]
-        
+
+        if method == "model":
+            self.findCenterModel(minRes, usePhase=phaseAfter > 0)
+        elif method == "raster":
+            self.findCenterRaster(minRes, phaseAfter)
+        else:
+            raise ValueError("Beamscanner.findCenter: unknown method {}".format(method))
+
+        print("Found center at X {:.3f}, Y {:.3f}\n".format(self.pos_x_center/self.conv_factor, self.pos_y_center/self.conv_factor))
+        self.setStep(self.Res)
+        self.setRange(self.Range)
+
+    def measureAt(self, x, y):
+        """Move to x, y in steps and return the transmission there"""
+        self.msl_x.moveAbs(int(x))
+        self.msl_y.moveAbs(int(y))
+        self.msl_x.hold()
+        self.msl_y.hold()
+        trans = self.getTransmission()
+        if self.verbose:
+            print("    X: {:.3f}, Y: {:.3f}, {:f} dB, {:f} deg".format(x/self.conv_factor, y/self.conv_factor, 20*np.log10(np.abs(trans)), np.degrees(np.angle(trans))))
+        return trans
+
+    def findCenterModel(self, minRes, usePhase=True):
+        """Find the center from quadratic fits to the amplitude in dB and the phase
+        of samples taken around the current estimate.  The samples are left in
+        self.centerSamples"""
+        print("  Search center : {:.3f}, Y {:.3f}".format(self.pos_x_center/self.conv_factor, self.pos_y_center/self.conv_factor))
+        print("  Search range  : {:.2f}".format(self.searchRange/self.conv_factor))
+        print("  Min res       : {:.3f}".format(minRes/self.conv_factor))
+        finder = CenterFinder.CenterFinder(self.measureAt, self.searchRange, minRes, velocity=self.velocity,
+                                           accel=self.accel, verbose=self.verbose)
+        self.pos_x_center, self.pos_y_center = finder.find(self.pos_x_center, self.pos_y_center, usePhase=usePhase)
+        self.centerSamples = finder.samples
+        fit = finder.phaseFit if usePhase and finder.phaseFit is not None else finder.ampFit
+        if fit is not None:
+            print("  Center uncertainty X {:.3f}, Y {:.3f} from {:d} points".format(fit.sigma[0]/self.conv_factor, fit.sigma[1]/self.conv_factor, len(finder.x)))
+
+    def findCenterRaster(self, minRes, phaseAfter=3):
+        """Runs scan over area & finds maximum amplitude peak.
+        Begins at arbitrary position and decreases range and resolution with each iteration.
+
+        Takes a minimum resolution to search with in steps."""
+        res = self.searchRes
+        Range = self.searchRange
 
         search_iteration = 0
 
@@ -303,10 +421,6 @@ class Beamscanner:
                 self.contour_plot_dB(name_elem="_{:d}".format(search_iteration))
                 self.contour_plot_deg(name_elem="_{:d}".format(search_iteration))
 
-        print("Found center at X {:.3f}, Y {:.3f}\n".format(self.pos_x_center/self.conv_factor, self.pos_y_center/self.conv_factor))
-        self.setStep(self.Res)
-        self.setRange(self.Range)
-
     def moveToCenter(self):
         if self._debug:
             print(" DEBUG: in moveToCenter()")
@@ -355,58 +469,61 @@ class Beamscanner:
 
 
     def getTransmission(self):
-        """Get the transmission from the VVM.  Loop if necessary to avoid
-        one-off time out errors"""
-        retry = 0
-        while True:
-            try:
-                trans = self.vvm.getTransmission()
-                break
-            except pyvisa.VisaIOError:
-                print("Visa Timeout Error, retrying twice")
-                if retry < 2:
-                    retry +=1
-                    pass
-                else:
-                    # Re-raise the exception
-                    raise
-                    break
-            except ValueError:
-                pass
-        return trans
-        
+        """Get the transmission from the VVM, retrying failed readings with
+        adaptive timeouts (see RetryPolicy)"""
+        return self.vvm.retry("getTransmission", self.vvm.getTransmission)
+
     def getPowers(self):
-        """Get the A and B powers from the VVM.  Loop if necessary to avoid
-        one-off time out errors"""
-        retry = 0
-        while True:
-            try:
-                apow = float(self.vvm.getData(meas="APOW"))
-                bpow = float(self.vvm.getData(meas="BPOW"))
-                break
-            except pyvisa.VisaIOError:
-                print("Visa Timeout Error, retrying twice")
-                if retry < 2:
-                    retry +=1
-                    pass
-                else:
-                    # Re-raise the exception
-                    raise
-                    break
-            except ValueError:
-                pass
-        return apow, bpow
+        """Get the A and B powers from the VVM, retrying failed readings with
+        adaptive timeouts (see RetryPolicy)"""
+        return self.vvm.retry("getPowers", self.vvm.getPowers)
+
+
+    def initPathScan(self, points, optimize=True):
+        """Set up a scan of an arbitrary set of <points> (an (n, 2) array of
+        X, Y positions in MSL steps), e.g. from PathPlanner.aperturePoints.
+
+        If optimize is True, the points are reordered by PathPlanner to
+        minimize the time spent moving, starting from the current position.
+        Returns the estimated time in seconds spent moving"""
+        points = np.asarray(points, dtype=float)
+        start = (self.msl_x.getPos(), self.msl_y.getPos())
+        if optimize:
+            points = points[PathPlanner.planPath(points, self.velocity, self.accel, start=start)]
+
+        self.xVals = points[:, 0].copy()
+        self.yVals = points[:, 1].copy()
+        self.pos_x_min, self.pos_x_max = self.xVals.min(), self.xVals.max()
+        self.pos_y_min, self.pos_y_max = self.yVals.min(), self.yVals.max()
+        self.scan_type = "path"
+
+        self.time = np.zeros_like(self.xVals, dtype=float)
+        self.trans = np.zeros_like(self.xVals, dtype=complex)
+        self.calVals = np.zeros_like(self.trans, dtype=complex)
+
+        # Moves to the first point to begin scan
+        self.msl_x.moveAbs(int(self.xVals[0]))
+        self.msl_y.moveAbs(int(self.yVals[0]))
+        self.msl_x.hold()
+        self.msl_y.hold()
 
+        return PathPlanner.pathTime(points, self.velocity, self.accel)
 
     def scan(self, calibrate=True):
         """Scan over the meshgrids of the stored xVals and yVals, and record data
         in trans.
 
         initScan will set up the xVals and yVals array as a regular raster scan grid.
-        however, this methods will work with any scan pattern defined in those variables.
+        however, this methods will work with any scan pattern defined in those variables,
+        e.g. as set up by initPathScan.
 
-        If calibrate is True, the transmission at pos_x_center, pos_y_center will be
-        recorded every self.calInterval points and stored in self.calVals"""
+        If calibrate is True and CalInterval is positive, the transmission at
+        pos_x_center, pos_y_center is measured as a drift reference when
+        self.calScheduler asks for it, and trans is corrected for drift at the end of
+        the scan (see correctDrift)
+
+        If timing instrumentation is enabled, a summary of the time spent on each
+        instrument is printed at the end of the scan"""
         if self._debug:
             print(" DEBUG: in scan(calibrate={})".format(calibrate))
         self.initTime()
@@ -414,20 +531,20 @@ class Beamscanner:
         if self.CalInterval <= 0:
             calibrate = False
 
-        lastCalValue = complex(0.,0.)
-
-        if calibrate:
-            self.moveToCenter()
-            lastCalValue = self.getTransmission()
+        self.calScheduler.reset()
+        done = self.resumeFromStore([self.calScheduler])
+        position = (self.msl_x.getPos(), self.msl_y.getPos())
+        if self.plotLive:
+            self.startLivePlot()
 
         for i, x in enumerate(self.xVals.ravel()):
             k = i
+            if done[k]:
+                continue
             y = self.yVals.ravel()[k]
 
-            if calibrate:
-                if abs(x-self.pos_x_center) < self.Step:
-                    self.moveToCenter()
-                    lastCalValue = self.getTransmission()
+            if calibrate and self.calScheduler.due(self.clock() - self.start_time, self.calDetour(position, (x, y))):
+                self.calibrate()
 
             if self.verbose:
                 print("Moving to: X: {:.1f}, Y:{:.1f}".format(x, y))
@@ -441,92 +558,468 @@ class Beamscanner:
             self.xVals.ravel()[k] = self.msl_x.getPos()
             self.yVals.ravel()[k] = self.msl_y.getPos()
             self.trans.ravel()[k] = self.getTransmission()
-            self.calVals.ravel()[k] = lastCalValue
-            self.time.ravel()[k] = time.time() - self.start_time
+            self.time.ravel()[k] = self.clock() - self.start_time
+            position = (x, y)
+            self.storePoints(k)
+            if self.plotLive:
+                self.updateLivePlot(k + 1)
             if self.verbose or (i % 10) == 0:
                 print("    k: {:d}  X: {:.3f}, Y: {:.3f}, {:f} dB, {:f} deg".format(k, self.xVals.ravel()[k]/self.conv_factor, self.yVals.ravel()[k]/self.conv_factor, 20*np.log10(np.abs(self.trans.ravel()[k])), np.degrees(np.angle(self.trans.ravel()[k]))))
 
-    def endSG(self):
-        # Turns off signal generator output
-        self.RF.off()
-        self.LO.off()
+        if calibrate:
+            # Close the last interval so the correction is interpolated to the end
+            self.calibrate()
+        self.correctDrift()
 
-    def spreadsheet(self):
-        print("Writing data to spreadsheet...")
+        # Print the instrument timing summary if timing instrumentation is enabled
+        instrumentation.report()
+        if self.verbose:
+            self.retryPolicy.report()
+
+    def initStore(self, filename=None, resume=False, multiFreq=False, tolerance=None):
+        """Write the scan set up by initScan or initPathScan to a memory mapped
+        ScanStore in filename (default: save_name with extension .npy) as it is
+        measured.  If multiFreq is True, the scan is for scanMultiFreq at the
+        frequencies set up by initMultiFreq.
+
+        If resume is True and filename holds a scan of the same points, the
+        next scan skips the points already measured there.  The positions
+        must match to within tolerance stage steps (default: half a step),
+        as the measured positions are stored for the points done.  Raises
+        ValueError if filename holds a different scan"""
+        if filename is None:
+            filename = os.path.splitext(self.save_name)[0] + ".npy"
+        if tolerance is None:
+            tolerance = self.Step/2
+        freqs = self.testFreqs if multiFreq else None
+        if resume and os.path.exists(filename):
+            store = ScanStore.load(filename)
+            if store.shape != self.xVals.shape or store.freqs != (None if freqs is None else list(freqs)):
+                raise ValueError("Beamscanner.initStore: {} holds a different scan".format(filename))
+            offset = max(np.abs(store.data["x"] - self.xVals.ravel()).max(),
+                         np.abs(store.data["y"] - self.yVals.ravel()).max())
+            if offset > tolerance:
+                raise ValueError("Beamscanner.initStore: {} holds a scan of points up to {:g} steps away from "
+                                 "these (e.g. the center has moved)".format(filename, offset))
+            print("Resuming scan in {}: {:d} of {:d} points to go".format(filename, len(store.remaining()), self.xVals.size))
+        else:
+            store = ScanStore.create(filename, self.xVals, self.yVals, freqs=freqs, conv_factor=self.conv_factor,
+                                     scan_type=self.scan_type)
+        self.store = store
+
+    def resumeFromStore(self, schedulers):
+        """Load the points already measured in the store into xVals, yVals, time
+        and trans (or transCube), and the drift references into schedulers, and set
+        the start time so that the scan time carries on from them.  Returns the
+        mask of the points already measured, in scan order"""
+        if self.store is None:
+            return np.zeros(self.xVals.size, dtype=bool)
+        data = self.store.data
+        done = np.array(data["done"])
+        if done.any():
+            self.xVals.ravel()[done] = data["x"][done]
+            self.yVals.ravel()[done] = data["y"][done]
+            self.time.ravel()[done] = data["time"][done]
+            if self.store.freqs is not None:
+                self.transCube.reshape(len(self.freqPairs), -1)[:, done] = data["raw"][done].T
+            else:
+                self.trans.ravel()[done] = data["raw"][done]
+            self.start_time -= max(self.time.ravel()[done].max(), max(self.store.refTimes, default=0))
+            # The reading triggered by initScan is at the start of the scan, not the first point to go
+            self.vvm.triggered = False
+        for t, ref in zip(self.store.refTimes, self.store.refs):
+            for j, cal in enumerate(schedulers):
+                cal.add(t, ref[j] if np.ndim(ref) else ref)
+        return done
+
+    def storePoints(self, start, stop=None):
+        """Write points start to stop (default: just start) of the scan to the
+        store, if there is one"""
+        if self.store is None:
+            return
+        if stop is None:
+            stop = start + 1
+        if self.store.freqs is not None:
+            trans = self.transCube.reshape(len(self.freqPairs), -1)[:, start:stop].T
+            cal = [c.refs[-1] if c.refs else 0j for c in self.calSchedulers]
+        else:
+            trans = self.trans.ravel()[start:stop]
+            cal = self.calScheduler.refs[-1] if self.calScheduler.refs else 0j
+        self.store.recordRows(start, stop, self.xVals.ravel()[start:stop], self.yVals.ravel()[start:stop], trans,
+                              self.time.ravel()[start:stop], cal)
+        if stop//100 > start//100:
+            self.store.flush()
+
+    def calibrate(self):
+        """Measure the transmission at the center as a drift reference, and
+        return it"""
+        self.moveToCenter()
+        if self.vvm.triggered:
+            # Don't use a reading triggered before the move
+            self.vvm.trigger()
+        trans = self.getTransmission()
+        t = self.clock() - self.start_time
+        self.calScheduler.add(t, trans)
+        if self.store is not None:
+            self.store.addReference(t, trans)
+        if self.verbose:
+            print("    Calibration at {:.1f} s: {:f} dB, {:f} deg, next in {:.1f} s".format(t, 20*np.log10(np.abs(trans)), np.degrees(np.angle(trans)), self.calScheduler.interval))
+        return trans
+
+    def calDetour(self, position, target):
+        """Return the extra time in seconds taken to go from position to target
+        by way of the center"""
+        center = (self.pos_x_center, self.pos_y_center)
+        return (PathPlanner.moveTimes(position, center, self.velocity, self.accel)
+                + PathPlanner.moveTimes(center, target, self.velocity, self.accel)
+                - PathPlanner.moveTimes(position, target, self.velocity, self.accel))
+
+    def correctDrift(self):
+        """Correct trans for drift by dividing by the reference measurements
+        interpolated to the time of each reading, keeping the uncorrected data in
+        transRaw.  calVals is set to the interpolated reference"""
+        self.transRaw = self.trans.copy()
+        if self.calScheduler.times:
+            self.calVals = self.calScheduler.interpolate(self.time)
+            self.trans = self.calScheduler.correct(self.transRaw, self.time)
+        else:
+            self.calVals = np.zeros_like(self.trans, dtype=complex)
+        if self.store is not None:
+            self.store.setCorrected(self.trans, self.calVals)
+            self.store.flush()
+
+    def startLivePlot(self):
+        """Open a live plot of the amplitude of the scan set up in xVals, yVals"""
+        if self.livePlot is not None:
+            self.livePlot.close()
+        self.livePlot = BeamPlot.LivePlot(self.xVals/self.conv_factor, self.yVals/self.conv_factor,
+                                          title="Amplitude vs. Position", label="Amplitude (dB)")
+
+    def updateLivePlot(self, n):
+        """Show the first n points of the scan (in scan order) on the live plot"""
+        dB = np.full(self.trans.size, np.nan)
+        with np.errstate(divide="ignore"):
+            dB[:n] = 20*np.log10(np.abs(self.trans.ravel()[:n]))
+        self.livePlot.update(dB.reshape(self.trans.shape))
+
+    def initMultiFreq(self, testFreqs, useList=True):
+        """Set up the signal generators to step through the test frequencies
+        testFreqs (in Hz) at each point of scanMultiFreq.
+
+        If useList is True and both generators support list sweeps, the (RF, LO)
+        frequency lists are uploaded once and each frequency hop is a bus trigger,
+        otherwise each hop sets the CW frequencies"""
+        self.testFreqs = np.asarray(testFreqs, dtype=float)
+        self.freqPairs = self.calcFreqPairs(self.testFreqs)
+        self.freqList = False
+        if useList and all(hasattr(sg, "setFreqList") for sg in (self.RF, self.LO)):
+            try:
+                self.RF.setFreqList(self.freqPairs[:, 0])
+                self.LO.setFreqList(self.freqPairs[:, 1])
+            except ValueError as err:
+                print("Can't use list sweeps: {}".format(err))
+            else:
+                self.RF.startList(trigger="bus")
+                self.LO.startList(trigger="bus")
+                self.freqList = True
+        self.freqIndex = -1
+
+    def endMultiFreq(self):
+        """Return the signal generators to CW at the test frequency"""
+        if self.freqList:
+            self.RF.stopList()
+            self.LO.stopList()
+            self.freqList = False
+        self.RF.setFreq(self.RFfreq)
+        self.LO.setFreq(self.LOfreq)
 
-        x_data = self.xVals/self.conv_factor
-        y_data = self.yVals/self.conv_factor
-        trans_data = self.trans
-        cal_data = self.calVals
-        time_data = self.time
+    def setFreqPoint(self, j):
+        """Set the signal generators to the (RF, LO) frequencies of test frequency
+        index j.  In list mode the lists only step forward, so j must follow the
+        last index set, or be 0 to start a new pass, which re-arms the lists"""
+        if self.freqList:
+            if j == 0 and self.freqIndex >= 0:
+                self.RF.startList(trigger="bus")
+                self.LO.startList(trigger="bus")
+                self.freqIndex = -1
+            if j != self.freqIndex + 1:
+                raise ValueError("Beamscanner.setFreqPoint: list is at {:d}, can't set {:d}".format(self.freqIndex, j))
+            self.RF.triggerList()
+            self.LO.triggerList()
+            self.RF.waitSettled()
+            self.LO.waitSettled()
+        else:
+            rf, lo = self.freqPairs[j]
+            self.RF.setFreq(rf)
+            self.LO.setFreq(lo)
+        self.freqIndex = j
+        if self.vvm.triggered:
+            # Don't use a reading triggered at the last frequency
+            self.vvm.trigger()
+
+    def measureFreqs(self):
+        """Return the transmission at each of the test frequencies set up by
+        initMultiFreq"""
+        trans = np.empty(len(self.freqPairs), dtype=complex)
+        for j in range(len(self.freqPairs)):
+            self.setFreqPoint(j)
+            trans[j] = self.getTransmission()
+        return trans
 
-        if self.scan_type == "raster":
-            # reverse every other line in self.xVals
-            x_data[1::2,:] = x_data[1::2,::-1]
-            y_data[1::2,:] = y_data[1::2,::-1]
-            trans_data[1::2,:] = trans_data[1::2,::-1]
-            cal_data[1::2,:] = cal_data[1::2,::-1]
-            time_data[1::2,:] = time_data[1::2,::-1]
+    def scanMultiFreq(self, calibrate=True):
+        """Scan the points in xVals and yVals once, measuring the transmission at
+        each of the test frequencies set up by initMultiFreq at each point.
+
+        The transmissions are stored in transCube[freq, ...], with the remaining
+        axes the shape of xVals, and trans is set to the map at the first test
+        frequency.  If calibrate is True and CalInterval is positive, drift
+        references are measured at the center at all the frequencies when any of
+        the schedulers in calSchedulers asks for them, and each map is corrected
+        for drift, keeping the uncorrected cube in transCubeRaw"""
+        if self._debug:
+            print(" DEBUG: in scanMultiFreq(calibrate={})".format(calibrate))
+        self.initTime()
+        if self.CalInterval <= 0:
+            calibrate = False
 
-        outdata = np.array((x_data.ravel(), y_data.ravel(), trans_data.ravel().real, trans_data.ravel().imag, cal_data.ravel().real, cal_data.ravel().imag, time_data.ravel()), dtype='float')
+        nf = len(self.freqPairs)
+        self.transCube = np.zeros((nf,) + self.xVals.shape, dtype=complex)
+        # One scheduler per frequency, with the settings of calScheduler
+        self.calSchedulers = [copy.copy(self.calScheduler) for j in range(nf)]
+        for cal in self.calSchedulers:
+            cal.reset()
+        done = self.resumeFromStore(self.calSchedulers)
+        position = (self.msl_x.getPos(), self.msl_y.getPos())
 
-        np.savetxt(self.save_name, outdata.transpose(), delimiter=", ")
+        def calibrateAll():
+            self.moveToCenter()
+            refs = self.measureFreqs()
+            t = self.clock() - self.start_time
+            for cal, ref in zip(self.calSchedulers, refs):
+                cal.add(t, ref)
+            if self.store is not None:
+                self.store.addReference(t, refs)
+
+        for k, x in enumerate(self.xVals.ravel()):
+            if done[k]:
+                continue
+            y = self.yVals.ravel()[k]
+            if calibrate:
+                t = self.clock() - self.start_time
+                detour = self.calDetour(position, (x, y))
+                if any(cal.due(t, detour) for cal in self.calSchedulers):
+                    calibrateAll()
 
+            self.msl_x.moveAbs(x)
+            self.msl_y.moveAbs(y)
+            self.msl_x.hold()
+            self.msl_y.hold()
 
-    def contour_plot_dB(self, name_elem = None):
-        """Plot a contour plot in dB of the beam pattern"""
-        if not name_elem:
-            name_elem = ""
+            self.xVals.ravel()[k] = self.msl_x.getPos()
+            self.yVals.ravel()[k] = self.msl_y.getPos()
+            self.transCube.reshape(nf, -1)[:, k] = self.measureFreqs()
+            self.time.ravel()[k] = self.clock() - self.start_time
+            position = (x, y)
+            self.storePoints(k)
+            if self.verbose or (k % 10) == 0:
+                print("    k: {:d}  X: {:.3f}, Y: {:.3f}, {:d} frequencies".format(k, self.xVals.ravel()[k]/self.conv_factor, self.yVals.ravel()[k]/self.conv_factor, nf))
+
+        self.transCubeRaw = self.transCube.copy()
+        if calibrate:
+            calibrateAll()
+            for j, cal in enumerate(self.calSchedulers):
+                self.transCube[j] = cal.correct(self.transCubeRaw[j], self.time)
+        self.trans = self.transCube[0]
+        self.transRaw = self.transCubeRaw[0]
+        if self.store is not None:
+            if calibrate:
+                calCube = np.array([cal.interpolate(self.time) for cal in self.calSchedulers])
+            else:
+                calCube = np.zeros_like(self.transCube)
+            self.store.setCorrected(self.transCube, calCube)
+            self.store.flush()
 
-        xi = np.linspace(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor, 1000)
-        yi = np.linspace(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor, 1000)
-        xi, yi = np.meshgrid(xi, yi)
+        # Print the instrument timing summary if timing instrumentation is enabled
+        instrumentation.report()
+        if self.verbose:
+            self.retryPolicy.report()
+
+    def measureRate(self, n=5):
+        """Return the rate in Hz at which transmission readings can be taken,
+        measured from <n> readings"""
+        start = self.clock()
+        for i in range(n):
+            self.getTransmission()
+        return n/(self.clock() - start)
+
+    def scanOTF(self, calibrate=True, rate=None):
+        """Scan the raster set up by initScan on the fly, traversing each row
+        at constant velocity while taking transmission readings as fast as
+        the VVM allows, instead of stopping at each point.
+
+        The row velocity is chosen so that readings at <rate> Hz (default:
+        self.otfRate, or measured with measureRate) are no further apart than
+        the grid step.  The MSLs have no position trigger outputs, so
+        readings are timed and each is tagged with the X position
+        interpolated from timestamped position reads.  The readings of each
+        row are then resampled onto the grid points in xVals.  The raw
+        readings are kept in self.otfSamples as an array of (t, x, y, trans).
+
+        If calibrate is True and CalInterval is positive, drift references are
+        measured at the center between rows as self.calScheduler asks for them,
+        and trans is corrected for drift at the end of the scan."""
+        if self._debug:
+            print(" DEBUG: in scanOTF(calibrate={}, rate={})".format(calibrate, rate))
+        if self.CalInterval <= 0:
+            calibrate = False
 
-        pts = np.array((self.xVals.ravel(), self.yVals.ravel())).transpose()
+        if rate is None:
+            rate = self.otfRate
+        if rate is None:
+            rate = self.measureRate()
+        # The MSL takes whole steps per second, and stops at a velocity of 0
+        velocity = max(1, int(round(min(self.velocity, self.Step*rate))))
+        # Distance needed to reach the row velocity, plus a margin
+        runup = int(1.2*velocity**2/(2*self.accel)) + self.Step
 
-        zi = griddata(pts/self.conv_factor, 20*np.log10(np.abs(self.trans.ravel())), (xi, yi), method="linear")
+        self.initTime()
+        nrows, ncols = self.xVals.shape
+        self.calScheduler.reset()
+        done = self.resumeFromStore([self.calScheduler]).reshape(nrows, ncols)
+        position = (self.msl_x.getPos(), self.msl_y.getPos())
+        samples = []
+        if self.plotLive:
+            self.startLivePlot()
+
+        for row in range(nrows):
+            if done[row].all():
+                continue
+            xs = self.xVals[row]
+            direction = 1 if xs[-1] >= xs[0] else -1
+
+            start = (xs[0] - direction*runup, self.yVals[row, 0])
+            if calibrate and self.calScheduler.due(self.clock() - self.start_time, self.calDetour(position, start)):
+                self.msl_x.setVelMax(self.velocity)
+                self.calibrate()
+
+            # Move to the run up position at full speed
+            self.msl_x.setVelMax(self.velocity)
+            self.msl_x.moveAbs(int(start[0]))
+            self.msl_y.moveAbs(int(start[1]))
+            self.msl_x.hold()
+            self.msl_y.hold()
+            y = self.msl_y.getPos()
+
+            # Traverse the row at the row velocity, reading as we go
+            self.msl_x.setVelMax(velocity)
+            self.msl_x.moveAbs(int(xs[-1] + direction*runup))
+            tPos, xPos, tTrans, trans = [], [], [], []
+            while True:
+                t0 = self.clock()
+                x = self.msl_x.getPos()
+                t1 = self.clock()
+                tPos.append(0.5*(t0 + t1))
+                xPos.append(x)
+                if direction*(x - xs[-1]) > 0:
+                    break
+                tr = self.getTransmission()
+                t2 = self.clock()
+                tTrans.append(0.5*(t1 + t2))
+                trans.append(tr)
+            self.msl_x.hold()
+            position = (self.msl_x.getPos(), y)
+
+            if not trans:
+                raise RuntimeError("Beamscanner.scanOTF: no readings taken on row {:d}".format(row))
+
+            # Interpolate the positions of the readings, and resample onto the grid
+            tTrans = np.array(tTrans)
+            trans = np.array(trans, dtype=complex)
+            xTrans = np.interp(tTrans, tPos, xPos)
+            samples.append(np.rec.fromarrays((tTrans - self.start_time, xTrans, np.full(len(xTrans), y), trans),
+                                             names="t,x,y,trans"))
+
+            order = np.argsort(xTrans)
+            xSorted = xTrans[order]
+            self.trans[row] = (np.interp(xs, xSorted, trans.real[order])
+                               + 1j*np.interp(xs, xSorted, trans.imag[order]))
+            self.time[row] = np.interp(xs, xSorted, tTrans[order]) - self.start_time
+            self.yVals[row] = y
+            self.storePoints(row*ncols, (row + 1)*ncols)
+            if self.plotLive:
+                self.updateLivePlot((row + 1)*ncols)
 
-        plt.clf() 
-        CS = plt.contourf(xi, yi, zi)
-        CL = plt.contour(xi, yi, zi, colors='k')
-        plt.clabel(CL, colors='k')
-        plt.xlabel("X Position (mm)")
-        plt.ylabel("Y Position (mm)")
-        matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
-        plt.xlim(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor)
-        plt.ylim(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor)
-        plt.title("Amplitude vs. Position")
-        plt.draw()
-        plt.pause(0.001)
-        plt.savefig("{}{}{}".format(self.save_name.split(".")[0], name_elem, "_dB.png"))
+            if self.verbose:
+                print("    row {:d}: Y: {:.3f}, {:d} readings at {:.3f} mm/s".format(
+                    row, y/self.conv_factor, len(trans), velocity/self.conv_factor))
 
+        self.msl_x.setVelMax(self.velocity)
+        self.otfSamples = np.concatenate(samples) if samples else None
+        if calibrate:
+            self.calibrate()
+        self.correctDrift()
 
-    def contour_plot_deg(self, name_elem = None):
+        # Print the instrument timing summary if timing instrumentation is enabled
+        instrumentation.report()
+        if self.verbose:
+            self.retryPolicy.report()
+
+    def endSG(self):
+        # Turns off signal generator output
+        self.RF.off()
+        self.LO.off()
+
+    def spreadsheet(self):
+        print("Writing data to spreadsheet...")
+        if self.store is not None:
+            self.store.exportCSV(self.save_name)
+            return
+
+        # Raster rows are written in ascending X, without reordering the scan data
+        ScanStore.writeCSV(self.save_name, self.xVals/self.conv_factor, self.yVals/self.conv_factor, self.trans,
+                           self.calVals, self.time, serpentine=self.scan_type == "raster")
+
+
+    def farField(self, pad=2, window=None, probe=None):
+        """Return the far field of the raster scan in trans as a
+        NearFarField.FarField, at the test frequency.  See NearFarField.transform
+        for pad, window and probe"""
+        if self.scan_type != "raster":
+            raise ValueError("Beamscanner.farField: needs a raster scan, not {}".format(self.scan_type))
+        # Put every row in ascending X
+        order = np.argsort(self.xVals, axis=1)
+        x = np.take_along_axis(self.xVals, order, axis=1).mean(axis=0)/self.conv_factor
+        y = self.yVals.mean(axis=1)/self.conv_factor
+        trans = np.take_along_axis(self.trans, order, axis=1)
+        return NearFarField.transform(trans, x, y, self.Testfreq, pad=pad, window=window, probe=probe)
+
+    def fitBeam(self, **kwargs):
+        """Fit a complex Gaussian beam to the scan in trans, print the fitted
+        parameters and return the BeamFit.BeamFit.  Positions are in mm"""
+        fit = BeamFit.fit(self.xVals/self.conv_factor, self.yVals/self.conv_factor, self.trans, **kwargs)
+        fit.report()
+        Ru, Rv = fit.radius(self.Testfreq)
+        print("    Radius of curvature {:.1f} mm, {:.1f} mm".format(Ru, Rv))
+        return fit
+
+    def contour_plot_dB(self, name_elem = None):
         """Plot a contour plot in dB of the beam pattern"""
         if not name_elem:
             name_elem = ""
 
-        xi = np.linspace(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor, 1000)
-        yi = np.linspace(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor, 1000)
-        xi, yi = np.meshgrid(xi, yi)
+        BeamPlot.contourPlot(self.xVals/self.conv_factor, self.yVals/self.conv_factor, 20*np.log10(np.abs(self.trans)),
+                             title="Amplitude vs. Position",
+                             filename="{}{}{}".format(self.save_name.split(".")[0], name_elem, "_dB.png"))
 
-        pts = np.array((self.xVals.ravel(), self.yVals.ravel())).transpose()
 
-        zi = griddata(pts/self.conv_factor, np.rad2deg(np.angle(self.trans.ravel())), (xi, yi), method="linear")
-        
-        plt.clf() 
-        CS = plt.contourf(xi, yi, zi)
-        CL = plt.contour(xi, yi, zi, colors='k')
-        plt.clabel(CL, colors='k')
-        plt.xlabel("X Position (mm)")
-        plt.ylabel("Y Position (mm)")
-        matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
-        plt.xlim(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor)
-        plt.ylim(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor)
-        plt.title("Phase vs. Position")
-        plt.draw()
-        plt.pause(0.001)
-        plt.savefig("{}{}{}".format(self.save_name.split(".")[0], name_elem, "_deg.png"))
+    def contour_plot_deg(self, name_elem = None):
+        """Plot a contour plot in degrees of the beam phase"""
+        if not name_elem:
+            name_elem = ""
+
+        BeamPlot.contourPlot(self.xVals/self.conv_factor, self.yVals/self.conv_factor, np.rad2deg(np.angle(self.trans)),
+                             title="Phase vs. Position",
+                             filename="{}{}{}".format(self.save_name.split(".")[0], name_elem, "_deg.png"))
         plt.show()
 
     def time_plot(self, file_name):
@@ -698,13 +1191,16 @@ if __name__ == "__main__":
 
 
     bs.initScan(bs.Range)
+    # Keep the data on disk as it is taken.  Run with --resume to carry on
+    # from an interrupted run of this scan
+    bs.initStore(resume="--resume" in sys.argv[1:])
 
     # Scanning
     print("\nCollecting data...")
     bs.scan()
 
     # Finished scanning
-    print("\nExecution time: " + str(time.time() - bs.start_time))
+    print("\nExecution time: " + str(bs.clock() - bs.start_time))
     # Don't turn off sig gens!
     # bs.endSG()
     bs.moveToCenter()
@@ -0,0 +1,135 @@
+#############################################################
+# Drift calibration for the Beamscanner                     #
+#                                                           #
+# Schedules reference measurements at the beam center from  #
+# the measured drift rate, and corrects scans for drift by  #
+# interpolating the references in time.                     #
+#############################################################
+"""Drift calibration of beam scans.
+
+The transmission at a fixed reference point drifts with time (temperature,
+cable flexure, LO phase), so it is measured from time to time during a scan.
+CalScheduler decides when: it estimates the drift rates of amplitude and
+phase from the reference measurements so far, and schedules the next one
+before the drift can exceed ampBudget dB or phaseBudget degrees.  Within the
+last window fraction of that time, a reference is taken early if it is cheap
+to get to from the current path.
+
+After the scan, correct() divides out the drift, interpolating the
+amplitude and unwrapped phase of the references to the time of each reading.
+
+    cal = Calibration.CalScheduler(ampBudget=0.05, phaseBudget=0.5)
+    ...
+    if cal.due(t, detour):
+        cal.add(t, measureReference())
+    ...
+    trans = Calibration.correct(transRaw, times, cal.times, cal.refs)
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+
+def interpolate(t, tRef, ref):
+    """Return the complex references ref taken at times tRef interpolated to
+    the times t, interpolating amplitude and unwrapped phase linearly.  t
+    may have any shape.  Outside the range of tRef the first or last
+    reference is used"""
+    tRef = np.asarray(tRef, dtype=float)
+    ref = np.asarray(ref, dtype=complex)
+    t = np.asarray(t, dtype=float)
+    if len(ref) == 0:
+        raise ValueError("Calibration.interpolate: no reference measurements")
+    order = np.argsort(tRef)
+    tRef = tRef[order]
+    ref = ref[order]
+    amp = np.interp(t, tRef, np.abs(ref))
+    phase = np.interp(t, tRef, np.unwrap(np.angle(ref)))
+    return amp*np.exp(1j*phase)
+
+
+def correct(trans, t, tRef, ref, ref0=None):
+    """Return the transmissions trans measured at times t corrected for the
+    drift of the references ref measured at times tRef, normalized to the
+    reference value ref0 (default: the first reference)"""
+    if ref0 is None:
+        ref0 = np.asarray(ref, dtype=complex)[np.argmin(tRef)]
+    return np.asarray(trans)*ref0/interpolate(t, tRef, ref)
+
+
+class CalScheduler(object):
+    """Schedule reference measurements so that the drift between them stays
+    within ampBudget dB and phaseBudget degrees.
+
+    The interval between references starts at initialInterval seconds, and
+    is then set from the drift rates measured between references (smoothed
+    over successive intervals), within minInterval and maxInterval.  In the
+    last <window> fraction of the interval a reference is due if the detour
+    to take it costs no more than maxDetour seconds; at the end of the
+    interval it is due whatever the cost."""
+    def __init__(self, ampBudget=0.05, phaseBudget=0.5, initialInterval=30.0, minInterval=5.0, maxInterval=600.0,
+                 window=0.5, maxDetour=1.0, smoothing=0.5):
+        self.ampBudget = ampBudget
+        self.phaseBudget = phaseBudget
+        self.initialInterval = initialInterval
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.window = window
+        self.maxDetour = maxDetour
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        """Forget all the reference measurements"""
+        self.times = []
+        self.refs = []
+        self.ampRate = None
+        self.phaseRate = None
+        self.interval = self.initialInterval
+
+    @property
+    def next(self):
+        """The time by which the next reference is needed, or None if none
+        has been taken yet"""
+        if not self.times:
+            return None
+        return self.times[-1] + self.interval
+
+    def due(self, t, detour=0.0):
+        """Return True if a reference should be taken at time t, when taking
+        it costs <detour> seconds"""
+        if not self.times:
+            return True
+        if t >= self.next:
+            return True
+        return t >= self.next - self.window*self.interval and detour <= self.maxDetour
+
+    def add(self, t, ref):
+        """Record the reference measurement ref taken at time t, and schedule
+        the next one"""
+        if self.times:
+            dt = t - self.times[-1]
+            if dt > 0:
+                last = self.refs[-1]
+                ampRate = abs(20*np.log10(abs(ref)/abs(last)))/dt
+                phaseRate = abs(np.degrees(np.angle(ref/last)))/dt
+                if self.ampRate is None:
+                    self.ampRate, self.phaseRate = ampRate, phaseRate
+                else:
+                    a = self.smoothing
+                    self.ampRate = a*self.ampRate + (1 - a)*ampRate
+                    self.phaseRate = a*self.phaseRate + (1 - a)*phaseRate
+                with np.errstate(divide="ignore"):
+                    interval = min(self.ampBudget/self.ampRate, self.phaseBudget/self.phaseRate)
+                self.interval = float(np.clip(interval, self.minInterval, self.maxInterval))
+        self.times.append(t)
+        self.refs.append(complex(ref))
+
+    def interpolate(self, t):
+        """Return the reference interpolated to the times t"""
+        return interpolate(t, self.times, self.refs)
+
+    def correct(self, trans, t):
+        """Return trans measured at times t corrected for drift"""
+        return correct(trans, t, self.times, self.refs)
@@ -0,0 +1,255 @@
+#############################################################
+# Model based beam center finding for the Beamscanner       #
+#                                                           #
+# Finds the beam center from a sparse set of samples by     #
+# fitting a 2-D quadratic to the amplitude in dB and to     #
+# the phase.                                                #
+#############################################################
+"""Find the center of a beam from a few samples of the transmission.
+
+The amplitude of a Gaussian beam in dB, and the phase of a beam near its
+waist, are quadratic in X and Y, so both are fitted with
+
+    z = c0 + c1*x + c2*y + c3*x**2 + c4*x*y + c5*y**2
+
+by least squares.  The center is where the gradient of the fit is zero, and
+its uncertainty follows from the covariance of the coefficients.  Samples
+are taken in a cross pattern around the current estimate, with an arm length
+matched to the fitted beam width, until the uncertainty of the center is
+below minRes.
+
+    finder = CenterFinder.CenterFinder(measure, span=250000, minRes=1000)
+    x, y = finder.find(60500, 81500)
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from LabEquipment.applications.Beamscanner import PathPlanner
+
+
+class QuadraticFit(object):
+    """Least squares fit of a 2-D quadratic to z at the points x, y.
+
+    The fit is done in coordinates relative to (x0, y0) and scaled by scale
+    for conditioning.  After fitting, center is the stationary point of the
+    quadratic, sigma the standard deviations of its X and Y, and curvature
+    the eigenvalues of the Hessian (in z per step**2)"""
+    def __init__(self, x, y, z, x0=0.0, y0=0.0, scale=1.0):
+        self.x0 = x0
+        self.y0 = y0
+        self.scale = scale
+        u = (np.asarray(x, dtype=float) - x0)/scale
+        v = (np.asarray(y, dtype=float) - y0)/scale
+        z = np.asarray(z, dtype=float)
+        A = np.column_stack((np.ones_like(u), u, v, u**2, u*v, v**2))
+        self.n = len(z)
+        if self.n < A.shape[1]:
+            raise ValueError("QuadraticFit: need at least 6 points, got {:d}".format(self.n))
+
+        self.coeffs, res, rank, sv = np.linalg.lstsq(A, z, rcond=None)
+        if rank < A.shape[1]:
+            raise ValueError("QuadraticFit: points do not determine a quadratic")
+        dof = self.n - A.shape[1]
+        resid = z - A.dot(self.coeffs)
+        # With no spare points the noise can't be estimated, so the covariance is unknown
+        self.rms = np.sqrt(np.sum(resid**2)/dof) if dof > 0 else np.inf
+        self.covariance = self.rms**2*np.linalg.inv(A.T.dot(A)) if dof > 0 else np.full((6, 6), np.inf)
+
+        c1, c2, c3, c4, c5 = self.coeffs[1:]
+        self.hessian = np.array([[2*c3, c4], [c4, 2*c5]])
+        self.curvature = np.linalg.eigvalsh(self.hessian)/scale**2
+        if np.linalg.det(self.hessian) == 0:
+            raise ValueError("QuadraticFit: quadratic has no stationary point")
+        Hinv = np.linalg.inv(self.hessian)
+        uc, vc = -Hinv.dot([c1, c2])
+
+        # Propagate the coefficient covariance through center = -H^-1 g
+        J = np.zeros((2, 6))
+        J[:, 1:] = -Hinv.dot([[1, 0, 2*uc, vc, 0],
+                              [0, 1, 0, uc, 2*vc]])
+        if dof > 0:
+            cov = J.dot(self.covariance).dot(J.T)
+            self.sigma = np.sqrt(np.abs(np.diag(cov)))*scale
+        else:
+            self.sigma = np.array([np.inf, np.inf])
+        self.center = np.array([x0 + uc*scale, y0 + vc*scale])
+        self.peak = self(self.center[0], self.center[1])
+
+    def __call__(self, x, y):
+        """Return the fitted value at x, y"""
+        u = (np.asarray(x, dtype=float) - self.x0)/self.scale
+        v = (np.asarray(y, dtype=float) - self.y0)/self.scale
+        c0, c1, c2, c3, c4, c5 = self.coeffs
+        return c0 + c1*u + c2*v + c3*u**2 + c4*u*v + c5*v**2
+
+    def isMaximum(self):
+        """Return True if the stationary point is a maximum"""
+        return bool(np.all(self.curvature < 0))
+
+
+def fitAmplitude(x, y, trans, x0=0.0, y0=0.0, scale=1.0):
+    """Fit a quadratic to the amplitude of the complex transmissions trans in dB"""
+    return QuadraticFit(x, y, 20*np.log10(np.abs(trans)), x0, y0, scale)
+
+
+def fitPhase(x, y, trans, x0=0.0, y0=0.0, scale=1.0):
+    """Fit a quadratic to the phase of the complex transmissions trans in
+    radians, relative to the phase of the point nearest x0, y0"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    trans = np.asarray(trans)
+    ref = trans[np.argmin((x - x0)**2 + (y - y0)**2)]
+    return QuadraticFit(x, y, np.angle(trans/ref), x0, y0, scale)
+
+
+def crossPoints(x0, y0, h, diagonals=False):
+    """Return the center and four points at distance h along X and Y from
+    x0, y0, and the four diagonal points if diagonals is True"""
+    offsets = [(0, 0), (h, 0), (-h, 0), (0, h), (0, -h)]
+    if diagonals:
+        offsets += [(h, h), (-h, h), (-h, -h), (h, -h)]
+    return np.array(offsets, dtype=float) + [x0, y0]
+
+
+class CenterFinder(object):
+    """Find the beam center with as few measurements as possible.
+
+    measure(x, y) moves to x, y (in stage steps) and returns the complex
+    transmission there.  The search is limited to within span/2 of the
+    starting point, and stops when the uncertainty of the center and the
+    last change in the estimate are both below minRes, or after maxPoints
+    measurements.  Only samples within dynamicRange dB of the strongest are
+    used in the amplitude fit, to keep the noise floor out of it.
+
+    If the stages' velocity and accel are given, each set of samples is
+    measured in the quickest order."""
+    def __init__(self, measure, span, minRes, maxPoints=60, dynamicRange=20.0, velocity=None, accel=None,
+                 verbose=False):
+        self.measure = measure
+        self.span = span
+        self.minRes = minRes
+        self.maxPoints = maxPoints
+        self.dynamicRange = dynamicRange
+        self.velocity = velocity
+        self.accel = accel
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        """Forget all the samples"""
+        self.x = []
+        self.y = []
+        self.trans = []
+        self.history = []
+        self.ampFit = None
+        self.phaseFit = None
+
+    def sample(self, points):
+        """Measure the transmission at each of points not already sampled"""
+        points = np.asarray(points, dtype=float)
+        if len(self.x):
+            taken = np.column_stack((self.x, self.y))
+            d = np.abs(points[:, None, :] - taken[None, :, :]).max(axis=2)
+            points = points[d.min(axis=1) > self.minRes/2]
+        if len(points) > 2 and self.velocity and self.accel:
+            start = (self.x[-1], self.y[-1]) if len(self.x) else None
+            points = points[PathPlanner.planPath(points, self.velocity, self.accel, start=start)]
+        for x, y in points:
+            if len(self.x) >= self.maxPoints:
+                break
+            self.x.append(x)
+            self.y.append(y)
+            self.trans.append(self.measure(x, y))
+
+    def _fitAmplitude(self, x0, y0, h):
+        x, y, trans = np.array(self.x), np.array(self.y), np.array(self.trans)
+        dB = 20*np.log10(np.abs(trans))
+        use = dB >= dB.max() - self.dynamicRange
+        fit = fitAmplitude(x[use], y[use], trans[use], x0, y0, h)
+        if not fit.isMaximum():
+            raise ValueError("CenterFinder: amplitude fit has no maximum")
+        return fit
+
+    def find(self, x0, y0, usePhase=True):
+        """Return the X, Y position of the beam center, starting the search
+        at x0, y0.
+
+        If usePhase is True, the center of the phase is returned, otherwise
+        the amplitude peak"""
+        self.reset()
+        xmin, xmax = x0 - self.span/2, x0 + self.span/2
+        ymin, ymax = y0 - self.span/2, y0 + self.span/2
+        h = self.span/4
+        estimate = np.array([x0, y0], dtype=float)
+
+        self.sample(crossPoints(x0, y0, h, diagonals=True))
+        while True:
+            try:
+                fit = self._fitAmplitude(estimate[0], estimate[1], h)
+            except (ValueError, np.linalg.LinAlgError) as err:
+                # Not enough of the beam in view: recenter on the strongest sample and look closer
+                if self.verbose:
+                    print("  {}".format(err))
+                best = np.argmax(np.abs(self.trans))
+                new = np.array([self.x[best], self.y[best]])
+                if np.allclose(new, estimate):
+                    h = max(h/2, self.minRes)
+                sigma = np.array([np.inf, np.inf])
+            else:
+                self.ampFit = fit
+                new = fit.center
+                sigma = fit.sigma
+                # Sample where the beam is about 3 dB down from its peak
+                width = np.sqrt(3.0/-fit.curvature.max())
+                h = min(max(width, self.minRes), self.span/4)
+
+            # Don't trust the fit far from the samples
+            step = new - estimate
+            if np.abs(step).max() > 2*h:
+                step *= 2*h/np.abs(step).max()
+            new = np.clip(estimate + step, [xmin, ymin], [xmax, ymax])
+            moved = np.abs(new - estimate).max()
+            estimate = new
+            self.history.append((estimate[0], estimate[1], sigma[0], sigma[1], len(self.x)))
+            if self.verbose:
+                print("  Center estimate X {:.1f}, Y {:.1f} +/- {:.1f}, {:.1f} from {:d} points".format(
+                    estimate[0], estimate[1], sigma[0], sigma[1], len(self.x)))
+
+            if np.all(sigma < self.minRes) and moved < self.minRes:
+                break
+            if len(self.x) >= self.maxPoints:
+                print("CenterFinder: center not found to {:.1f} steps after {:d} points".format(self.minRes,
+                                                                                              len(self.x)))
+                break
+            count = len(self.x)
+            self.sample(crossPoints(estimate[0], estimate[1], h))
+            if len(self.x) == count:
+                # All the cross points have been sampled already, so sample further out
+                h = min(2*h, self.span/4)
+                self.sample(crossPoints(estimate[0], estimate[1], h, diagonals=True))
+                if len(self.x) == count:
+                    break
+
+        if usePhase:
+            try:
+                # Only fit the phase close to the center, where it doesn't wrap
+                x, y, trans = np.array(self.x), np.array(self.y), np.array(self.trans)
+                near = np.maximum(np.abs(x - estimate[0]), np.abs(y - estimate[1])) <= 2*h
+                self.phaseFit = fitPhase(x[near], y[near], trans[near], estimate[0], estimate[1], h)
+            except (ValueError, np.linalg.LinAlgError) as err:
+                print("CenterFinder: {}, using the amplitude peak".format(err))
+            else:
+                phaseCenter = self.phaseFit.center
+                if np.all(np.abs(phaseCenter - estimate) <= 2*h):
+                    estimate = phaseCenter
+                else:
+                    print("CenterFinder: phase center is outside the samples, using the amplitude peak")
+        return estimate[0], estimate[1]
+
+    @property
+    def samples(self):
+        """The samples taken, as a record array with fields x, y and trans"""
+        return np.rec.fromarrays([np.array(self.x), np.array(self.y), np.array(self.trans, dtype=complex)],
+                                 names="x,y,trans")
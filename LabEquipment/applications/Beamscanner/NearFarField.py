@@ -0,0 +1,205 @@
+#############################################################
+# Planar near-field to far-field transform                  #
+#                                                           #
+# Transforms complex near-field maps measured by the        #
+# Beamscanner to far-field patterns with FFTs.              #
+#############################################################
+"""Planar near-field to far-field transform of Beamscanner data.
+
+The near field E(x, y) measured on a plane is expanded in plane waves,
+
+    A(kx, ky) = sum E(x, y) exp(j(kx x + ky y)) dx dy
+
+(for the exp(jwt) time convention), computed by a zero padded FFT, and the
+far field in the direction with direction cosines u = kx/k, v = ky/k is
+
+    E(u, v) ~ cos(theta) A(kx, ky) / P(kx, ky)
+
+where P is the far-field pattern of the probe, if probe correction is used.
+The k-space sampling is fixed by the grid and the padding, so the angular
+sampling (u, v) differs for each frequency.  Transforms of many frequencies
+(or scans) on the same grid are done as one batched FFT.
+
+Positions are in mm and frequencies in Hz.
+
+    x, y, trans = NearFarField.loadScan("scan.csv")
+    ff = NearFarField.transform(trans, x, y, 240e9, pad=4, window="hann")
+    theta, cut = ff.cut(axis="x")
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+try:
+    from scipy import fft as _fft
+    _workers = {"workers": -1}
+except ImportError:
+    _fft = np.fft
+    _workers = {}
+
+# Speed of light in mm/s
+c = 299792458e3
+
+
+def loadScan(filename):
+    """Return x, y and trans read from a CSV file written by
+    Beamscanner.spreadsheet(), where x and y are the 1-D grid positions in mm
+    and trans the complex transmission with shape (len(y), len(x))"""
+    data = np.loadtxt(filename, delimiter=",", ndmin=2)
+    x, y = data[:, 0], data[:, 1]
+    trans = data[:, 2] + 1j*data[:, 3]
+
+    # Rows are written with constant Y
+    rowStarts = np.flatnonzero(np.diff(y) != 0)
+    nx = rowStarts[0] + 1 if len(rowStarts) else len(y)
+    if len(y) % nx:
+        raise ValueError("NearFarField.loadScan: {} is not a regular grid scan".format(filename))
+    ny = len(y)//nx
+    x = x.reshape(ny, nx)
+    y = y.reshape(ny, nx)
+    trans = trans.reshape(ny, nx)
+
+    # Rows may be stored in either direction
+    order = np.argsort(x, axis=1)
+    x = np.take_along_axis(x, order, axis=1)
+    trans = np.take_along_axis(trans, order, axis=1)
+    return x.mean(axis=0), y.mean(axis=1), trans
+
+
+def windowFunction(name, n):
+    """Return the window <name> ("hann", "hamming", "blackman", "tukey" or
+    "tukeyA" where A is the taper fraction, e.g. "tukey0.25") of length n, or
+    ones if name is None"""
+    if name is None:
+        return np.ones(n)
+    if name == "hann":
+        return np.hanning(n)
+    if name == "hamming":
+        return np.hamming(n)
+    if name == "blackman":
+        return np.blackman(n)
+    if name.startswith("tukey"):
+        alpha = float(name[5:]) if len(name) > 5 else 0.5
+        w = np.ones(n)
+        taper = int(np.floor(alpha*(n - 1)/2))
+        if taper > 0:
+            ramp = 0.5*(1 - np.cos(np.pi*np.arange(taper)/taper))
+            w[:taper] = ramp
+            w[n-taper:] = ramp[::-1]
+        return w
+    raise ValueError("NearFarField.windowFunction: unknown window {}".format(name))
+
+
+def fftSize(n, pad):
+    """Return the padded transform size for n points: the next power of two
+    at least pad*n"""
+    return int(2**np.ceil(np.log2(max(pad*n, 1))))
+
+
+def gaussianProbe(waist):
+    """Return a probe pattern function for a probe with a Gaussian beam of
+    1/e amplitude radius waist mm at its aperture"""
+    def probe(kx, ky, k):
+        return np.exp(-(kx**2 + ky**2)*waist**2/4)
+    return probe
+
+
+class FarField(object):
+    """Far-field patterns from transform().
+
+    kx and ky are the transverse wavenumbers in rad/mm (ascending, with 0 at
+    index size//2), k the wavenumber of each frequency, pattern the complex
+    far field of each frequency with shape (len(freqs), len(ky), len(kx)), and
+    visible the mask of the directions that propagate (kx**2 + ky**2 < k**2),
+    outside which pattern is 0."""
+    def __init__(self, freqs, kx, ky, pattern, visible):
+        self.freqs = freqs
+        self.kx = kx
+        self.ky = ky
+        self.k = 2*np.pi*freqs/c
+        self.pattern = pattern
+        self.visible = visible
+
+    @property
+    def u(self):
+        """The X direction cosines of each frequency, shape (len(freqs), len(kx))"""
+        return self.kx[None, :]/self.k[:, None]
+
+    @property
+    def v(self):
+        """The Y direction cosines of each frequency, shape (len(freqs), len(ky))"""
+        return self.ky[None, :]/self.k[:, None]
+
+    def dB(self, normalize=True):
+        """Return the power pattern in dB, normalized to the peak of each
+        frequency if normalize is True"""
+        amp = np.abs(self.pattern)
+        if normalize:
+            amp = amp/amp.max(axis=(-2, -1), keepdims=True)
+        with np.errstate(divide="ignore"):
+            return 20*np.log10(amp)
+
+    def cut(self, axis="x", index=0):
+        """Return the angles in degrees and the complex far field along the
+        principal plane containing <axis> ("x" or "y"), for frequency <index>"""
+        pattern = self.pattern[index]
+        if axis == "x":
+            kt, values = self.kx, pattern[len(self.ky)//2, :]
+        elif axis == "y":
+            kt, values = self.ky, pattern[:, len(self.kx)//2]
+        else:
+            raise ValueError("FarField.cut: axis must be 'x' or 'y'")
+        visible = np.abs(kt) < self.k[index]
+        return np.degrees(np.arcsin(kt[visible]/self.k[index])), values[visible]
+
+
+def transform(trans, x, y, freqs, pad=2, window=None, probe=None):
+    """Return the FarField of the near field trans measured on the regular
+    grid x, y (1-D arrays in mm) at frequencies freqs in Hz.
+
+    trans has shape (len(y), len(x)) for one frequency, or (len(freqs),
+    len(y), len(x)) for several.  The FFT size in each axis is the next power
+    of two at least pad times the number of points.  window is the name of a
+    window (see windowFunction) applied in both axes, or an array of shape
+    (len(y), len(x)).  probe(kx, ky, k) returns the far-field pattern of the
+    probe, which is divided out (see gaussianProbe).  The phase of the
+    pattern is referenced to x = y = 0."""
+    trans = np.asarray(trans, dtype=complex)
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    if trans.ndim == 2:
+        trans = trans[None]
+    nf, ny, nx = trans.shape
+    if len(freqs) != nf:
+        raise ValueError("NearFarField.transform: {:d} frequencies for {:d} maps".format(len(freqs), nf))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    dx = (x[-1] - x[0])/(nx - 1) if nx > 1 else 1.0
+    dy = (y[-1] - y[0])/(ny - 1) if ny > 1 else 1.0
+
+    if window is not None:
+        if isinstance(window, str):
+            w = np.outer(windowFunction(window, ny), windowFunction(window, nx))
+        else:
+            w = np.asarray(window)
+        trans = trans*w
+
+    px, py = fftSize(nx, pad), fftSize(ny, pad)
+    # sum E exp(+j kx x) is the inverse FFT scaled by its length
+    spectrum = _fft.ifft2(trans, s=(py, px), axes=(-2, -1), **_workers)*(px*py*dx*dy)
+    spectrum = _fft.fftshift(spectrum, axes=(-2, -1))
+    kx = 2*np.pi*_fft.fftshift(_fft.fftfreq(px, dx))
+    ky = 2*np.pi*_fft.fftshift(_fft.fftfreq(py, dy))
+
+    # Reference the phase to the origin rather than the first grid point
+    spectrum *= np.exp(1j*ky*y[0])[:, None]*np.exp(1j*kx*x[0])[None, :]
+
+    k = 2*np.pi*freqs/c
+    kt2 = ky[:, None]**2 + kx[None, :]**2
+    visible = kt2[None, :, :] < (k**2)[:, None, None]
+    cosTheta = np.sqrt(np.where(visible, 1 - kt2[None, :, :]/(k**2)[:, None, None], 0.0))
+    pattern = spectrum*cosTheta
+    if probe is not None:
+        p = np.stack([probe(kx[None, :], ky[:, None], ki) for ki in k])
+        pattern = np.where(visible, pattern/np.where(visible, p, 1), 0)
+    return FarField(freqs, kx, ky, pattern, visible)
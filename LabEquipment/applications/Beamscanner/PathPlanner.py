@@ -0,0 +1,178 @@
+#############################################################
+# Scan path planning for the Beamscanner                    #
+#                                                           #
+# Orders a set of scan points to minimize the time the      #
+# stages spend moving between them.                         #
+#############################################################
+"""Plan the order in which the Beamscanner visits a set of scan points.
+
+The X and Y stages move simultaneously, each with a trapezoidal velocity
+profile, so the time for a move is the longer of the X and Y move times.
+Paths are built by nearest neighbour and then improved with 2-opt, using
+that move time as the cost.
+
+    points = PathPlanner.aperturePoints(radius=100000, step=5000)
+    order = PathPlanner.planPath(points, velocity=10000, accel=500000, start=(0, 0))
+    bs.initPathScan(points[order])
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from LabEquipment.lib import kinematics
+
+
+def moveTimes(p0, p1, velocity, accel, decel=None):
+    """Return the time taken to move between points (or arrays of points) p0
+    and p1, with both stages moving at once"""
+    d = np.abs(np.asarray(p1, dtype=float) - np.asarray(p0, dtype=float))
+    return np.maximum(kinematics.moveTime(d[..., 0], velocity, accel, decel),
+                      kinematics.moveTime(d[..., 1], velocity, accel, decel))
+
+
+def pathTime(points, velocity, accel, decel=None, start=None, overhead=0.0):
+    """Return the total time to visit <points> in order, starting from
+    <start> if given, with <overhead> seconds spent at each point"""
+    points = np.asarray(points, dtype=float)
+    if start is not None:
+        points = np.vstack((start, points))
+    return float(np.sum(moveTimes(points[:-1], points[1:], velocity, accel, decel))) + overhead*len(points)
+
+
+def _nearestNeighbour(points, cost, first):
+    n = len(points)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    current = first
+    for i in range(n):
+        order[i] = current
+        visited[current] = True
+        if i == n - 1:
+            break
+        c = cost(points[current], points)
+        c[visited] = np.inf
+        current = int(np.argmin(c))
+    return order
+
+
+def _neighbours(points, cost, k):
+    """Return the indices of the k cheapest points to move to from each point"""
+    n = len(points)
+    k = min(k, n - 1)
+    nbrs = np.empty((n, k), dtype=int)
+    for i in range(n):
+        c = cost(points[i], points)
+        c[i] = np.inf
+        nearest = np.argpartition(c, k - 1)[:k]
+        nbrs[i] = nearest[np.argsort(c[nearest])]
+    return nbrs
+
+
+def _twoOpt(points, order, cost, neighbours, maxPasses):
+    """Improve an open path with 2-opt moves that join each point to one of
+    its neighbours, reversing segments while that shortens the path.  The
+    first point of the path is kept fixed"""
+    n = len(order)
+    order = order.copy()
+    pos = np.empty(n, dtype=int)
+    pos[order] = np.arange(n)
+
+    def c(i, j):
+        return float(cost(points[i], points[j]))
+
+    def reverse(i, j):
+        order[i:j+1] = order[i:j+1][::-1]
+        pos[order[i:j+1]] = np.arange(i, j+1)
+
+    for p in range(maxPasses):
+        improved = False
+        for a in range(n):
+            for cc in neighbours[a]:
+                i, j = pos[a], pos[cc]
+                if abs(i - j) <= 1:
+                    continue
+                ac = c(a, cc)
+                if j > i:
+                    # Join a to cc by reversing the path from after a to cc
+                    b = order[i+1]
+                    ab = c(a, b)
+                    if ac >= ab:
+                        break
+                    delta = ac - ab
+                    if j < n - 1:
+                        delta += c(b, order[j+1]) - c(cc, order[j+1])
+                    if delta < -1e-9:
+                        reverse(i + 1, j)
+                        improved = True
+                else:
+                    # Join cc to a by reversing the path from cc to before a
+                    b = order[i-1]
+                    ab = c(a, b)
+                    if ac >= ab:
+                        break
+                    if j == 0:
+                        continue
+                    delta = ac - ab + c(order[j-1], b) - c(order[j-1], cc)
+                    if delta < -1e-9:
+                        reverse(j, i - 1)
+                        improved = True
+        if not improved:
+            break
+    return order
+
+
+def planPath(points, velocity, accel, decel=None, start=None, neighbours=10, maxPasses=20):
+    """Return the order in which to visit <points> (an (n, 2) array of X, Y
+    positions in stage steps) to minimize the total move time, for stages
+    with maximum velocity <velocity> and acceleration <accel>.
+
+    The path starts at the point cheapest to reach from <start> (default:
+    the first point), is built by nearest neighbour, and is improved by
+    2-opt moves between each point and its <neighbours> cheapest
+    neighbours"""
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    cost = lambda p0, p1: moveTimes(p0, p1, velocity, accel, decel)
+
+    if start is None:
+        first = 0
+    else:
+        first = int(np.argmin(cost(np.asarray(start, dtype=float), points)))
+    order = _nearestNeighbour(points, cost, first)
+    return _twoOpt(points, order, cost, _neighbours(points, cost, neighbours), maxPasses)
+
+
+def rasterPoints(xmin, xmax, ymin, ymax, step):
+    """Return the points of a serpentine raster, in scan order"""
+    x = np.arange(xmin, xmax + step, step, dtype=float)
+    y = np.arange(ymin, ymax + step, step, dtype=float)
+    xx, yy = np.meshgrid(x, y)
+    xx[1::2, :] = xx[1::2, ::-1]
+    return np.column_stack((xx.ravel(), yy.ravel()))
+
+
+def aperturePoints(radius, step, center=(0, 0)):
+    """Return the points of a square grid with spacing <step> inside a
+    circular aperture of <radius> around <center>"""
+    x = np.arange(-np.floor(radius/step)*step, radius + step/2, step)
+    xx, yy = np.meshgrid(x, x)
+    inside = xx**2 + yy**2 <= radius**2
+    return np.column_stack((xx[inside] + center[0], yy[inside] + center[1]))
+
+
+def polarPoints(radius, nRings, step=None, center=(0, 0)):
+    """Return the points of a polar grid of <nRings> rings out to <radius>
+    around <center>, plus the center.  Each ring has points spaced by about
+    <step> around its circumference (default: the ring spacing)"""
+    spacing = radius/nRings
+    if step is None:
+        step = spacing
+    points = [np.zeros((1, 2))]
+    for r in spacing*np.arange(1, nRings + 1):
+        n = max(int(np.ceil(2*np.pi*r/step)), 4)
+        theta = 2*np.pi*np.arange(n)/n
+        points.append(np.column_stack((r*np.cos(theta), r*np.sin(theta))))
+    return np.vstack(points) + np.asarray(center, dtype=float)
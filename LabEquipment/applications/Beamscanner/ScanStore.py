@@ -0,0 +1,211 @@
+#############################################################
+# On-disk storage of Beamscanner scans                      #
+#                                                           #
+# Keeps scan data in a memory mapped .npy file as it is     #
+# measured, so that large scans need little memory and an   #
+# interrupted scan can be resumed.                          #
+#############################################################
+"""Memory mapped storage of Beamscanner scans.
+
+A scan is stored as a .npy file holding a structured array with one record
+per scan point, in scan order, with fields
+
+    x, y    position in stage steps
+    trans   transmission (an array of one per frequency for multi-frequency
+            scans), corrected for drift once the scan is finished
+    raw     transmission as measured
+    cal     drift reference
+    time    time in seconds from the start of the scan
+    done    True once the point has been measured
+
+Each point is written as soon as it is measured, and marked done last, so
+after a crash the points marked done are complete.  The shape of the scan
+grid, the conversion factor and the frequencies are kept in a .json file
+alongside, and the drift reference measurements in a .refs.npy file.
+
+    store = ScanStore.create("scan.npy", xVals, yVals, conv_factor=5000)
+    store.record(k, x, y, trans, t, cal)
+    ...
+    store = ScanStore.load("scan.npy")
+    todo = store.remaining()
+    ...
+    store.exportCSV("scan.csv")
+"""
+
+from __future__ import print_function, division
+
+import json
+import os
+
+import numpy as np
+
+
+def _sidecar(filename, ext):
+    return os.path.splitext(filename)[0] + ext
+
+
+def makeDtype(nfreqs=1):
+    """Return the record dtype for a scan at nfreqs frequencies"""
+    shape = () if nfreqs == 1 else (nfreqs,)
+    return np.dtype([("x", "f8"), ("y", "f8"), ("trans", "c16", shape), ("raw", "c16", shape),
+                     ("cal", "c16", shape), ("time", "f8"), ("done", "?")])
+
+
+def writeCSV(filename, x, y, trans, cal, time, serpentine=False, chunk=65536):
+    """Write scan data to filename in the Beamscanner.spreadsheet() layout:
+    X and Y in mm, transmission real and imaginary, cal real and imaginary and
+    time.
+
+    x, y, trans, cal and time are arrays of the same shape.  If serpentine is
+    True they are 2-D with every other row reversed, and those rows are
+    written in ascending order.  The data is written about chunk points at a
+    time, so large scans don't need a full copy in memory"""
+    x, y, trans, cal, time = (np.asarray(a) for a in (x, y, trans, cal, time))
+    if serpentine:
+        rows = range(x.shape[0])
+        take = lambda a, r: a[r, ::-1] if r % 2 else a[r]
+    else:
+        x, y, trans, cal, time = (a.ravel() for a in (x, y, trans, cal, time))
+        rows = range(0, len(x), chunk)
+        take = lambda a, r: a[r:r+chunk]
+    with open(filename, "w") as f:
+        block = []
+        for r in rows:
+            tr, c = take(trans, r), take(cal, r)
+            block.append(np.column_stack((take(x, r), take(y, r), tr.real, tr.imag, c.real, c.imag, take(time, r))))
+            if sum(len(b) for b in block) >= chunk:
+                np.savetxt(f, np.vstack(block), delimiter=", ")
+                block = []
+        if block:
+            np.savetxt(f, np.vstack(block), delimiter=", ")
+
+
+class ScanStore(object):
+    """A scan stored in a memory mapped .npy file (see create and load).
+
+    data is the structured array of all the points in scan order, shape the
+    shape of the scan grid, and info the dict of scan settings saved with it"""
+    def __init__(self, filename, data, info):
+        self.filename = filename
+        self.data = data
+        self.info = info
+        self.shape = tuple(info["shape"])
+        self.refTimes = []
+        self.refs = []
+        refsFile = _sidecar(filename, ".refs.npy")
+        if os.path.exists(refsFile):
+            saved = np.load(refsFile)
+            self.refTimes = list(saved["time"])
+            self.refs = list(saved["ref"])
+
+    @property
+    def freqs(self):
+        """The test frequencies in Hz, or None for a single frequency scan"""
+        return self.info.get("freqs")
+
+    def grid(self, field):
+        """Return field (e.g. "trans") in the shape of the scan grid, with the
+        frequency first for multi-frequency fields"""
+        values = self.data[field]
+        if values.ndim > 1:
+            return np.moveaxis(values, -1, 0).reshape((values.shape[-1],) + self.shape)
+        return values.reshape(self.shape)
+
+    def remaining(self):
+        """Return the indices of the points not yet measured"""
+        return np.flatnonzero(~self.data["done"])
+
+    def record(self, k, x, y, trans, time, cal=0j):
+        """Store the measurement at point k of the scan, and mark it done"""
+        self.recordRows(k, k + 1, x, y, trans, time, cal)
+
+    def recordRows(self, start, stop, x, y, trans, time, cal=0j):
+        """Store the measurements at points start to stop of the scan (e.g. a
+        row), and mark them done"""
+        rec = self.data[start:stop]
+        rec["x"] = x
+        rec["y"] = y
+        rec["trans"] = trans
+        rec["raw"] = trans
+        rec["cal"] = cal
+        rec["time"] = time
+        # Last, so that points marked done are complete
+        rec["done"] = True
+
+    def addReference(self, t, ref):
+        """Store a drift reference measurement ref (one per frequency) taken at
+        time t"""
+        self.refTimes.append(t)
+        self.refs.append(ref)
+        saved = np.empty(len(self.refs), dtype=[("time", "f8"), ("ref", "c16", np.shape(ref))])
+        saved["time"] = self.refTimes
+        saved["ref"] = self.refs
+        np.save(_sidecar(self.filename, ".refs.npy"), saved)
+
+    def setCorrected(self, trans, cal):
+        """Store the drift corrected transmissions and interpolated references
+        for the whole scan, given in the shape returned by grid()"""
+        for field, values in (("trans", trans), ("cal", cal)):
+            values = np.asarray(values)
+            if self.data[field].ndim > 1:
+                values = np.moveaxis(values.reshape(values.shape[0], -1), 0, -1)
+            self.data[field] = values.reshape(self.data[field].shape)
+
+    def flush(self):
+        """Write the changes to disk"""
+        self.data.flush()
+
+    def exportCSV(self, filename, index=0):
+        """Write the measured points to filename in the Beamscanner.spreadsheet()
+        layout, with positions in mm.  For multi-frequency scans, the map at
+        frequency <index> is written"""
+        conv = self.info.get("conv_factor", 1.0)
+        trans, cal = self.grid("trans"), self.grid("cal")
+        if trans.ndim > len(self.shape):
+            trans, cal = trans[index], cal[index]
+        x, y, time = self.grid("x")/conv, self.grid("y")/conv, self.grid("time")
+        done = self.grid("done")
+        serpentine = self.info.get("scan_type") == "raster" and len(self.shape) == 2
+        if serpentine and not done.all():
+            # Write the rows completed so far
+            complete = int(np.argmin(done.all(axis=1)))
+            x, y, trans, cal, time = (a[:complete] for a in (x, y, trans, cal, time))
+        elif not serpentine:
+            x, y, trans, cal, time = (a[done] for a in (x, y, trans, cal, time))
+        writeCSV(filename, x, y, trans, cal, time, serpentine=serpentine)
+
+    def close(self):
+        self.flush()
+        del self.data
+
+
+def create(filename, x, y, freqs=None, **info):
+    """Create a store for a scan of the points x, y (arrays in stage steps in
+    scan order, in the shape of the scan grid) at the test frequencies freqs
+    (None for a single frequency scan), overwriting any existing scan in
+    filename.  Other keyword arguments (e.g. conv_factor, scan_type) are saved
+    with the scan"""
+    x = np.asarray(x, dtype=float)
+    nfreqs = 1 if freqs is None else len(freqs)
+    data = np.lib.format.open_memmap(filename, mode="w+", dtype=makeDtype(nfreqs), shape=(x.size,))
+    data["x"] = x.ravel()
+    data["y"] = np.asarray(y, dtype=float).ravel()
+    data["done"] = False
+    data.flush()
+
+    info = dict(info, shape=list(x.shape))
+    if freqs is not None:
+        info["freqs"] = [float(f) for f in freqs]
+    with open(_sidecar(filename, ".json"), "w") as f:
+        json.dump(info, f, indent=1)
+    refsFile = _sidecar(filename, ".refs.npy")
+    if os.path.exists(refsFile):
+        os.remove(refsFile)
+    return ScanStore(filename, data, info)
+
+
+def load(filename, mode="r+"):
+    """Open the scan stored in filename, for resuming ("r+") or reading ("r")"""
+    with open(_sidecar(filename, ".json")) as f:
+        info = json.load(f)
+    return ScanStore(filename, np.load(filename, mmap_mode=mode), info)
@@ -0,0 +1,178 @@
+#############################################################
+# Simulated Beamscanner for benchmarking scan strategies    #
+#                                                           #
+# Runs a Beamscanner against simulated MSL stages, vector   #
+# voltmeter and signal generators on a virtual clock.       #
+#############################################################
+"""Simulate the Beamscanner hardware, for comparing scan strategies without
+the range.
+
+Simulation attaches the simulated lab instruments (see
+LabEquipment.drivers.Simulator) to a Beamscanner in place of msl_x, msl_y,
+vvm, RF and LO:
+
+    MSL stages     trapezoidal moves at the velocity and acceleration set by
+                   initMSL, with serial port latency on every command
+    vector volt-   readingTime*2**averaging seconds per reading, with noise
+    meter          falling with averaging, and GPIB latency
+    beam           a GaussianBeam (or any beam(x, y) in stage steps), with
+                   amplitude and phase drift added by DriftingBeam
+
+Everything runs on a VirtualClock, which only advances when the simulated
+instruments (or the drivers, waiting on them) sleep, so a scan takes as long
+in simulated time as it would on the range, finishes as fast as the
+computer allows, and takes the same simulated time every run.  The noise is
+seeded, so the data are repeatable too.
+
+    bs = Beamscanner.Beamscanner()
+    bs.readUSE("Beamscan.use")
+    sim = Simulation.Simulation(beam=Simulation.DriftingBeam(phaseDrift=20))
+    sim.attach(bs)
+    bs.initSG()
+    bs.initVVM()
+    bs.initMSL()
+    bs.initScan()
+    with sim.timer("stop and go"):
+        bs.scan()
+    bs.initScan()
+    with sim.timer("on the fly"):
+        bs.scanOTF()
+    sim.report()
+"""
+
+from __future__ import print_function, division
+
+import collections
+import contextlib
+import sys
+import time
+
+import numpy as np
+
+from LabEquipment.drivers.Instrument import HP8508A, HMCT2240, HP83630A, MSL
+from LabEquipment.drivers.Simulator import Instruments
+
+
+class VirtualClock(object):
+    """Simulated time, advanced only by sleep().  Provides time() and sleep()
+    like the time module"""
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+class DriftingBeam(object):
+    """A beam whose amplitude and phase drift with time, as the signal chain
+    warms up and the cables move.
+
+    The drift is linear at ampDrift dB and phaseDrift degrees per hour, plus
+    a cycle of ampCycle dB and phaseCycle degrees amplitude with period
+    cyclePeriod seconds (e.g. the air conditioning).  beam(x, y) is the field
+    without drift (default: a GaussianBeam).  The clock and start time are set
+    by Simulation"""
+    def __init__(self, beam=None, ampDrift=0.0, phaseDrift=0.0, ampCycle=0.0, phaseCycle=0.0, cyclePeriod=1800.0):
+        if beam is None:
+            beam = Instruments.GaussianBeam()
+        self.beam = beam
+        self.ampDrift = ampDrift
+        self.phaseDrift = phaseDrift
+        self.ampCycle = ampCycle
+        self.phaseCycle = phaseCycle
+        self.cyclePeriod = cyclePeriod
+        self.clock = time
+        self.t0 = 0.0
+
+    def drift(self, t):
+        """Return the complex drift factor at time t"""
+        t = t - self.t0
+        cycle = np.sin(2*np.pi*t/self.cyclePeriod)
+        dB = self.ampDrift*t/3600 + self.ampCycle*cycle
+        deg = self.phaseDrift*t/3600 + self.phaseCycle*cycle
+        return 10**(dB/20)*np.exp(1j*np.deg2rad(deg))
+
+    def __call__(self, x, y):
+        return self.beam(x, y)*self.drift(self.clock.time())
+
+
+class Simulation(object):
+    """Simulated Beamscanner hardware on a VirtualClock.
+
+    beam(x, y) is the field across the scan plane in stage steps (default: a
+    GaussianBeam), or a DriftingBeam.  noise is the relative noise of a VVM
+    reading without averaging, and readingTime the time it takes.  latency
+    and serialLatency are those of the GPIB instruments and the MSL serial
+    port (see Instruments.labResourceManager).  The noise and latency jitter
+    are drawn from rng, a numpy Generator seeded with seed, for repeatable
+    runs without touching the global random state.
+
+    clock is the VirtualClock, rm the simulated resource manager, and
+    timings the (label, simulated seconds, real seconds) of each timer()"""
+    def __init__(self, beam=None, noise=1e-3, readingTime=0.002, latency=None, serialLatency=None, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.clock = VirtualClock()
+        if beam is None:
+            beam = Instruments.GaussianBeam()
+        if isinstance(beam, DriftingBeam):
+            beam.clock = self.clock
+            beam.t0 = self.clock.time()
+        self.beam = beam
+        self.rm = Instruments.labResourceManager(latency=latency, serialLatency=serialLatency, clock=self.clock,
+                                                 beam=beam, rng=self.rng)
+        vvm = self.model("vvm")
+        vvm.noise = noise
+        vvm.readingTime = readingTime
+        self.timings = []
+
+    def model(self, name):
+        """Return the simulated instrument <name> (a key of
+        Instruments.labAddresses), e.g. to change its settings"""
+        return self.rm.models[Instruments.labAddresses[name]]
+
+    def attach(self, bs):
+        """Connect the Beamscanner bs to the simulated instruments, with its
+        clock and theirs set to the virtual clock.  Initialize them as usual
+        with initSG, initVVM and initMSL"""
+        def connect(name):
+            return self.rm.open_resource(Instruments.labAddresses[name])
+        bs.vvm = HP8508A.HP8508A(connect("vvm"))
+        bs.RF = HMCT2240.HMCT2240(connect("rf"))
+        bs.LO = HP83630A.HP83630A(connect("lo"))
+        bs.msl_x = MSL.MSL(connect("msl"), partyName="X")
+        bs.msl_y = MSL.MSL(connect("msl"), partyName="Y")
+        for inst in (bs.vvm, bs.RF, bs.LO, bs.msl_x, bs.msl_y):
+            inst.clock = self.clock
+        bs.clock = self.clock.time
+        return bs
+
+    def elapsed(self):
+        """Return the simulated time in seconds since the simulation started"""
+        return self.clock.time()
+
+    @contextlib.contextmanager
+    def timer(self, label):
+        """Time the enclosed block in simulated and real time, and add it to
+        timings under <label>"""
+        start, realStart = self.clock.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((label, self.clock.time() - start, time.perf_counter() - realStart))
+
+    def report(self, file=None):
+        """Print the simulated and real time of each timer()"""
+        if file is None:
+            file = sys.stdout
+        totals = collections.OrderedDict()
+        for label, simulated, real in self.timings:
+            sim, wall, n = totals.get(label, (0.0, 0.0, 0))
+            totals[label] = (sim + simulated, wall + real, n + 1)
+        print("\nSimulated timings:", file=file)
+        print("    {:30s} {:>6s} {:>12s} {:>10s}".format("", "runs", "simulated s", "real s"), file=file)
+        for label, (simulated, real, n) in totals.items():
+            print("    {:30s} {:6d} {:12.1f} {:10.2f}".format(label, n, simulated, real), file=file)
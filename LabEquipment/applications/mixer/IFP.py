@@ -27,8 +27,8 @@ class IFP(IVP.IVP):
     """An object that can set the frequency of a YIG filter, and measure
     the IF power with either a GPIB connected power meter or an analog power
     signal connected to the bias DAQ unit"""
-    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
-        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose)
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, daq=None):
+        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose, daq=daq)
         self.setConfig(_default_IFP_config.defaultConfig)
 
         if self.vverbose:
@@ -114,7 +114,9 @@ class IFP(IVP.IVP):
     def setYIGFreq(self, freq):
         """Set the YIG frequency to <freq> GHz"""
         if self.yig: # Using YIG driver class
-            self.yig.f = freq*1000.0 # YIG driver class works in MHz
+            # YIG driver class works in MHz.  The readback is checked when the
+            # next frequency is set, so we don't wait for it here.
+            self.yig.setF(freq*1000.0, wait=False)
             time.sleep(self.settleTime)
         else: # Using DAC output
             self.setYIGVoltOut(self.calcYIGBias(freq))
@@ -165,22 +167,40 @@ class IFP(IVP.IVP):
 
     # reuse IVP.getData() etc.
 
+    def sweepPoints(self):
+        """Return the sweep frequencies in GHz, evenly spaced from sweepmin
+        to sweepmax by close to step, so that the last point doesn't
+        overshoot the YIG filter's range
+
+        Overrides sweepPoints from IV object"""
+        npts = int(round((self.sweepmax - self.sweepmin)/self.step)) + 1
+        return np.linspace(self.sweepmin, self.sweepmax, npts)
+
     def prepSweep(self):
-        """Store current YIG filter setting, then reuse IVP.prepSweep()"""
+        """Store current YIG filter setting, then reuse IVP.prepSweep()
+
+        The sweep frequencies are then loaded into the YIG filter driver as a
+        frequency list, so that each point is set with a precomputed hop"""
         self._oldYIGFreq = self.yig.f/1000.0
+        self.yig.clearFreqList()
         super().prepSweep()
+        self.yig.setFreqList(self.SweepPts*1e9, dwell=self.settleTime)
 
     # reuse IVP.runSweep()
 
     def setSweep(self, sweepPt):
         """Override IV setSweep to set YIG frequency instead of bias"""
-        self.setYIGFreq(sweepPt)
+        if self.yig and self.yig.inFreqList(sweepPt*1e9):
+            self.yig.hopFreq(sweepPt*1e9)
+        else:
+            self.setYIGFreq(sweepPt)
 
     def endSweep(self):
         """Sets YIG frequency to initial value to end sweep.
 
         This should be overidden when subclassing IFP.py to create a new sweep
         type"""
+        self.yig.clearFreqList()
         self.setYIGFreq(self._oldYIGFreq)
         if self.verbose:
             print("Sweep is over.  YIG filter reset to {:.3f} GHz.".format(self.yig.f/1000.0))
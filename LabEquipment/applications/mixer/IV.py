@@ -22,18 +22,24 @@ import LabEquipment.drivers.DAQ.DAQ as DAQ
 import matplotlib.pyplot as plt
 
 from LabEquipment.lib import hjsonConfig
+from LabEquipment.lib import instrumentation
 
 from LabEquipment.applications.mixer import _default_IV_config
 
 
 class IV:
-    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, daq=None):
         """Create an IV object that can set a bias via the DAQ, read bias voltages
-        and currents, and run a sweep over bias points."""
+        and currents, and run a sweep over bias points.
+
+        daq can be used to pass in an existing DAQ object, or a stand-in such
+        as an ioTrace replay proxy."""
         self.verbose = verbose or vverbose
         self.vverbose = vverbose
 
-        self.daq = DAQ.DAQ(autoConnect=False, verbose=self.vverbose)
+        if daq is None:
+            daq = DAQ.DAQ(autoConnect=False, verbose=self.vverbose)
+        self.daq = daq
 
         self.config = None
         self.setConfig(_default_IV_config.defaultConfig)
@@ -260,11 +266,20 @@ class IV:
         return (volts - self.iIn_offset) / self.iIn_gain
 
     def sweep(self):
-        """Short cut to prep, run and end the sweep"""
+        """Short cut to prep, run and end the sweep.
+
+        Prints the instrument timing summary at the end of the sweep if timing
+        instrumentation is enabled."""
         self.prepSweep()
         self.runSweep()
         self.endSweep()
+        instrumentation.report()
+
 
+    def sweepPoints(self):
+        """Return the points to sweep over, from sweepmin to sweepmax in
+        steps of step"""
+        return np.arange(self.sweepmin, self.sweepmax+self.step, self.step)
 
     def prepSweep(self):
         """Prepare to run a sweep.
@@ -281,7 +296,7 @@ class IV:
 
         print("Preparing for sweep...")
         # Calculate sweep values
-        self.SweepPts = np.arange(self.sweepmin, self.sweepmax+self.step, self.step)
+        self.SweepPts = self.sweepPoints()
         if self.reverseSweep:
             if self.verbose:
                 print("Flipping SweepPts")
@@ -18,6 +18,7 @@ import pprint
 
 import matplotlib.pyplot as plt
 import LabEquipment.drivers.Instrument.HP436A as PM
+from LabEquipment.drivers.Instrument import ResourceRegistry
 
 from LabEquipment.applications.mixer import _default_IVP_config
 from LabEquipment.applications.mixer import IV
@@ -27,8 +28,8 @@ class IVP(IV.IV):
     """An object that can set and measure the bias on an SIS device, and measure
     the IF power with either a GPIB connected power meter or an analog power
     signal connected to the bias DAQ unit"""
-    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
-        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose)
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, daq=None):
+        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose, daq=daq)
         self.setConfig(_default_IVP_config.defaultConfig)
 
         if self.vverbose:
@@ -78,6 +79,14 @@ class IVP(IV.IV):
                 self.pm_Navg = self.config["power-meter"]["Navg"]
             except KeyError:
                 self.pm_Navg = 3
+            # Settings for "Stream" averaging
+            self.pm_stream = {}
+            for key, arg in (("stream-settle", "streamSettle"), ("stream-rel-error", "streamRelError"),
+                             ("stream-min-samples", "streamMinSamples"), ("stream-max-time", "streamMaxTime")):
+                try:
+                    self.pm_stream[arg] = self.config["power-meter"][key]
+                except KeyError:
+                    pass
         except KeyError:
             try:
                 self.pm_address = None
@@ -104,10 +113,10 @@ class IVP(IV.IV):
             return
 
         try:
-            self.rm = visa.ResourceManager()
-            lr = self.rm.list_resources()
+            # Discovery results and open sessions are shared across the process
+            lr = ResourceRegistry.listResources()
             if pm_address in lr:
-                self.pm = PM.PowerMeter(self.rm.open_resource(pm_address), averaging=self.pm_averaging, Navg=self.pm_Navg)
+                self.pm = PM.PowerMeter(ResourceRegistry.openResource(pm_address), averaging=self.pm_averaging, Navg=self.pm_Navg, **self.pm_stream)
                 self.pm_address = pm_address
                 if self.verbose:
                     print("Power Meter connected on {:}.\n".format(self.pm_address))
@@ -148,7 +157,11 @@ class IVP(IV.IV):
             data = super().getData()
             Vdata = data[self.vIn_channel]
             Idata = data[self.iIn_channel]
-            Pdata = self.pm.getData(rate="I")
+            if self.pm.averaging == "Stream":
+                # Averages free-running readings for as long as the noise needs
+                Pdata = self.pm.getPower()
+            else:
+                Pdata = self.pm.getData(rate="I")
 
         else:
             Vdata, Idata, Pdata = self.getDataAin()
@@ -27,8 +27,8 @@ class IVP_timestream(IVP.IVP):
     """An object that can measure the bias on an SIS device, and measure
     the IF power an analog power signal connected to the bias DAQ unit over
     time"""
-    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
-        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose)
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, daq=None):
+        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose, daq=daq)
         self.setConfig(_default_IVP_timestream_config.defaultConfig)
 
         if self.vverbose:
@@ -22,12 +22,13 @@ import matplotlib.pyplot as plt
 from LabEquipment.applications.mixer import IVP
 from LabEquipment.applications.mixer import _default_IVY_config
 from LabEquipment.applications.mixer import TempSensor
+from LabEquipment.applications.mixer import LoadMover
 
 class IVY(IVP.IVP):
     """An object that can set and measure the bias on an SIS device, and measure
     the IF power for each of two receiver loads."""
-    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
-        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose)
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, daq=None):
+        super().__init__(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose, daq=daq)
         self.setConfig(_default_IVY_config.defaultConfig)
 
         if self.vverbose:
@@ -221,20 +222,17 @@ class IVY(IVP.IVP):
         put the load in the beam and then tell the program that this
         has been done.
 
-        If hotLoadTemp is set to "sensor", this also records the temperature
-        of the load in self.hotLoadSensorTemp.
+        If hotLoadTemp or coldLoadTemp is set to "sensor", this also records
+        the temperature of the load in self.hotLoadSensorTemp or
+        self.coldLoadSensorTemp.
 
         We will assume that position 1 is hot load
         and position 0 is cold load"""
         if self.loadSwitching == "load-mover":
             if position == 1:
                 self.loadMover.loadIn()
-                if self.hotLoadTemp == "sensor":
-                    self.hotLoadSensorTemp = self.hotLoadSensor.getT()
             elif position == 0:
                 self.loadMover.loadOut()
-                if self.coldLoadTemp == "sensor":
-                    self.coldLoadSensorTemp = self.coldLoadSensor.getT()
             else:
                 print("Requested load position not recognized, ignoring.")
         else:
@@ -252,6 +250,13 @@ class IVY(IVP.IVP):
             else:
                 print("Requested load position not recognized, ignoring.")
 
+        # The sensors are polled in the background, so this doesn't wait on
+        # the temperature monitor
+        if position == 1 and self.hotLoadTemp == "sensor":
+            self.hotLoadSensorTemp = self.hotLoadSensor.getT()
+        elif position == 0 and self.coldLoadTemp == "sensor":
+            self.coldLoadSensorTemp = self.coldLoadSensor.getT()
+
     def calcY(self, start=0, end=-1):
         """Calculate the Y factor by dividing Hdata by Cdata
 
@@ -1,7 +1,6 @@
 #! /usr/bin/env python
 #                                                #
-# Analog temperature sensor object and code for  #
-# testing                                        #
+# Load temperature sensor object                 #
 #                                                #
 # Based on code by Larry Gardner, July 2018      #
 # Paul Grimes, January 2019                      #
@@ -10,16 +9,142 @@
 
 from __future__ import print_function, division
 
+import math
 import pprint
-from time import sleep
-from pkg_resources import resource_filename
+import threading
 
-import LabEquipment.drivers.DAQ.DAQ as DAQ
+from LabEquipment.lib import hjsonConfig
+from LabEquipment.drivers.Instrument import Lakeshore218
+from LabEquipment.drivers.Instrument import ResourceRegistry
 from LabEquipment.applications.mixer import _default_TempSensor_config
 
+# LakeshorePollers shared between all TempSensors reading the same Lakeshore,
+# keyed by VISA address
+_pollers = {}
+_pollersLock = threading.Lock()
+
+
+def getPoller(address, rate=1.0, history=3600.0):
+    """Return the running LakeshorePoller for the Lakeshore at <address>,
+    opening it and starting the poller if needed"""
+    with _pollersLock:
+        poller = _pollers.get(address)
+        if poller is None or not poller.is_alive():
+            lakeshore = Lakeshore218.Lakeshore(ResourceRegistry.openResource(address))
+            poller = lakeshore.start_polling(rate=rate, history=history)
+            _pollers[address] = poller
+    return poller
+
+
+def stopPollers():
+    """Stop all the shared LakeshorePollers"""
+    with _pollersLock:
+        for poller in _pollers.values():
+            poller.stop()
+        _pollers.clear()
+
+
 class TempSensor(object):
-    def __init__(self):
-        pass
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
+        """Class for reading a load temperature from a sensor on a Lakeshore 218
+        temperature monitor.
+
+        The Lakeshore is polled in the background, so getT() returns the mean
+        of the recent readings without waiting on the Lakeshore.  If no
+        Lakeshore address is configured, getT() returns the default
+        temperature."""
+        self.verbose = verbose
+        self.vverbose = vverbose
+
+        self.poller = None
+
+        self.config = None
+        self.setConfig(_default_TempSensor_config.defaultConfig)
+
+        if configFile != None:
+            self.readConfig(configFile)
+            if self.vverbose:
+                print("TempSensor.__init__: Config Loaded from: {:s}".format(configFile))
+                pprint.pprint(self.config)
+
+        if config != None:
+            if self.vverbose:
+                print("TempSensor.__init__: Config passed to __init__:")
+                pprint.pprint(config)
+
+            self.setConfig(config)
+
+        if self.vverbose:
+            print("TempSensor.__init__: Done setting configFile and config: Current config:")
+            pprint.pprint(self.config)
+
+        self.initLakeshore()
+
+    def readConfig(self, filename):
+        """Read the .hjson configuration file to set up the TempSensor."""
+        self.configFile = filename
+
+        if self.verbose:
+            print("TempSensor.readConfig: Reading config file: ", self.configFile)
+        newConfig = hjsonConfig.hjsonConfig(filename=filename, verbose=self.vverbose)
+        self.setConfig(newConfig)
+
+    def setConfig(self, config):
+        """Merge a new config into the existing config.
+
+        Called automatically from readFile()"""
+        self.config = hjsonConfig.merge(self.config, config)
+        self._applyConfig()
+
+    def _applyConfig(self):
+        """Apply the configuration to set up the object variables.  Will get
+        called automatically from setConfig"""
+        try:
+            self.address = self.config["lakeshore"]
+            self.sensor = self.config["lakeshore-sensor"]
+            self.pollRate = self.config["poll-rate"]
+            self.averagingTime = self.config["averaging-time"]
+            self.maxAge = self.config["max-age"]
+            self.defaultT = self.config["default-temp"]
+        except KeyError:
+            if self.verbose:
+                print("Got KeyError while applying TempSensor config")
+                pprint.pprint(self.config)
+            raise
+
+    def initLakeshore(self):
+        """Start (or attach to) the background poller for the configured
+        Lakeshore"""
+        if self.address:
+            self.poller = getPoller(self.address, rate=self.pollRate)
+        else:
+            if self.verbose:
+                print("TempSensor: no Lakeshore configured, using default temperature {:.1f} K".format(self.defaultT))
+            self.poller = None
+
     def getT(self):
-        """Return the temperature"""
-        return 292.5
+        """Return the temperature, averaged over the configured averaging time.
+
+        Falls back to the newest reading if none are that recent, and to the
+        default temperature if the poller hasn't read the Lakeshore yet.
+        Raises RuntimeError, from the poller's last error if there is one, if
+        the newest reading is more than maxAge seconds old or reading the
+        Lakeshore has failed from the start"""
+        if self.poller is None:
+            return self.defaultT
+
+        age = self.poller.age()
+        if age is None:
+            if self.poller.error is not None:
+                raise RuntimeError("TempSensor: can't read the Lakeshore at {}".format(self.address)) from self.poller.error
+            if self.verbose:
+                print("TempSensor: no readings yet, using default temperature {:.1f} K".format(self.defaultT))
+            return self.defaultT
+        if age > self.maxAge:
+            raise RuntimeError("TempSensor: newest reading from the Lakeshore at {} is {:.1f} s old".format(
+                self.address, age)) from self.poller.error
+
+        T = self.poller.mean(self.averagingTime, sensor=self.sensor)
+        if math.isnan(T):
+            t, T = self.poller.latest(sensor=self.sensor)
+        return float(T)
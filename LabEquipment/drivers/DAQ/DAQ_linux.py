@@ -18,6 +18,7 @@ from uldaq import *
 from time import sleep
 import numpy as np
 from LabEquipment.lib import hjsonConfig
+from LabEquipment.lib import instrumentation
 
 from . import _default_DAQ_config
 
@@ -285,6 +286,7 @@ class DAQ:
         data = self.AiDevice.a_in(channel, self.AiMode, self.AiRange, AInFlag.DEFAULT)
         return data
 
+    @instrumentation.instrumented("AOut")
     def AOut(self, data, channel=0):
         """Write output analog data to specified channel"""
         if self.daq_device == None:
@@ -293,6 +295,7 @@ class DAQ:
             raise ValueError("channel index must be 0 or positive")
         self.AoDevice.a_out(channel, self.AoRange, AOutFlag.DEFAULT, data)
 
+    @instrumentation.instrumented("DOut")
     def DOut(self, data, channel=0, port=DigitalPortType.FIRSTPORTA):
         """Write output digital data to specified channel"""
         # Configure port
@@ -301,6 +304,7 @@ class DAQ:
         # Writes output for bit
         self.DioDevice.d_bit_out(port, channel, data)
 
+    @instrumentation.instrumented("AInScan")
     def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time = None):
         """Runs a scan across multiple channels, with multiple samples per channel.  Returns a numpy array of
         shape (samples_per_channel, channel_count)"""
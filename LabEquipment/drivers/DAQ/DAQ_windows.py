@@ -26,6 +26,7 @@ from time import sleep
 import numpy as np
 import ctypes
 from LabEquipment.lib import hjsonConfig
+from LabEquipment.lib import instrumentation
 import pprint
 
 from . import _default_DAQ_config
@@ -324,6 +325,7 @@ class DAQ:
         data = v_in(self.boardnum, channel, self.AiRange)
         return data
 
+    @instrumentation.instrumented("AOut")
     def AOut(self, data, channel=0):
         """Write output analog data to the specified channel.  Value is in volts"""
         if self.daq_device == None:
@@ -334,6 +336,7 @@ class DAQ:
         # Write output analog data to specified channel
         v_out(self.boardnum, channel, self.AoRange, data)
 
+    @instrumentation.instrumented("DOut")
     def DOut(self, data, channel=0, port=None):
         """Write output digital data to specified channel.
 
@@ -360,6 +363,7 @@ class DAQ:
         # Writes output for bit
         d_bit_out(self.boardnum, port_info.type, channel, data)
 
+    @instrumentation.instrumented("AInScan")
     def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time = None):
         """Runs a scan across multiple channels, with multiple samples per channel.  Returns a numpy array of
         shape (samples_per_channel, channel_count)"""
@@ -5,9 +5,15 @@
 # Module to operate the Agilent E8257D Synthesizer using PyVisa and GPIB.
 #
 from ..Instrument import Instrument
+from . import ListSweep
 
-class AgilentE8257D(object):
+class AgilentE8257D(Instrument.Instrument, ListSweep.ListSweep):
     """Class for communicating with an Agilent E8257D Synthesizer"""
+    # List sweep settings (see ListSweep)
+    listModeCmds = ("LIST:TYPE LIST", "FREQ:MODE LIST")
+    listMaxPoints = 1601
+    listSettleTime = 0.015
+
     def __init__(self, resource):
         """Signal Generator object for a Agilent E8257D froma a PyVisa resource."""
         super().__init__(resource)
@@ -17,23 +23,23 @@ class AgilentE8257D(object):
 
     def getFreq(self):
         """Return the current frequency of the synth"""
-        freq = float(self.inst.query("FREQ?"))
+        freq = float(self.query("FREQ?"))
 
         return freq
 
     def setFreq(self, freq):
         """Set the frequency of the synth"""
-        self.write("FREQ {:}.10g}".format(freq))
+        self.write("FREQ {:.10g}".format(freq))
 
     def getPower(self):
         """Return the current amplitude of the synth in dBm"""
-        amp = self.query("SOUR:POW?")
+        amp = float(self.query("SOUR:POW?"))
 
         return amp
 
     def setPower(self, power):
         """Set the amplitude of the synth in dBm"""
-        self.write("SOUR:POW {:g)".format(power))
+        self.write("SOUR:POW {:g}".format(power))
 
     def setExtRefAuto(self):
         """Set the synth to use the external 10 MHz reference"""
@@ -53,4 +59,4 @@ class AgilentE8257D(object):
 
     def setRFOutput(self, state):
         """Set the RF Output to either On (1) of Off (0)"""
-        self.write("OUTP:STAT {:b}".format(state))
+        self.write("OUTP:STAT {:d}".format(int(state)))
@@ -0,0 +1,125 @@
+# AsyncInstrument.py
+#
+# asyncio wrappers for the synchronous instrument drivers, so that a single
+# event loop can drive several instruments concurrently.
+#
+# e.g.
+#     vvm = AsyncInstrument(HP8508A.HP8508A(rm.open_resource("GPIB0::8::INSTR")))
+#     pm = AsyncInstrument(HP436A.PowerMeter(rm.open_resource("GPIB0::13::INSTR")))
+#     trans, power = await asyncio.gather(vvm.getTransmission(), pm.getPower())
+#
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads shared by all AsyncInstruments.  Instruments are mostly
+# waiting on their bus, so a handful of threads is plenty.
+_executor = None
+_executorLock = threading.Lock()
+
+# Locks serializing access to each underlying resource.  Instruments that
+# share a bus (e.g. the X and Y MSL stages on one serial port) share a lock.
+_resourceLocks = {}
+
+
+def getExecutor():
+    """Return the thread pool used to run blocking driver calls"""
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="AsyncInstrument")
+    return _executor
+
+
+def resourceLock(instrument):
+    """Return the lock shared by all drivers talking to the same resource as
+    <instrument>"""
+    try:
+        key = instrument.resource.resource_name
+    except AttributeError:
+        key = id(instrument)
+    with _executorLock:
+        lock = _resourceLocks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _resourceLocks[key] = lock
+    return lock
+
+
+class AsyncInstrument(object):
+    """Wrap a synchronous instrument driver so that its methods can be
+    awaited from an asyncio event loop.
+
+    Any method of the wrapped driver can be called as a coroutine, e.g.
+    await avvm.getTransmission().  Calls are run in a worker thread, and calls
+    to drivers sharing a resource are serialized.  Non-callable attributes
+    are returned directly from the wrapped driver.
+
+    The wrapped driver is still available as .instrument, and its
+    synchronous methods can be used as before when no loop is running."""
+    def __init__(self, instrument, lock=None, executor=None):
+        self.instrument = instrument
+        if lock is None:
+            lock = resourceLock(instrument)
+        self.lock = lock
+        self.executor = executor
+
+    def _locked(self, func, args, kwargs):
+        with self.lock:
+            return func(*args, **kwargs)
+
+    async def call(self, name, *args, **kwargs):
+        """Call the driver method <name> with args in a worker thread and
+        return its result"""
+        func = getattr(self.instrument, name)
+        loop = asyncio.get_running_loop()
+        executor = self.executor or getExecutor()
+        return await loop.run_in_executor(executor, self._locked, func, args, kwargs)
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the AsyncInstrument itself
+        attr = getattr(self.instrument, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    async def write(self, *args, **kwargs):
+        """Writes a command string to the instrument"""
+        return await self.call("write", *args, **kwargs)
+
+    async def read(self, *args, **kwargs):
+        """Reads a string from the instrument"""
+        return await self.call("read", *args, **kwargs)
+
+    async def query(self, *args, **kwargs):
+        """Writes a command string to the instrument and reads the response"""
+        return await self.call("query", *args, **kwargs)
+
+    async def pollUntil(self, name, done, *args, interval=0.01, timeout=None):
+        """Call the driver method <name> with args every <interval> seconds
+        until done(result) is True, yielding to the event loop in between.
+
+        Returns the final result.  Raises asyncio.TimeoutError if timeout
+        seconds pass first."""
+        async def poll():
+            while True:
+                result = await self.call(name, *args)
+                if done(result):
+                    return result
+                await asyncio.sleep(interval)
+        return await asyncio.wait_for(poll(), timeout)
+
+    async def hold(self, interval=0.01, timeout=None):
+        """Wait until a stage driver (e.g. MSL) reports that motion has
+        stopped, without blocking the event loop"""
+        await self.pollUntil("isMoving", lambda moving: moving != "1", interval=interval, timeout=timeout)
+
+    async def sweep(self, timeout=None):
+        """Run a single sweep on a spectrum analyzer driver (e.g. HP8562A) and
+        wait for it to complete, without blocking the event loop"""
+        return await self.call("sweep", True, timeout)
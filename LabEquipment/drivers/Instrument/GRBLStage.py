@@ -9,6 +9,8 @@ import numpy as np
 
 from gerbil.gerbil import Gerbil
 
+from ..Instrument import Instrument
+
 class GRBLStage(object):
     ''' Class for communicating with a GRBL based X-Y stage, using the Gerbil
     module.'''
@@ -159,11 +161,14 @@ class GRBLStage(object):
         return self.resource.cmode in self._active_states
         
 
-    def block_while_moving(self):
+    def block_while_moving(self, timeout=None):
         'Holds instruction till motion has stopped'
+        # Give Gerbil a chance to poll the new state after the move command
         time.sleep(self.resource.poll_interval*1.5)
-        while self.is_moving():
-            time.sleep(self.resource.poll_interval)
+        # The state is only updated every poll_interval, so there's no point
+        # checking more often than that
+        Instrument.pollUntil(self.is_moving, lambda moving: not moving, timeout=timeout,
+                             interval=self.resource.poll_interval/4, maxInterval=self.resource.poll_interval)
 
     def zero(self, blocking=True):
         'Go to the zero position'
@@ -1,7 +1,10 @@
 from ..Instrument import Instrument
+from . import ListSweep
 
-class HMCT2240(Instrument.Instrument):
+class HMCT2240(Instrument.Instrument, ListSweep.ListSweep):
     """Class for communicating with an HMC-T2240 signal generator"""
+    # List sweep settings (see ListSweep)
+    listSettleTime = 0.01
 
     def __init__(self, resource):
         """Create Signal Generator object for a HMC-T2240 froma a PyVisa resource."""
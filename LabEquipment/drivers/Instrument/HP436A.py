@@ -2,16 +2,28 @@
 # Paul Grimes, May 2018
 
 from ..Instrument import Instrument
+from LabEquipment.lib import ringBuffer
+import math
+import threading
 import time
 import statistics
 
 class PowerMeter(Instrument.Instrument):
-    def __init__(self, resource, range="9", mode="A", averaging="None", rate="V", calFactor="+", Navg=3):
+    def __init__(self, resource, range="9", mode="A", averaging="None", rate="V", calFactor="+", Navg=3,
+                 streamSettle=0.05, streamRelError=0.01, streamMinSamples=3, streamMaxTime=2.0):
         """Create Spectrum Analyzer object from a PyVISA resource:
         rm = pyvisa.ResourceManager()
         pm = PowerMeter(rm.open_resource("GPIB0::13::INST"))
 
-        InstAddr is the address of the spectrum analyzer - try "GPIB0::13::INST" by default"""
+        InstAddr is the address of the spectrum analyzer - try "GPIB0::13::INST" by default
+
+        In "Stream" averaging mode, the meter is left free-running and read
+        by a background thread.  getPower() then averages the readings taken
+        more than streamSettle seconds after it is called, until the standard
+        error of the mean is below streamRelError of the mean (with at least
+        streamMinSamples readings), or streamMaxTime seconds have passed.  In
+        the dB modes, the relative error is that of the power in Watts, i.e.
+        10*log10(1 + streamRelError) dB."""
         self.resource = resource
 
         # Set up the connection.
@@ -29,10 +41,15 @@ class PowerMeter(Instrument.Instrument):
         self._calFactors = ["+", "-"]
         self.calFactor = calFactor
         self._statuses = {"P":"Data Valid", "Q":"Watts, under range", "R":"Over range", "S":"dB, under range", "T":"Auto zero under range, 1", "U":"Auto zero under range, 2-5", "V":"Auto zero over range"}
-        self._averagingModes = ['None', 'Mean', 'Settle']
+        self._averagingModes = ['None', 'Mean', 'Settle', 'Stream']
+        self.stream = None
         self.averaging = averaging
         self.readSleep = 0.15
         self.Navg = Navg
+        self.streamSettle = streamSettle
+        self.streamRelError = streamRelError
+        self.streamMinSamples = streamMinSamples
+        self.streamMaxTime = streamMaxTime
 
     @property
     def idn(self):
@@ -94,6 +111,8 @@ class PowerMeter(Instrument.Instrument):
         if averaging == None:
             averaging = "None"
         assert averaging in self._averagingModes, "HP436A: Tried to set invalid averaging mode"
+        if averaging != "Stream":
+            self.stopStream()
         self._averaging = averaging
 
     def getDataStr(self, range="9", mode="A", calFactor="+", rate="V"):
@@ -119,7 +138,7 @@ class PowerMeter(Instrument.Instrument):
         #   R : Free-run at maximum rate
         #   V : Free-run with settling timeout
 
-        return self.resource.query("{}{}{}{}".format(range, mode, calFactor, rate))
+        return self.query("{}{}{}{}".format(range, mode, calFactor, rate))
 
     def unpackDataStr(self, dataStr):
         """Unpack the data string, returning the value in whatever mode we're in"""
@@ -157,7 +176,7 @@ class PowerMeter(Instrument.Instrument):
         else:
             raise ValueError("Got wrong sign character from Power Meter - {}".format(sign))
 
-        value = s*float(dataStr[3:12])
+        value = s*float(dataStr[4:12])
 
         return value
 
@@ -207,6 +226,9 @@ class PowerMeter(Instrument.Instrument):
                 else:
                     return ((d1+d3)*0.5)
 
+        elif self._averaging == "Stream":
+            return self.getStreamPower()
+
         elif self._averaging == "Mean":
             data = []
             for i in range(self.Navg):
@@ -216,6 +238,100 @@ class PowerMeter(Instrument.Instrument):
         else: # self._averaging == "None":
             return self.getData(range=self.range, mode=self.mode, calFactor=self.calFactor, rate=self.rate)
 
+    def close(self):
+        """Stop any background reading and close the connection"""
+        self.stopStream()
+        self.resource.close()
+
+    def startStream(self, history=4096):
+        """Put the meter into free-run and start reading it in the background.
+
+        While the stream is running, nothing else should talk to the meter"""
+        if self.stream is None or not self.stream.is_alive():
+            self.stream = PowerMeterStream(self, history=history)
+            self.stream.start()
+        return self.stream
+
+    def stopStream(self):
+        """Stop reading the meter in the background"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+
+    def getStreamPower(self, since=None):
+        """Return the mean of the free-running readings taken after
+        <since> (default: now) plus streamSettle seconds, waiting for as many
+        readings as are needed to reach streamRelError (see __init__)"""
+        stream = self.startStream()
+        if since is None:
+            since = time.time()
+        start = since + self.streamSettle
+        deadline = start + self.streamMaxTime
+        # A dB reading can be near 0 at any power, so in the dB modes the
+        # relative error is a fixed error in dB
+        dBError = None if self.mode == "A" else 10*math.log10(1 + self.streamRelError)
+
+        with stream.newReading:
+            while True:
+                t, values = stream.buffer.window()
+                values = values[t >= start, 0]
+                n = len(values)
+                if n >= max(self.streamMinSamples, 2):
+                    mean = values.mean()
+                    stdErr = values.std(ddof=1)/math.sqrt(n)
+                    if stdErr <= (self.streamRelError*abs(mean) if dBError is None else dBError):
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                if stream.error is not None and not stream.is_alive():
+                    raise stream.error
+                stream.newReading.wait(remaining)
+
+        self.samples = n
+        if n == 0:
+            raise RuntimeError("HP436A: No valid readings within {:g} s".format(self.streamMaxTime))
+        return values.mean()
+
+
+class PowerMeterStream(threading.Thread):
+    """Background thread reading a free-running HP436A into a RingBuffer of
+    timestamped readings.  Only readings with valid status are stored.
+
+    Waiters on the newReading condition are notified after each reading."""
+    def __init__(self, pm, history=4096):
+        super().__init__(daemon=True)
+        self.pm = pm
+        self.buffer = ringBuffer.RingBuffer(history, width=1)
+        self.newReading = threading.Condition()
+        # The last exception raised while reading, if any
+        self.error = None
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        pm = self.pm
+        # The program code only needs sending once, after which each read
+        # returns the latest reading
+        pm.write("{}{}{}R".format(pm.range, pm.mode, pm.calFactor))
+        while not self._stopEvent.is_set():
+            try:
+                value = pm.unpackDataStr(pm.read())
+                self.error = None
+            except Exception as err:
+                self.error = err
+                self._stopEvent.wait(0.1)
+                continue
+            if pm.status == "Data Valid":
+                with self.newReading:
+                    self.buffer.append(time.time(), value)
+                    self.newReading.notify_all()
+
+    def stop(self):
+        """Stop reading and wait for the thread to finish"""
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
+
 if __name__ == "__main__":
     import visa
     rm = visa.ResourceManager()
@@ -5,15 +5,26 @@
 # Module to operate the HP 83630A Synthesizer using PyVisa and GPIB.
 #
 from ..Instrument import Instrument
+from . import ListSweep
+
+class HP83630A(Instrument.Instrument, ListSweep.ListSweep):
+    """Class for communicating with an HP 83630A Synthesizer
+
+    In list mode the power list holds power offsets in dB from the CW power
+    setting, not absolute powers"""
+    # List sweep settings (see ListSweep)
+    listPowerCmd = "LIST:POW:CORR"
+    listPowerModeCmds = ()
+    cwPowerModeCmds = ()
+    listMaxPoints = 801
+    listSettleTime = 0.05
 
-class HP83630A(Instrument.Instrument):
-    """Class for communicating with an HP 83630A Synthesizer"""
     def __init__(self, resource, strict=False, idString="83630A"):
         """Create Synthesizer object.
 
         InstAddr is the PyVisa address of the Synthesizer - try "GPIB::19" by default in the lab"""
 
-        super().__init__(resource, strict, idString)
+        super().__init__(resource)
         
         self.resource.read_termination = '\n'
         self.resource.write_termination = '\r\n'
@@ -61,7 +72,8 @@ class HP83630A(Instrument.Instrument):
         self.setFreqMode("sweep")
         
     def setList(self):
-        """Set source to LIST mode"""
+        """Set source to LIST mode.  See ListSweep for building and
+        triggering lists"""
         self.setFreqMode("list")
 
     def getFreq(self):
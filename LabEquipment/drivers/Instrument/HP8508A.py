@@ -5,6 +5,24 @@ def dBdeg2complex(amp, phase):
     """Convert amplitude in dB and phase in degrees to cartesian complex number"""
     return np.power(10.0, amp/20) * np.exp(1j*np.deg2rad(phase))
 
+def lindeg2complex(amp, phase):
+    """Convert amplitude in volts and phase in degrees to cartesian complex number"""
+    return amp * np.exp(1j*np.deg2rad(phase))
+
+def parseValues(datastr):
+    """Parse a string of comma and/or semicolon separated readings into a flat
+    numpy array of floats"""
+    return np.array(datastr.replace(";", ",").split(","), dtype=float)
+
+# Functions converting flat arrays of (amp, phase) or (real, imag) pairs to
+# complex transmission, by output format
+transmissionParsers = {
+    "LOGARITHMIC,POLAR": lambda v: dBdeg2complex(v[0::2], v[1::2]),
+    "LINEAR,POLAR": lambda v: lindeg2complex(v[0::2], v[1::2]),
+    "LOGARITHMIC,RECTANGULAR": lambda v: v[0::2] + 1j*v[1::2],
+    "LINEAR,RECTANGULAR": lambda v: v[0::2] + 1j*v[1::2],
+}
+
 class HP8508A(Instrument.Instrument):
     '''Class for communicating with an HP 8508A Vector Voltmeter'''
     def __init__(self, resource, strict=False, idString="8508A-050"):
@@ -87,7 +105,9 @@ class HP8508A(Instrument.Instrument):
 
     def getFormat(self):
         '''Return the current output format of the VVM'''
-        self.format = self.query("FORMAT?")
+        self.format = self.query("FORMAT?").strip()
+        # Look up the parser for transmission data once, rather than per reading
+        self._transParser = transmissionParsers.get(self.format)
 
         return self.format
 
@@ -121,23 +141,20 @@ class HP8508A(Instrument.Instrument):
         self.write("*TRG")
         self.triggered = True
 
+    def recover(self):
+        '''Clear the VVM after a failed reading, so that the next reading is
+        triggered afresh'''
+        super().recover()
+        self.triggered = False
+
 
     def getTransmission(self):
         '''Return the data from the VVM'''
-        # TODO: Get the correct "format" strings to allow parsing of datastr
-
         # Get the data
         datastr = self.getData("TRANSMISSION")
 
-        if self.format == "LOGARITHMIC,POLAR" or self.format == "LINEAR,POLAR":
-            amp = float(datastr.split(",")[0])
-            phase = float(datastr.split(",")[1])
-            data = dBdeg2complex(amp, phase)
-
-        elif self.format == "LINEAR,RECTANGULAR" or self.format == "LOGARITHMIC,RECTANGULAR":
-            x = float(datastr.split(",")[0])
-            y = float(datastr.split(",")[1])
-            data = complex(x, y)
+        if self._transParser is not None:
+            data = self._transParser(parseValues(datastr))[0]
 
         else: # Unknown format, probably single valued
             try:
@@ -147,6 +164,17 @@ class HP8508A(Instrument.Instrument):
                 data = datastr
         return data
 
+    def getTransmissionBurst(self, count):
+        '''Return <count> transmission readings from the VVM as a complex numpy
+        array, read in a single transaction'''
+        if self._transParser is None:
+            raise ValueError("HP8508A: Can't parse transmission data in format {}".format(self.format))
+        return self._transParser(self.getDataArray("TRANSMISSION", count).ravel())
+
+    def getPowers(self):
+        '''Return the A and B powers from the VVM, read in a single query'''
+        apow, bpow = self.getDataArray("APOW,BPOW")[0]
+        return float(apow), float(bpow)
 
     def getUnits(self):
         ''' Returns units for format types'''
@@ -214,3 +242,32 @@ class HP8508A(Instrument.Instrument):
         #         data = datastr
 
         return datastr
+
+    def burstQuery(self, meas, count):
+        '''Build the message requesting <count> readings of <meas> in one
+        transaction.  Each reading is bus triggered if the trigger source is
+        BUS, otherwise readings are taken free-running or on external triggers'''
+        if self.triggersource == "BUS":
+            reading = "*TRG;MEAS? {:s}".format(meas)
+        else:
+            reading = "MEAS? {:s}".format(meas)
+        if self.triggered:
+            # The first reading has already been triggered
+            return ";".join(["MEAS? {:s}".format(meas)] + [reading]*(count-1))
+        return ";".join([reading]*count)
+
+    def getDataArray(self, meas=None, count=1):
+        '''Return <count> readings of the requested measurement(s) as a numpy
+        array of shape (count, values per reading), read in a single transaction.
+
+        <meas> is as for getData()'''
+        if meas==None:
+            if self.mode != "UNKNOWN":
+                meas = self.mode
+            else:
+                meas = "APOW"
+
+        datastr = self.query(self.burstQuery(meas, count))
+        self.triggered = False
+
+        return parseValues(datastr).reshape(count, -1)
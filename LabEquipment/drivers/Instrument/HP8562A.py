@@ -153,17 +153,17 @@ class SpecA(Instrument.Instrument):
         return self.vbw
 
 
-    def sweep(self, wait=True):
-        """Runs a single sweep and waits until complete if wait==True"""
+    def sweep(self, wait=True, timeout=None):
+        """Runs a single sweep and waits until complete if wait==True
+
+        DONE? isn't answered until the preceding TS has finished, so the wait
+        returns as soon as the sweep completes, without polling"""
         self.write("TS")
 
         self.sweepRun = False
 
         if wait:
-                while self.sweepRun == False:
-                        time.sleep(self.traceSleep)
-                        if self.query("DONE?") == "1\n":
-                                break
+            self.waitOPC(timeout, query="DONE?")
 
         self.sweepRun = True
         return self.sweepRun
@@ -1,23 +1,143 @@
+import time
+
+from LabEquipment.lib import instrumentation
+
+
+def pollUntil(poll, done=bool, timeout=None, interval=0.001, maxInterval=0.1, backoff=1.5, clock=None):
+    """Call poll() until done(result) is True, and return the final result.
+
+    The wait between polls starts at <interval> seconds and grows by a factor
+    of <backoff> up to <maxInterval>, so short waits finish quickly without
+    flooding the bus during long ones.  Raises TimeoutError if timeout
+    seconds pass first.  clock provides time() and sleep() (default: real
+    time)"""
+    now = time.perf_counter if clock is None else clock.time
+    sleep = time.sleep if clock is None else clock.sleep
+    if timeout is not None:
+        deadline = now() + timeout
+    while True:
+        result = poll()
+        if done(result):
+            return result
+        if timeout is not None:
+            remaining = deadline - now()
+            if remaining <= 0:
+                raise TimeoutError("pollUntil: timed out after {:g} s".format(timeout))
+            sleep(min(interval, remaining))
+        else:
+            sleep(interval)
+        interval = min(interval*backoff, maxInterval)
+
+
 class Instrument(object):
     """Base class for pyvisa based instruments
 
     Encapsulates the pyvisa resource, and provides basic communications
     functions which can be used to implement instrument specific functions"""
+    # Initial and maximum intervals in seconds used by waitFor when polling
+    pollInterval = 0.001
+    maxPollInterval = 0.1
+
+    # RetryPolicy used by retry(), or None to call once without retrying
+    retryPolicy = None
+
+    # Clock providing time() and sleep() for waits (e.g. a simulated clock), or None for real time
+    clock = None
+
     def __init__(self, resource):
         self.resource = resource
 
+    def instrumentationName(self):
+        """Name used to identify this instrument in timing reports"""
+        try:
+            return "{}({})".format(type(self).__name__, self.resource.resource_name)
+        except AttributeError:
+            return type(self).__name__
+
     def write(self, *args, **kwargs):
         """Writes a command string to the instrument"""
-        return self.resource.write(*args, **kwargs)
+        if instrumentation.hook is None:
+            return self.resource.write(*args, **kwargs)
+        return instrumentation.timed(self.instrumentationName(), "write", self.resource.write, *args, **kwargs)
 
     def read(self, *args, **kwargs):
         """Reads a string from the instrument"""
-        return self.resource.read(*args, **kwargs)
+        if instrumentation.hook is None:
+            return self.resource.read(*args, **kwargs)
+        return instrumentation.timed(self.instrumentationName(), "read", self.resource.read, *args, **kwargs)
 
     def query(self, *args, **kwargs):
         """Writes a command string to the instrument and reads the response"""
-        return self.resource.query(*args, **kwargs)
+        if instrumentation.hook is None:
+            return self.resource.query(*args, **kwargs)
+        return instrumentation.timed(self.instrumentationName(), "query", self.resource.query, *args, **kwargs)
+
+    def query_binary_values(self, *args, **kwargs):
+        """Writes a command string to the instrument and reads a block of
+        binary values in response"""
+        if instrumentation.hook is None:
+            return self.resource.query_binary_values(*args, **kwargs)
+        return instrumentation.timed(self.instrumentationName(), "query_binary_values", self.resource.query_binary_values, *args, **kwargs)
 
     def idn(self):
         """Read the return value from the semi-standard "*IDN?" VISA command"""
         return self.query("*IDN?")
+
+    def retry(self, key, func, *args, **kwargs):
+        """Call func(*args, **kwargs) under the instrument's retryPolicy, with
+        the latency and failures of the calls tracked under <key>"""
+        if self.retryPolicy is None:
+            return func(*args, **kwargs)
+        return self.retryPolicy.call(self, key, func, *args, **kwargs)
+
+    def recover(self):
+        """Bring the instrument back to a known state after a failed
+        transaction, before it is retried.  Clears the device so that any
+        late reply is discarded"""
+        clear = getattr(self.resource, "clear", None)
+        if clear is not None:
+            clear()
+
+    def waitFor(self, poll, done=bool, timeout=None, interval=None, maxInterval=None):
+        """Call poll() with increasing intervals until done(result) is True,
+        and return the final result.  See pollUntil"""
+        if interval is None:
+            interval = self.pollInterval
+        if maxInterval is None:
+            maxInterval = self.maxPollInterval
+        return pollUntil(poll, done, timeout=timeout, interval=interval, maxInterval=maxInterval, clock=self.clock)
+
+    def now(self):
+        """Return the time in seconds on the instrument's clock"""
+        return time.perf_counter() if self.clock is None else self.clock.time()
+
+    def sleep(self, seconds):
+        """Wait for <seconds> on the instrument's clock"""
+        if self.clock is None:
+            time.sleep(seconds)
+        else:
+            self.clock.sleep(seconds)
+
+    def waitOPC(self, timeout=None, query="*OPC?"):
+        """Wait for all pending operations to complete, using a query that the
+        instrument only answers once they have (by default "*OPC?").
+
+        The VISA timeout is raised to <timeout> seconds (or no timeout if
+        None) while waiting.  Returns the response"""
+        oldTimeout = self.resource.timeout
+        self.resource.timeout = None if timeout is None else int(timeout*1000)
+        try:
+            return self.query(query)
+        finally:
+            self.resource.timeout = oldTimeout
+
+    def waitSRQ(self, timeout=None):
+        """Wait for the instrument to request service, and return its status
+        byte.  Uses the VISA service request event where the interface has
+        one (e.g. GPIB), otherwise polls the status byte"""
+        try:
+            wait = self.resource.wait_for_srq
+        except AttributeError:
+            return self.waitFor(lambda: self.resource.stb, lambda stb: stb & 64, timeout=timeout)
+        wait(None if timeout is None else int(timeout*1000))
+        return self.resource.stb
@@ -1,55 +1,62 @@
 # Lakeshore 218 Temperature Monitor module
 # Paul Grimes, Sept. 2008, June 2018
+import os
+import threading
+import time
+
+import numpy as np
+
 from ..Instrument import Instrument
+from LabEquipment.lib import ringBuffer
 
-class Lakeshore(Instrument):
+class Lakeshore(Instrument.Instrument):
     def __init__(self, resource):
         """Create Lakeshore Temperature Monitor object from a PyVisa resource"""
         super().__init__(resource)
 
+        # Maximum length of a command line, used when combining queries
+        self.maxMessageLength = 64
+
     ### Device specific Visa commands that wrap around the above generic commands
-    def get_temp_log(self, outfilename, sensor_list):
+    def get_temp_log(self, outfilename, sensor_list, cachefile=None, verbose=False):
         """ Get an entire temperature log off the lakeshore:
         Takes output text filename and  python list of sensors to read from
         Dumps output (in ohms, Kelvin or whatever) into a space seperated
-        text file"""
-
+        text file
 
-        last_log=int(self.query("LOGNUM?"))
-        print("Last log was {:d}".format(last_log))
+        If cachefile is given, only records not already in the cache are read
+        from the lakeshore (see sync_log)"""
+        if cachefile:
+            log = self.sync_log(cachefile)
+        else:
+            log = self.get_log_array()
+        if verbose:
+            print("Last log was {:d}".format(len(log)))
 
         f=open(outfilename,'w')
-
-        for i in range(1,last_log+1):
-            print("fetching record {:d}".format(i))
-            output_string=""
-            log_str=self.query("LOGVIEW? {:d} 1".format(i))
-            log_list=log_str.split(",")
-            output_string += (log_list[0]+" "+log_list[1])
+        for rec in log:
+            output_string = rec["date"]+" "+rec["time"]
             for j in sensor_list:
-                log_str=self.query("LOGVIEW? {:d} {:d}".format(i,j))
-                log_list=log_str.split(",")
-                output_string +=(log_list[2]+" ")
-
+                output_string += " {:g}".format(rec["value"][j-1])
             f.write(output_string+"\n")
-            print(output_string)
-        f.close
-        print("...done")
+        f.close()
+        if verbose:
+            print("...done")
 
 
-    def get_log(self):
+    def get_log(self, cachefile=None):
         """Read the logged data to a python list of readings.
         This functions checks to see which sensors are active, and which
         units are in use.
         This header data is included in position 0 of the list of readings,
-        and should be treated as a file header"""
+        and should be treated as a file header
+
+        If cachefile is given, only records not already in the cache are read
+        from the lakeshore (see sync_log)"""
 
         # Get number of log readings per record
         readings = self.get_logreadings()
 
-        # Get number of log records
-        records = self.get_lognum()
-
         # Set up the header, getting the input and units for each log record
         logsetup = []
         for i in range(1, readings+1):
@@ -60,16 +67,104 @@ class Lakeshore(Instrument):
         for r in logsetup:
             logheader.append("T{:d} ({:s})".format(r[0], r[1]))
 
+        # Read the log
+        if cachefile:
+            records = self.sync_log(cachefile)
+        else:
+            records = self.get_log_array(readings=readings)
 
-        # Start reading the log
         log = [logheader]
+        for rec in records:
+            log.append([rec["date"]+","+rec["time"]] + list(rec["value"]))
+
+        return log
+
 
-        for record in range(1, records+1):
-            logrecord = [self.get_logdatetime(record)]
-            for reading in range(1, readings+1):
-                logrecord.append(self.get_logvalue(record, reading))
+    def log_dtype(self, readings):
+        """Return the numpy structured dtype used for log records with
+        <readings> readings per record"""
+        return np.dtype([("record", "i4"), ("date", "U8"), ("time", "U8"),
+                         ("value", "f8", (readings,)), ("status", "i2", (readings,))])
+
+    def query_many(self, queries):
+        """Send a list of queries, combining as many as fit in each command
+        line, and return the list of responses"""
+        responses = []
+        message = []
+        length = 0
+        for q in queries:
+            if message and length + len(q) + 1 > self.maxMessageLength:
+                responses.extend(self.query(";".join(message)).strip().split(";"))
+                message = []
+                length = 0
+            message.append(q)
+            length += len(q) + 1
+        if message:
+            responses.extend(self.query(";".join(message)).strip().split(";"))
+        return responses
+
+    def get_log_array(self, first=1, last=None, readings=None):
+        """Read log records <first> to <last> (default: the last record) into a
+        numpy structured array with fields record, date, time, value and
+        status.  value and status hold one entry per reading.
+
+        Queries for many readings are combined into each command line."""
+        if readings is None:
+            readings = self.get_logreadings()
+        if last is None:
+            last = self.get_lognum()
+
+        nrec = max(last - first + 1, 0)
+        log = np.zeros(nrec, dtype=self.log_dtype(readings))
+        if nrec == 0:
+            return log
+
+        queries = ["LOGVIEW? {:d} {:d}".format(record, reading)
+                   for record in range(first, last+1)
+                   for reading in range(1, readings+1)]
+        fields = [r.split(",") for r in self.query_many(queries)]
+
+        log["record"] = np.arange(first, last+1)
+        log["date"] = [f[0].strip() for f in fields[::readings]]
+        log["time"] = [f[1].strip() for f in fields[::readings]]
+        log["value"] = np.array([f[2] for f in fields], dtype=float).reshape(nrec, readings)
+        if all(len(f) > 3 for f in fields):
+            log["status"] = np.array([f[3] for f in fields], dtype=int).reshape(nrec, readings)
 
-            log.append(logrecord)
+        return log
+
+    def sync_log(self, cachefile):
+        """Bring the local cache of the log in <cachefile> up to date and return
+        the complete log as a structured array (see get_log_array).
+
+        Only records newer than the last cached record are read from the
+        lakeshore, unless the log on the lakeshore has been restarted since
+        the cache was written, in which case the whole log is read again."""
+        readings = self.get_logreadings()
+        last = self.get_lognum()
+
+        cached = None
+        if os.path.exists(cachefile):
+            with open(cachefile, "rb") as f:
+                cached = np.load(f)
+            if cached.dtype != self.log_dtype(readings) or len(cached) > last:
+                cached = None
+            elif len(cached) > 0:
+                # Check the last cached record hasn't been overwritten
+                lastRec = cached[-1]
+                logview = self.query("LOGVIEW? {:d} 1".format(lastRec["record"])).split(",")
+                if logview[0].strip() != lastRec["date"] or logview[1].strip() != lastRec["time"]:
+                    cached = None
+
+        if cached is None:
+            log = self.get_log_array(1, last, readings)
+        else:
+            log = np.concatenate((cached, self.get_log_array(len(cached)+1, last, readings)))
+
+        tmpfile = cachefile + ".tmp"
+        with open(tmpfile, "wb") as f:
+            np.save(f, log)
+        os.replace(tmpfile, cachefile)
 
         return log
 
@@ -87,7 +182,7 @@ class Lakeshore(Instrument):
 
         datetime = retval.split(",")[0:2]
 
-        return string.join(datetime, ",")
+        return ",".join(datetime)
 
 
     def get_lognum(self):
@@ -161,6 +256,22 @@ class Lakeshore(Instrument):
         return float(reading)
 
 
+    def get_all_temps(self, unit="K"):
+        """Get the current readings from all eight sensors in a single query,
+        in Kelvin ("K") or Celsius ("C").  Returns a numpy array of floats"""
+        reading = self.query("{:s}RDG? 0".format(unit))
+
+        return np.array(reading.split(","), dtype=float)
+
+
+    def start_polling(self, rate=1.0, history=3600.0, unit="K"):
+        """Start a LakeshorePoller reading all sensors <rate> times per second
+        in the background, and return it"""
+        poller = LakeshorePoller(self, rate=rate, history=history, unit=unit)
+        poller.start()
+        return poller
+
+
     def sensor_enabled(self, sensor):
         """Checks whether sensor (int) is enabled, returns Python Boolean"""
 
@@ -208,3 +319,75 @@ class Lakeshore(Instrument):
               f.write(line+"\n")
 
           f.close()
+
+
+class LakeshorePoller(threading.Thread):
+    """Background thread reading all eight sensors of a Lakeshore at a fixed
+    rate into a RingBuffer holding <history> seconds of readings.
+
+    Sensors are numbered 1 to 8 as on the front panel.  None of the methods
+    talk to the Lakeshore, so they can be called from a sweep without
+    waiting on the serial port.  Once started, nothing else should query
+    the Lakeshore until the poller is stopped."""
+    def __init__(self, lakeshore, rate=1.0, history=3600.0, unit="K"):
+        super().__init__(daemon=True)
+        self.lakeshore = lakeshore
+        self.rate = rate
+        self.unit = unit
+        self.buffer = ringBuffer.RingBuffer(int(history*rate)+1, width=8)
+        # The last exception raised while reading, if the last read failed
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        period = 1.0/self.rate
+        next_time = time.time()
+        while not self._stop_event.is_set():
+            try:
+                temps = self.lakeshore.get_all_temps(self.unit)
+                self.buffer.append(time.time(), temps)
+                self.error = None
+            except Exception as err:
+                self.error = err
+            # Don't try to catch up if a read took longer than the period
+            next_time = max(next_time + period, time.time())
+            self._stop_event.wait(next_time - time.time())
+
+    def stop(self):
+        """Stop polling and wait for the thread to finish"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def age(self):
+        """Return the time in seconds since the newest reading, or None before
+        the first reading"""
+        t, temps = self.buffer.latest()
+        if t is None:
+            return None
+        return time.time() - t
+
+    def latest(self, sensor=None):
+        """Return (time, reading) for the newest reading of sensor, or of all
+        sensors if sensor is None.  Returns (None, None) before the first
+        reading"""
+        t, temps = self.buffer.latest()
+        if t is None or sensor is None:
+            return t, temps
+        return t, temps[sensor-1]
+
+    def window(self, seconds, sensor=None):
+        """Return arrays of times and readings from the last <seconds> seconds,
+        for sensor or for all sensors if sensor is None"""
+        t, temps = self.buffer.window(seconds, now=time.time())
+        if sensor is None:
+            return t, temps
+        return t, temps[:, sensor-1]
+
+    def mean(self, seconds, sensor=None):
+        """Return the mean reading over the last <seconds> seconds, for sensor
+        or for all sensors if sensor is None.  NaN if there are no readings"""
+        temps = self.buffer.mean(seconds, now=time.time())
+        if sensor is None:
+            return temps
+        return temps[sensor-1]
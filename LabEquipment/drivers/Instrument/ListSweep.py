@@ -0,0 +1,144 @@
+# ListSweep.py
+#
+# Common list sweep API for SCPI signal generators (HP83630A, AgilentE8257D,
+# HMCT2240).
+#
+# A list of frequencies (and optionally powers and dwell times) is uploaded
+# once, and the source then steps to the next point on each trigger, so no
+# GPIB traffic is needed per point other than the trigger itself.
+#
+# e.g.
+#     rf.setFreqList(freqs)
+#     rf.startList(trigger="bus")
+#     for f in freqs:
+#         rf.triggerList()
+#         rf.waitSettled()
+#         ... measure ...
+#     rf.stopList()
+#
+import numpy as np
+
+
+class ListSweep(object):
+    """Mixin for Instrument drivers of SCPI signal generators providing list
+    sweeps.
+
+    The SCPI commands used are class attributes, so drivers can override
+    any that differ for their instrument.  Frequencies are in Hz, powers in
+    dBm and dwell times in seconds."""
+    # List upload commands
+    listFreqCmd = "LIST:FREQ"
+    listPowerCmd = "LIST:POW"
+    listDwellCmd = "LIST:DWEL"
+
+    # Commands to put the source into list mode and back into CW mode
+    listModeCmds = ("FREQ:MODE LIST",)
+    listPowerModeCmds = ("POW:MODE LIST",)
+    cwModeCmds = ("FREQ:MODE CW",)
+    cwPowerModeCmds = ("POW:MODE FIX",)
+
+    # Trigger source command and the names of the trigger sources
+    listTriggerCmd = "LIST:TRIG:SOUR"
+    listTriggers = {"bus": "BUS", "external": "EXT", "immediate": "IMM"}
+
+    # Commands to arm the list, and to trigger a step over the bus
+    armCmds = ("INIT:CONT OFF", "INIT")
+    busTriggerCmd = "*TRG"
+
+    # Maximum number of list points, or None if not known
+    listMaxPoints = None
+
+    # Time in seconds from a trigger until the output has settled at the
+    # new point
+    listSettleTime = 0.05
+
+    listFreqs = None
+    listPowers = None
+    listDwell = None
+    listTrigger = "bus"
+    listIndex = -1
+    readyTime = None
+
+    def setFreqList(self, freqs, powers=None, dwell=None):
+        """Upload a list of frequencies in Hz, with optional lists (or single
+        values) of powers in dBm and dwell times in seconds.
+
+        The power and dwell lists are left as they are on the source if not
+        given.  dwell is only used with the "immediate" trigger."""
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        if self.listMaxPoints is not None and len(freqs) > self.listMaxPoints:
+            raise ValueError("{:s}: list of {:d} points exceeds maximum of {:d}".format(
+                type(self).__name__, len(freqs), self.listMaxPoints))
+
+        self.write("{:s} {:s}".format(self.listFreqCmd, ",".join("{:.10g}".format(f) for f in freqs)))
+        if powers is not None:
+            powers = np.broadcast_to(np.asarray(powers, dtype=float), freqs.shape)
+            self.write("{:s} {:s}".format(self.listPowerCmd, ",".join("{:g}".format(p) for p in powers)))
+        if dwell is not None:
+            dwell = np.broadcast_to(np.asarray(dwell, dtype=float), freqs.shape)
+            self.write("{:s} {:s}".format(self.listDwellCmd, ",".join("{:g}".format(d) for d in dwell)))
+
+        self.listFreqs = freqs
+        self.listPowers = powers
+        self.listDwell = dwell
+        self.listIndex = -1
+        self.readyTime = None
+
+    def startList(self, trigger="bus"):
+        """Switch the source to list mode and arm the list, so that each
+        trigger from <trigger> ("bus", "external" or "immediate") steps to
+        the next point.  The first trigger sets the first point."""
+        self.listTrigger = trigger
+        self.write("{:s} {:s}".format(self.listTriggerCmd, self.listTriggers[trigger]))
+        for cmd in self.listModeCmds:
+            self.write(cmd)
+        if self.listPowers is not None:
+            for cmd in self.listPowerModeCmds:
+                self.write(cmd)
+        for cmd in self.armCmds:
+            self.write(cmd)
+        self.listIndex = -1
+        self.readyTime = None
+
+    def triggerList(self):
+        """Step to the next point of the list, and return its frequency.
+
+        With the "bus" trigger, this sends the trigger.  With the "external"
+        trigger, call this as the trigger is sent so that the point and
+        settle time are tracked.  The time at which the output will have
+        settled is stored in readyTime, on the instrument's clock (see
+        Instrument.now).
+
+        The list is armed for a single sweep, so it is re-armed here when
+        stepping from the last point back to the first."""
+        if self.listIndex + 1 >= len(self.listFreqs):
+            for cmd in self.armCmds:
+                self.write(cmd)
+            self.listIndex = -1
+        if self.listTrigger == "bus":
+            self.write(self.busTriggerCmd)
+        self.listIndex += 1
+        self.readyTime = self.now() + self.getSettleTime()
+        return self.listFreqs[self.listIndex]
+
+    def getSettleTime(self):
+        """Return the time in seconds from a trigger until the output has
+        settled"""
+        return self.listSettleTime
+
+    def waitSettled(self):
+        """Wait until the output has settled after the last trigger"""
+        if self.readyTime is not None:
+            delay = self.readyTime - self.now()
+            if delay > 0:
+                self.sleep(delay)
+
+    def stopList(self):
+        """Return the source to CW mode"""
+        for cmd in self.cwModeCmds:
+            self.write(cmd)
+        if self.listPowers is not None:
+            for cmd in self.cwPowerModeCmds:
+                self.write(cmd)
+        self.listIndex = -1
+        self.readyTime = None
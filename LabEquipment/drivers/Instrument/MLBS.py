@@ -1,243 +1,131 @@
-import socket
+from . import MicroLambda
+from . import UDPTransport
 
-class MLBS(object):
+class MLBS(MicroLambda.MicroLambda):
     """Class for operating the Micro Lambda Wireless MLBS series of
     benchtop YIG synthesizers, using UDP sockets over ethernet"""
-    def __init__(self, ip_address, port=30303):
-        self._ip_address = ip_address
-        self._port = port
-
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(1)
-
-        # Get some initial data
-        self._fmax = self.getFMax()
-        self._fmin = self.getFMin()
-        self._freq = self.getFreq()
-        self._levelcontrol = self.getLevelControl()
+    deviceName = "MLBS"
+    numberRegisters = MicroLambda.MicroLambda.numberRegisters + ("R0044", "R0045", "R0048")
+
+    def _setup(self, ip_address, port, sock):
+        MicroLambda.MicroLambda._setup(self, ip_address, port, sock)
+        self.transport.checks["R0043"] = lambda reply: reply in ("Yes", "No")
+
+    @staticmethod
+    def decodeReply(data):
+        """Decode a reply datagram"""
+        return data.decode("utf-8").strip().split("\x00")[0]
+
+    def _connect(self):
+        levelcontrol, = yield from MicroLambda.MicroLambda._connect(self, ["R0043"])
+        self.transport.checks["R0043"] = levelcontrol
+        self._levelcontrol = levelcontrol == "Yes"
         if self._levelcontrol:
-            self._pmax = self.getPMax()
-            self._pmin = self.getPMin()
-            self._power = self.getPower()
+            pmax, pmin, power = yield "query", ["R0044", "R0045", "R0048"]
+            self._pmax, self._pmin, self._power = float(pmax), float(pmin), float(power)
+            self.transport.checks.update({"R0044": pmax, "R0045": pmin,
+                                          "R0048": UDPTransport.inRange(self._pmin, self._pmax)})
         else:
             self._pmax = None
             self._pmin = None
             self._power = None
-        self._model = self.getModel()
-        self._serial = self.getSerial()
-
-    def read(self, bytesize=1024):
-        """Listen for <bytesize> bytes from UDP client"""
-        data, addr = self.sock.recvfrom(bytesize)
-        if data:
-            # decode to a string and remove extraneous stuff
-            data = data.decode("utf-8").strip().split("\x00")[0]
-        return data
-
-    def write(self, message):
-        """Write message to UDP client"""
-        self.sock.sendto(bytes(message, "UTF-8"), (self.ip_address, self.port))
-
-    @property
-    def ip_address(self):
-        """The IP address of the YIG filter"""
-        return self._ip_address
-
-    @ip_address.setter
-    def ip_address(self, ip):
-        """Set the IP address. Since this likely changes the instrument,
-        we need to get all new data about the instrument"""
-        self.__init__(ip, port=self._port)
-
-    @property
-    def port(self):
-        """The port of the instrument"""
-        return self._port
-
-    @port.setter
-    def port(self, p):
-        """Set the port.
-
-        Communication probably didn't work before this was set, but we
-        have lazy checking of the values, so we'll rely on that."""
-        self._port = p
 
     @property
     def freq(self):
         """The current frequency of the synthesizer"""
-        try:
-            freq = self._freq
-        except AttributeError:
-            self._freq = self.getFreq()
-            freq = self._freq
-        return freq
+        return self._currentFreq()
 
     @freq.setter
     def freq(self, freq):
         self.setFreq(freq)
 
-    @property
-    def fmin(self):
-        """The minimum frequency of the YIG filter.  This can't change
-        so we only read it the first time"""
-        try:
-            freqmin = self._fmin
-        except AttributeError:
-            self._fmin = self.getFMin()
-            freqmin = self._fmin
-        return freqmin
-
-    @property
-    def fmax(self):
-        """The maximum frequency of the YIG filter.  This can't change
-        so we only read it the first time"""
-        try:
-            freqmax = self._fmax
-        except AttributeError:
-            self._fmax = self.getFMax()
-            freqmax = self._fmax
-        return freqmax
-    
     @property
     def power(self):
-        """The current frequency of the synthesizer"""
-        try:
-            power = self._power
-        except AttributeError:
-            self.getPower()
-            power = self._power
-        return power
-    
+        """The current power level of the synthesizer"""
+        return self._power
+
     @power.setter
     def power(self, power):
         self.setPower(power)
-    
+
     @property
     def pmin(self):
         """The minimum power output of the synthesizer.  This can't change
         so we only read it the first time"""
-        try:
-            powermin = self._pmin
-        except AttributeError:
-            self._pmin = self.getPMin()
-            powermin = self._pmin
-        return powermin
+        return self._pmin
 
     @property
     def pmax(self):
-        """The minimum power output of the synthesizer.  This can't change
+        """The maximum power output of the synthesizer.  This can't change
         so we only read it the first time"""
-        try:
-            powermax = self._pmax
-        except AttributeError:
-            self._pmax = self.getPMax()
-            powermax = self._pmax
-        return powermax
-
-    @property
-    def model(self):
-        """The model number of the YIG filter.  This can't change so we
-        only read it the first time"""
-        try:
-            mod = self._model
-        except AttributeError:
-            self._model = self.getModel()
-            mod = self._model
-        return mod
-
-    @property
-    def serial(self):
-        """The serial number of the YIG filter.  This can't changes so we
-        only read it the first time"""
-        try:
-            ser = self._serial
-        except AttributeError:
-            self._serial = self.getSerial()
-            ser = self._serial
-        return ser
-
-
-    def getFMin(self):
-        """Get the minimum frequency setting in MHz"""
-        self.write("R0003")
-        f = self.read()
-        return float(f)
-
-    def getFMax(self):
-        """Get the maximum frequency setting in MHz"""
-        self.write("R0004")
-        f = self.read()
-        return float(f)
+        return self._pmax
 
     def getFreq(self):
         """Get the current frequency setting in MHz"""
-        self.write("R0016")
-        self._freq = float(self.read())
-        return self.freq
-
-    def setFreq(self, freq):
-        """Set the frequency in MHz"""
-        if freq > self.fmax:
-            raise ValueError("MLBS: Requested frequency of {:f} MHz too high".format(freq))
-        if freq < self.fmin:
-            raise ValueError("MLBS: Requested frequency of {:f} MHz too low".format(freq))
-        self.write("F{:.3f}".format(freq))
-        self._freq = self.getFreq()
+        return self._run(self._getFreq())
+
+    def setFreq(self, freq, wait=True):
+        """Set the frequency in MHz.
+
+        If wait is False, the readback of the frequency is requested but not
+        waited for.  It is checked by verifyFreq() the next time the
+        frequency is set or read."""
+        return self._run(self._setFreq(freq, wait))
+
+    def verifyFreq(self):
+        """Check the readback of the last frequency set with wait=False.
+
+        If the readback doesn't match the request (e.g. the set command was
+        lost), the frequency is set again and read back.  Raises RuntimeError
+        if it still doesn't match"""
+        return self._run(self._verifyFreq())
 
     def getLevelControl(self):
         """Determine whether power control is installed"""
-        self.write("R0043")
-        l = self.read()
-        if l=="Yes":
-            return True
-        else:
-            return False
+        return self._run(self._get("R0043", lambda reply: reply == "Yes"))
+
+    def _getIfLevelControl(self, register):
+        if not self._levelcontrol:
+            return None
+        return (yield from self._get(register))
 
     def getPMax(self):
         """Get the maximum power level in dBm"""
-        if self._levelcontrol:
-            self.write("R0044")
-            power = self.read()
-            return float(power)
-        else:
-            return None
-        
+        return self._run(self._getIfLevelControl("R0044"))
+
     def getPMin(self):
         """Get the minimum power level in dBm"""
-        if self._levelcontrol:
-            self.write("R0045")
-            power = self.read()
-            return float(power)
-        else:
-            return None
+        return self._run(self._getIfLevelControl("R0045"))
+
+    def _getPower(self):
+        power = yield from self._getIfLevelControl("R0048")
+        if power is not None:
+            self._power = power
+        return power
 
     def getPower(self):
         """Get the current power level in dBm"""
-        if self._levelcontrol:
-            self.write("R0048")
-            self._power = float(self.read())
-            return self.power
-        else:
-            return None
+        return self._run(self._getPower())
 
-    def setPower(self, power):
-        """Set the frequency in MHz"""
-        if self._levelcontrol:
-            if power > self.pmax:
-                raise ValueError("MLBS: Requested level of {:f} dBm too high".format(power))
-            if power < self.pmin:
-                raise ValueError("MLBS: Requested level of {:f} dBm too low".format(power))
-            self.write("L{:.3f}".format(power))
-            self.getPower()
-        else:
+    def _setPower(self, power):
+        if not self._levelcontrol:
             raise RuntimeWarning("MLBS does not have level control installed")
+        if power > self.pmax:
+            raise ValueError("MLBS: Requested level of {:f} dBm too high".format(power))
+        if power < self.pmin:
+            raise ValueError("MLBS: Requested level of {:f} dBm too low".format(power))
+        yield "write", "L{:.3f}".format(power)
+        return (yield from self._getPower())
+
+    def setPower(self, power):
+        """Set the power level in dBm"""
+        return self._run(self._setPower(power))
+
 
-    def getModel(self):
-        """Get the Model Number"""
-        self.write("R0000")
-        return self.read()
+class AsyncMLBS(MicroLambda.AsyncMicroLambda, MLBS):
+    """asyncio version of the MLBS driver, running the same commands over an
+    asyncio datagram endpoint so that the YIG synthesizer can be driven from
+    the same event loop as other instruments.
 
-    def getSerial(self):
-        """Get the serial number"""
-        self.write("R0001")
-        return self.read()
+    Create with:
+        synth = await AsyncMLBS.create(ip_address)"""
@@ -124,10 +124,9 @@ class MSL(Instrument.Instrument):
         self.moving = self.query("PR MV")
         return self.moving
 
-    def hold(self):
+    def hold(self, timeout=None):
         'Holds instruction till motion has stopped'
-        while self.isMoving() == '1':
-            None
+        self.waitFor(self.isMoving, lambda moving: moving != '1', timeout=timeout, maxInterval=0.02)
 
     def zero(self):
         """Sets current position to home (0 position)
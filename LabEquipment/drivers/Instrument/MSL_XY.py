@@ -92,10 +92,9 @@ class MSL_XY(Instrument.Instrument):
     def isMoving(self, drv="*"):
         return bool(int(self.query("{} PR MV".format(drv))))
 
-    def block_while_moving(self, drv="*"):
+    def block_while_moving(self, drv="*", timeout=None):
         'Holds instruction till motion has stopped'
-        while self.isMoving(drv):
-            None
+        self.waitFor(lambda: self.isMoving(drv), lambda moving: not moving, timeout=timeout, maxInterval=0.02)
 
     def zero(self, drv="*"):
         'Makes the minimum position the home'
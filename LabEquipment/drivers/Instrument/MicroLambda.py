@@ -0,0 +1,489 @@
+# MicroLambda.py
+#
+# Common code for the Micro Lambda Wireless benchtop YIG devices (the MLBF
+# filters and MLBS synthesizers), which are controlled by short text
+# commands over UDP.
+#
+# Each operation is written once, as a generator that yields the I/O it
+# needs and is sent back the results:
+#
+#     yield "write", message      send message, which has no reply
+#     yield "query", messages     send the list of requests, pipelined, and
+#                                 get the list of replies
+#     yield "submit", message     send a request, and get the Request
+#                                 without waiting for the reply
+#     yield "result", request     wait for the reply to a submitted request
+#     yield "sleep", seconds      wait
+#
+# MicroLambda runs the operations over a UDPTransport, blocking, and
+# AsyncMicroLambda runs the same operations over an AsyncUDPTransport as
+# coroutines, so the synchronous and asyncio drivers share the commands,
+# reply checks and parsing.
+#
+# e.g.
+#     def getFMax(self):
+#         return self._run(self._get("R0004"))
+#
+# returns the value from MLBF, and a coroutine from AsyncMLBF.
+#
+# The devices have no list mode, so the ListSweep API is provided by the
+# driver stepping through the list itself, with the set commands built in
+# advance.  As for the other ListSweep sources, list frequencies are in Hz.
+#
+import asyncio
+import time
+
+import numpy as np
+
+from . import ListSweep
+from . import UDPTransport
+from LabEquipment.lib import instrumentation
+
+
+class MicroLambda(ListSweep.ListSweep):
+    """Base class for the Micro Lambda Wireless YIG device drivers, using
+    UDP sockets over ethernet.  Frequencies are in MHz, except in the
+    frequency list, which is in Hz (see ListSweep)"""
+    # Name used in error messages and timing reports
+    deviceName = "MicroLambda"
+    transportClass = UDPTransport.UDPTransport
+    # Registers whose replies are numbers, so replies out of step are caught
+    numberRegisters = ("R0003", "R0004", "R0016")
+
+    # The list is stepped through by the driver on triggerList()
+    listTriggers = {"bus": None}
+    # Time in seconds to wait after each hop, unless a dwell list is given
+    listSettleTime = 0.0
+    # Whether the readback of each hop is checked, lazily as for a set with
+    # wait=False
+    listVerify = True
+
+    # Clock providing time() and sleep() for waits (e.g. a simulated clock), or None for real time
+    clock = None
+
+    def __init__(self, ip_address, port=30303, sock=None):
+        """Create the driver for the device at <ip_address>.
+
+        sock can be used to pass in a socket-like object to communicate
+        through, e.g. an ioTrace recording or replay proxy"""
+        self._setup(ip_address, port, sock)
+        self.connect()
+
+    def _setup(self, ip_address, port, sock):
+        self._ip_address = ip_address
+        self._port = port
+        checks = {register: UDPTransport.isNumber for register in self.numberRegisters}
+        self.transport = self.transportClass(ip_address, port, sock=sock, checks=checks, decode=self.decodeReply)
+        self.sock = self.transport.sock
+
+        # Largest difference in MHz between a requested frequency and the
+        # readback that is accepted when verifying a set
+        self.fTolerance = 1.0
+        self._pendingFreq = None
+        self.clearFreqList()
+
+    @staticmethod
+    def decodeReply(data):
+        """Decode a reply datagram"""
+        return data.decode("utf-8").strip().strip("\x00")
+
+    def connect(self):
+        """Get some initial data from the device"""
+        return self._run(self._connect())
+
+    def _run(self, op):
+        """Run the operation op (see above) to completion and return its
+        result"""
+        result = None
+        try:
+            while True:
+                kind, arg = op.send(result)
+                if kind == "write":
+                    result = self.write(arg)
+                elif kind == "query":
+                    result = self.queryMany(arg)
+                elif kind == "submit":
+                    result = self.transport.submit(arg)
+                elif kind == "sleep":
+                    result = self.sleep(arg)
+                else:
+                    result = self.transport.result(arg)
+        except StopIteration as stop:
+            return stop.value
+
+    def now(self):
+        """Return the time in seconds on the driver's clock"""
+        return time.perf_counter() if self.clock is None else self.clock.time()
+
+    def sleep(self, seconds):
+        """Wait for <seconds> on the driver's clock"""
+        if self.clock is None:
+            time.sleep(seconds)
+        else:
+            self.clock.sleep(seconds)
+
+    def _connect(self, extra=()):
+        """Read the device information and frequency, with all the requests
+        in flight at once, and return the replies to the <extra> requests"""
+        replies = yield "query", ["R0004", "R0003", "R0016", "R0000", "R0001"] + list(extra)
+        fmax, fmin, freq, self._model, self._serial = replies[:5]
+        self._fmax = float(fmax)
+        self._fmin = float(fmin)
+        self._freq = float(freq)
+        # The fixed registers are known now, so replies can be checked closely
+        self.transport.checks.update({"R0000": self._model, "R0001": self._serial,
+                                      "R0003": fmin, "R0004": fmax,
+                                      "R0016": UDPTransport.inRange(self._fmin, self._fmax)})
+        return replies[5:]
+
+    def _get(self, register, parse=float):
+        """Read a register"""
+        replies = yield "query", [register]
+        return parse(replies[0])
+
+    def _getFreq(self):
+        if self._pendingFreq is not None:
+            yield from self._verifyFreq()
+        self._freq = yield from self._get("R0016")
+        return self._freq
+
+    def _setFreq(self, freq, wait):
+        if freq > self.fmax:
+            raise ValueError("{:s}: Requested frequency of {:f} MHz too high".format(self.deviceName, freq))
+        if freq < self.fmin:
+            raise ValueError("{:s}: Requested frequency of {:f} MHz too low".format(self.deviceName, freq))
+        if self._pendingFreq is not None:
+            yield from self._verifyFreq()
+        yield "write", "F{:.3f}".format(freq)
+        if wait:
+            self._freq = yield from self._get("R0016")
+        else:
+            self._freq = freq
+            self._pendingFreq = (freq, (yield "submit", "R0016"))
+
+    def _verifyFreq(self):
+        freq, readback = self._pendingFreq
+        self._pendingFreq = None
+        self._freq = float((yield "result", readback))
+        if abs(self._freq - freq) > self.fTolerance:
+            yield "write", "F{:.3f}".format(freq)
+            self._freq = yield from self._get("R0016")
+            if abs(self._freq - freq) > self.fTolerance:
+                raise RuntimeError("{:s}: Frequency set to {:f} MHz reads back as {:f} MHz".format(
+                    self.deviceName, freq, self._freq))
+
+    def _currentFreq(self):
+        """The current frequency, checking the readback of a set with
+        wait=False first"""
+        if self._pendingFreq is not None:
+            self._run(self._verifyFreq())
+        return self._freq
+
+    def instrumentationName(self):
+        """Name used to identify this instrument in timing reports"""
+        return "%s(%s)" % (self.deviceName, self._ip_address)
+
+    def read(self, bytesize=1024):
+        """Listen for <bytesize> bytes from UDP client"""
+        if instrumentation.hook is None:
+            return self._read(bytesize)
+        return instrumentation.timed(self.instrumentationName(), "read", self._read, bytesize)
+
+    def _read(self, bytesize):
+        self.transport.bufsize = bytesize
+        return self.transport.receive()
+
+    def write(self, message):
+        """Write message to UDP client"""
+        if instrumentation.hook is None:
+            return self._write(message)
+        return instrumentation.timed(self.instrumentationName(), "write", self._write, message)
+
+    def _write(self, message):
+        self.transport.send(message)
+
+    def query(self, message):
+        """Send a request to the UDP client and return the reply, retrying if
+        the reply doesn't arrive"""
+        if instrumentation.hook is None:
+            return self.transport.query(message)
+        return instrumentation.timed(self.instrumentationName(), "query", self.transport.query, message)
+
+    def queryMany(self, messages):
+        """Send a list of requests to the UDP client without waiting for each
+        reply, and return the list of replies"""
+        if instrumentation.hook is None:
+            return self.transport.queryMany(messages)
+        return instrumentation.timed(self.instrumentationName(), "queryMany", self.transport.queryMany, messages)
+
+    @property
+    def ip_address(self):
+        """The IP address of the device"""
+        return self._ip_address
+
+    @ip_address.setter
+    def ip_address(self, ip):
+        """Set the IP address. Since this likely changes the instrument,
+        we need to get all new data about the instrument"""
+        self.__init__(ip, port=self._port, sock=self.sock)
+
+    @property
+    def port(self):
+        """The port of the instrument"""
+        return self._port
+
+    @port.setter
+    def port(self, p):
+        """Set the port.
+
+        Communication probably didn't work before this was set, but we
+        have lazy checking of the values, so we'll rely on that."""
+        self._port = p
+        self.transport.port = p
+
+    @property
+    def fmin(self):
+        """The minimum frequency of the device.  This can't change so we
+        only read it the first time"""
+        return self._fmin
+
+    @property
+    def fmax(self):
+        """The maximum frequency of the device.  This can't change so we
+        only read it the first time"""
+        return self._fmax
+
+    @property
+    def model(self):
+        """The model number of the device.  This can't change so we only
+        read it the first time"""
+        return self._model
+
+    @property
+    def serial(self):
+        """The serial number of the device.  This can't change so we only
+        read it the first time"""
+        return self._serial
+
+    def getFMin(self):
+        """Get the minimum frequency setting in MHz"""
+        return self._run(self._get("R0003"))
+
+    def getFMax(self):
+        """Get the maximum frequency setting in MHz"""
+        return self._run(self._get("R0004"))
+
+    def getModel(self):
+        """Get the Model Number"""
+        return self._run(self._get("R0000", str))
+
+    def getSerial(self):
+        """Get the serial number"""
+        return self._run(self._get("R0001", str))
+
+    def setFreqList(self, freqs, powers=None, dwell=None):
+        """Load a list of frequencies in Hz to step through with triggerList()
+        or hop().
+
+        The whole list is checked against fmin and fmax once, and the set
+        commands are built in advance.  dwell is the time in seconds to wait
+        after each hop (default: listSettleTime), either a single value or
+        one per frequency.  Power lists aren't supported."""
+        if powers is not None:
+            raise ValueError("{:s}: power lists are not supported".format(self.deviceName))
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        freqsMHz = freqs*1e-6
+        bad = (freqsMHz > self.fmax) | (freqsMHz < self.fmin)
+        if np.any(bad):
+            raise ValueError("{:s}: Requested frequencies {} MHz outside range {:f} to {:f} MHz".format(
+                self.deviceName, freqsMHz[bad], self.fmin, self.fmax))
+        if dwell is not None:
+            dwell = np.broadcast_to(np.asarray(dwell, dtype=float), freqs.shape)
+        self.listFreqs = freqs
+        self.listDwell = dwell
+        self._listCmds = ["F{:.3f}".format(f) for f in freqsMHz]
+        self._listIndexOf = {round(f, 3): i for i, f in enumerate(freqsMHz)}
+        self.listIndex = -1
+        self.readyTime = None
+
+    def clearFreqList(self):
+        """Discard the frequency list"""
+        self.listFreqs = None
+        self.listDwell = None
+        self._listCmds = None
+        self._listIndexOf = {}
+        self.listIndex = -1
+        self.readyTime = None
+
+    def startList(self, trigger="bus"):
+        """Start stepping through the list from the first point.  Only the
+        "bus" trigger is supported: each triggerList() sets the next point"""
+        if trigger not in self.listTriggers:
+            raise ValueError("{:s}: list trigger {!r} is not supported".format(self.deviceName, trigger))
+        self.listTrigger = trigger
+        self.listIndex = -1
+        self.readyTime = None
+
+    def stopList(self):
+        """Stop stepping through the list, leaving the frequency at the last
+        point"""
+        self.listIndex = -1
+        self.readyTime = None
+
+    def getSettleTime(self):
+        """Return the dwell time in seconds of the current list point"""
+        if self.listDwell is not None and self.listIndex >= 0:
+            return self.listDwell[self.listIndex]
+        return self.listSettleTime
+
+    def _hop(self, index):
+        if self._pendingFreq is not None:
+            yield from self._verifyFreq()
+        self.listIndex = index
+        self.readyTime = self.now() + self.getSettleTime()
+        yield "write", self._listCmds[index]
+        freq = self.listFreqs[index]
+        self._freq = freq*1e-6
+        if self.listVerify:
+            self._pendingFreq = (self._freq, (yield "submit", "R0016"))
+        return freq
+
+    def triggerList(self):
+        """Set the next point of the list, and return its frequency in Hz.
+        The time at which the dwell time is over is stored in readyTime"""
+        return self._run(self._hop((self.listIndex + 1) % len(self.listFreqs)))
+
+    def _waitSettled(self):
+        if self.readyTime is not None:
+            delay = self.readyTime - self.now()
+            if delay > 0:
+                yield "sleep", delay
+
+    def waitSettled(self):
+        """Wait until the dwell time after the last hop is over"""
+        return self._run(self._waitSettled())
+
+    def _hopWait(self, index):
+        freq = yield from self._hop(index)
+        yield from self._waitSettled()
+        return freq
+
+    def hop(self, index=None):
+        """Set the frequency to entry <index> (default: the next entry) of the
+        frequency list, wait for its dwell time and return the frequency in
+        Hz"""
+        if index is None:
+            index = (self.listIndex + 1) % len(self.listFreqs)
+        return self._run(self._hopWait(index))
+
+    def hopFreq(self, freq):
+        """Hop to the frequency <freq> in Hz, which must be in the frequency
+        list"""
+        try:
+            index = self._listIndexOf[round(freq*1e-6, 3)]
+        except KeyError:
+            raise ValueError("{:s}: {:f} MHz is not in the frequency list".format(self.deviceName, freq*1e-6))
+        return self.hop(index)
+
+    def inFreqList(self, freq):
+        """Return True if <freq> in Hz is in the frequency list"""
+        return round(freq*1e-6, 3) in self._listIndexOf
+
+
+def _awaitSetter(name, setter):
+    """Return a property setter raising TypeError, for AsyncMicroLambda"""
+    def fset(self, value):
+        raise TypeError("{:s}: can't assign {:s} on an asyncio driver, use await {:s}()".format(
+            self.deviceName, name, setter))
+    return fset
+
+
+class AsyncMicroLambda(object):
+    """Mixin running the operations of a MicroLambda driver as coroutines
+    over an AsyncUDPTransport, so that the device can be driven from the
+    same event loop as other instruments.  Put it before the driver class:
+
+        class AsyncMLBF(MicroLambda.AsyncMicroLambda, MLBF):
+            pass
+
+        yig = await AsyncMLBF.create(ip_address)
+
+    The get and set methods are coroutines.  The properties return the last
+    values read back, without checking sets made with wait=False, and can't
+    be assigned to: await the set method instead (e.g. setF() for f)."""
+    transportClass = UDPTransport.AsyncUDPTransport
+
+    def __init_subclass__(cls, **kwargs):
+        """Replace the setter of each property that has a set method (e.g. f
+        and setF) with one raising TypeError, as the set method returns a
+        coroutine that assigning can't await"""
+        super().__init_subclass__(**kwargs)
+        seen = set()
+        for klass in cls.__mro__:
+            for name, prop in list(vars(klass).items()):
+                if name in seen or not isinstance(prop, property):
+                    continue
+                seen.add(name)
+                setter = "set" + name[0].upper() + name[1:]
+                if prop.fset is not None and hasattr(cls, setter):
+                    setattr(cls, name, property(prop.fget, _awaitSetter(name, setter), doc=prop.__doc__))
+
+    def __init__(self, ip_address, port=30303, sock=None):
+        """Create the driver.  Use create() instead, or await connect()"""
+        self._setup(ip_address, port, sock)
+
+    @classmethod
+    async def create(cls, ip_address, port=30303, sock=None):
+        """Create the driver, open the datagram endpoint and get the initial
+        data"""
+        device = cls(ip_address, port=port, sock=sock)
+        await device.connect()
+        return device
+
+    async def connect(self):
+        """Open the datagram endpoint and get some initial data"""
+        if self.transport.endpoint is None:
+            await self.transport.open()
+        return await self._run(self._connect())
+
+    def close(self):
+        """Close the datagram endpoint"""
+        self.transport.close()
+
+    async def _run(self, op):
+        """Run the operation op to completion and return its result"""
+        result = None
+        try:
+            while True:
+                kind, arg = op.send(result)
+                if kind == "write":
+                    result = self.write(arg)
+                elif kind == "query":
+                    result = await self.transport.queryMany(arg)
+                elif kind == "submit":
+                    result = self.transport.submit(arg)
+                elif kind == "sleep":
+                    result = await asyncio.sleep(arg)
+                else:
+                    result = await self.transport.result(arg)
+        except StopIteration as stop:
+            return stop.value
+
+    def _currentFreq(self):
+        return self._freq
+
+    def read(self, bytesize=1024):
+        """Not available: every reply is matched to its request, so use
+        query()"""
+        raise TypeError("{:s}: replies are matched to requests as they arrive, use await query()".format(
+            self.deviceName))
+
+    async def query(self, message):
+        """Send a request to the UDP client and return the reply, retrying if
+        the reply doesn't arrive"""
+        return await self.transport.query(message)
+
+    async def queryMany(self, messages):
+        """Send a list of requests to the UDP client without waiting for each
+        reply, and return the list of replies"""
+        return await self.transport.queryMany(messages)
@@ -0,0 +1,163 @@
+# ResourceRegistry.py
+#
+# Process wide registry of VISA resource managers and open resources.
+#
+# Creating a ResourceManager and listing resources can take seconds on
+# linux-gpib/pyvisa-py, so one ResourceManager is kept per backend, the
+# results of list_resources are cached for discoveryTTL seconds, and each
+# resource is opened the first time it is asked for and then shared by all
+# the drivers and applications in the process that ask for it again.
+#
+# e.g.
+#     if address in ResourceRegistry.listResources():
+#         pm = HP436A.PowerMeter(ResourceRegistry.openResource(address))
+#
+# The "@sim" backend serves the simulated lab from
+# LabEquipment.drivers.Simulator.Instruments.labResourceManager().
+#
+import threading
+import time
+
+
+def _simulatorManager():
+    from LabEquipment.drivers.Simulator import Instruments
+    return Instruments.labResourceManager()
+
+
+def _visaManager(backend):
+    import pyvisa
+    if backend:
+        return pyvisa.ResourceManager(backend)
+    return pyvisa.ResourceManager()
+
+
+class ResourceRegistry(object):
+    """One ResourceManager per backend, with cached discovery and shared
+    resources.
+
+    backend "" is the pyvisa default backend.  Other backends can be added
+    with registerBackend, and defaultBackend is used when no backend is
+    given."""
+    def __init__(self, defaultBackend="", discoveryTTL=300.0):
+        self.defaultBackend = defaultBackend
+        self.discoveryTTL = discoveryTTL
+        self.factories = {"@sim": _simulatorManager}
+        self._managers = {}
+        self._discovered = {}
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    def registerBackend(self, backend, factory):
+        """Use factory() to create the resource manager for <backend>"""
+        with self._lock:
+            self.factories[backend] = factory
+            self._managers.pop(backend, None)
+
+    def _backend(self, backend):
+        return self.defaultBackend if backend is None else backend
+
+    def resourceManager(self, backend=None):
+        """Return the ResourceManager for <backend>, creating it on first use"""
+        backend = self._backend(backend)
+        with self._lock:
+            rm = self._managers.get(backend)
+            if rm is None:
+                factory = self.factories.get(backend)
+                rm = factory() if factory else _visaManager(backend)
+                self._managers[backend] = rm
+            return rm
+
+    def listResources(self, backend=None, query="?*::INSTR", refresh=False):
+        """Return the resources found by <backend>, listing them again only if
+        the cached list is older than discoveryTTL seconds or refresh is
+        True"""
+        backend = self._backend(backend)
+        key = (backend, query)
+        with self._lock:
+            cached = self._discovered.get(key)
+            if refresh or cached is None or time.monotonic() - cached[0] > self.discoveryTTL:
+                found = tuple(self.resourceManager(backend).list_resources(query))
+                cached = (time.monotonic(), found)
+                self._discovered[key] = cached
+            return cached[1]
+
+    def open(self, resource_name, backend=None, **kwargs):
+        """Return the resource <resource_name>, opening it if it isn't already
+        open in this process.
+
+        kwargs are passed to open_resource when the resource is first opened,
+        and are ignored after that"""
+        backend = self._backend(backend)
+        key = (backend, resource_name)
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = self.resourceManager(backend).open_resource(resource_name, **kwargs)
+                self._resources[key] = resource
+            return resource
+
+    def close(self, resource_name, backend=None):
+        """Close a shared resource, so that it is opened again on next use"""
+        with self._lock:
+            resource = self._resources.pop((self._backend(backend), resource_name), None)
+        if resource is not None:
+            resource.close()
+
+    def closeAll(self):
+        """Close all the shared resources and resource managers"""
+        with self._lock:
+            resources = list(self._resources.values())
+            managers = list(self._managers.values())
+            self._resources.clear()
+            self._managers.clear()
+            self._discovered.clear()
+        for resource in resources:
+            resource.close()
+        for rm in managers:
+            rm.close()
+
+    def manager(self, backend=None):
+        """Return a ResourceManager-like view of <backend> whose resources are
+        shared through the registry"""
+        return SharedResourceManager(self, self._backend(backend))
+
+
+class SharedResourceManager(object):
+    """Stand-in for a pyvisa ResourceManager that lists and opens resources
+    through a ResourceRegistry"""
+    def __init__(self, registry, backend):
+        self.registry = registry
+        self.backend = backend
+
+    def list_resources(self, query="?*::INSTR"):
+        return self.registry.listResources(self.backend, query)
+
+    def open_resource(self, resource_name, *args, **kwargs):
+        return self.registry.open(resource_name, self.backend, **kwargs)
+
+    def close(self):
+        pass
+
+
+# The registry shared by everything in this process
+registry = ResourceRegistry()
+
+
+def resourceManager(backend=None):
+    """Return the shared ResourceManager for <backend>"""
+    return registry.resourceManager(backend)
+
+
+def listResources(backend=None, query="?*::INSTR", refresh=False):
+    """Return the (cached) resources found by <backend>"""
+    return registry.listResources(backend, query, refresh)
+
+
+def openResource(resource_name, backend=None, **kwargs):
+    """Return the shared resource <resource_name>, opening it on first use"""
+    return registry.open(resource_name, backend, **kwargs)
+
+
+def manager(backend=None):
+    """Return a ResourceManager-like view of the shared registry"""
+    return registry.manager(backend)
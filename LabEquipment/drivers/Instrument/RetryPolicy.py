@@ -0,0 +1,139 @@
+# RetryPolicy.py
+#
+# Bounded retries of instrument transactions with adaptive timeouts.
+#
+# The latency of each kind of transaction (keyed by a name such as
+# "getTransmission") is learned with a latency.LatencyEstimator, and the
+# VISA timeout is set from it for each attempt, so a lost or garbled reply
+# costs a few times the usual latency rather than the full VISA timeout.
+# After a failed attempt the instrument's recover() method is called (by
+# default a device clear) before trying again.
+#
+# e.g.
+#     policy = RetryPolicy(attempts=3)
+#     vvm.retryPolicy = policy
+#     trans = vvm.retry("getTransmission", vvm.getTransmission)
+#     policy.report()
+#
+from __future__ import print_function, division
+
+import json
+import math
+import sys
+import threading
+import time
+
+from LabEquipment.lib import latency
+
+try:
+    import pyvisa
+    visaErrors = (pyvisa.errors.VisaIOError,)
+except ImportError:
+    visaErrors = ()
+
+
+class RetryPolicy(object):
+    """Retry transactions that fail with one of the exceptions in retryOn
+    (default: VISA I/O errors, timeouts and unparseable replies), up to
+    <attempts> attempts in all, with timeouts adapted to the measured
+    latency of each transaction.
+
+    Until a transaction has been measured, whenever the adaptive timeout
+    would exceed it, and for the last attempt, the instrument's original
+    VISA timeout is used, so a slow but working instrument (e.g. after its
+    averaging is increased) still succeeds.  The adaptive timeout is never
+    shorter than minTimeout seconds."""
+    def __init__(self, attempts=3, retryOn=None, minTimeout=0.05, k=4.0, verbose=False):
+        if retryOn is None:
+            retryOn = visaErrors + (TimeoutError, ValueError)
+        self.attempts = attempts
+        self.retryOn = retryOn
+        self.minTimeout = minTimeout
+        self.k = k
+        self.verbose = verbose
+        self.latency = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = latency.LatencyEstimator(initial=None, minTimeout=self.minTimeout,
+                                                             maxTimeout=None, k=self.k)
+                self.stats[key] = {"calls": 0, "retries": 0, "failures": 0, "errors": {}}
+            return self.latency[key], self.stats[key]
+
+    def timeout(self, key, maxTimeout):
+        """Return the timeout in seconds for the next attempt of <key>,
+        limited to maxTimeout seconds (None for no limit)"""
+        est, stats = self._get(key)
+        t = est.timeout
+        if t is None:
+            return maxTimeout
+        if maxTimeout is not None:
+            t = min(t, maxTimeout)
+        return t
+
+    def call(self, instrument, key, func, *args, **kwargs):
+        """Call func(*args, **kwargs), which talks to <instrument>, retrying
+        on failure, and return its result"""
+        est, stats = self._get(key)
+        resource = getattr(instrument, "resource", None)
+        visaTimeout = getattr(resource, "timeout", None)
+        maxTimeout = None if visaTimeout is None else visaTimeout/1000
+
+        stats["calls"] += 1
+        attempt = 1
+        while True:
+            timeout = maxTimeout if attempt >= self.attempts else self.timeout(key, maxTimeout)
+            if visaTimeout is not None:
+                resource.timeout = None if timeout is None else int(math.ceil(timeout*1000))
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except self.retryOn as err:
+                name = type(err).__name__
+                stats["errors"][name] = stats["errors"].get(name, 0) + 1
+                est.backoff()
+                if attempt >= self.attempts:
+                    stats["failures"] += 1
+                    raise
+                if self.verbose:
+                    print("RetryPolicy: {} failed on attempt {:d} with {}: {}, retrying".format(key, attempt, name, err))
+                stats["retries"] += 1
+                attempt += 1
+                recover = getattr(instrument, "recover", None)
+                if recover is not None:
+                    recover()
+                continue
+            finally:
+                if visaTimeout is not None:
+                    resource.timeout = visaTimeout
+
+            if attempt == 1:
+                # Only first attempts give unambiguous latencies
+                est.update(time.perf_counter() - start)
+            return result
+
+    def asDict(self):
+        """Return the failure and latency statistics for each transaction"""
+        with self._lock:
+            return {key: dict(self.stats[key], latency=self.latency[key].asDict()) for key in self.stats}
+
+    def report(self, file=None):
+        """Print a summary of the retries, failures and latencies"""
+        if file is None:
+            file = sys.stdout
+        print("\nRetry summary:", file=file)
+        print("    {:30s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s} {:>10s}".format(
+            "Transaction", "Calls", "Retries", "Failures", "Mean (ms)", "Max (ms)", "Tmo (ms)"), file=file)
+        for key, s in sorted(self.asDict().items()):
+            lat = s["latency"]
+            print("    {:30.30s} {:8d} {:8d} {:8d} {:10.3f} {:10.3f} {:10.3f}".format(
+                key, s["calls"], s["retries"], s["failures"], 1000*(lat["srtt"] or 0), 1000*lat["max"],
+                1000*(lat["timeout"] or 0)), file=file)
+
+    def export(self, filename):
+        """Write the statistics to a JSON file"""
+        with open(filename, "w") as f:
+            json.dump(self.asDict(), f, indent=1)
@@ -15,6 +15,13 @@ class SR844(Instrument.Instrument):
     '''Class for communicating with an Stanford Research 844 RF Lock-in as a Vector Voltmeter'''
     
     outputs = IntEnum('outputs', ['X', 'Y', 'R', 'dBm', 'Theta'])
+    # Data buffer sample rates in Hz by SRAT index.  SRAT 14 samples on trigger.
+    sampleRates = {i:0.0625*2**i for i in range(14)}
+    triggeredRate = 14
+    bufferSize = 16383
+    # Buffer display (DDEF) settings for each output on channel 1 and channel 2
+    ch1Displays = {outputs.X:0, outputs.R:1, outputs.dBm:2}
+    ch2Displays = {outputs.Y:0, outputs.Theta:1}
     inttime = {0:1e-4, 1:3e-4, 2:1e-3, 3:3e-3, 4:1e-2, 5:3e-2, 6:1e-1, 7:3e-1, 8:1., 9:3., 10:10., 11:30., 12:100., 13:300., 14:1.e3, 15:3.e3, 16:1.e4, 17:3.e4}
     
     def __init__(self, resource):
@@ -156,3 +163,103 @@ class SR844(Instrument.Instrument):
     def trigger(self):
         '''For compatibility with code for HP8508As.'''
         pass
+
+    def _toComplex(self, a, b):
+        """Convert pairs of outputs in the current format to complex numbers"""
+        if self._format == "POLAR":
+            if self._scale == "LOGARITHMIC":
+                return dBdeg2complex(a, b)
+            else:
+                return lindeg2complex(a, b)
+        else:
+            return a + 1j*b
+
+    def setBufferDisplay(self):
+        """Set the channel 1 and 2 displays, which are what the data buffers
+        store, to the outputs used by the current format"""
+        self.write("DDEF 1,{:d}".format(self.ch1Displays[self._output[0]]))
+        self.write("DDEF 2,{:d}".format(self.ch2Displays[self._output[1]]))
+
+    def armBuffer(self, rate=None, trigger=False, loop=False):
+        """Clear and set up the data buffers to store the current outputs.
+
+        Samples are stored at <rate> Hz (rounded to the nearest available rate
+        of 62.5 mHz * 2^n, up to 512 Hz), or on each trigger if trigger is
+        True.  If loop is True the buffers wrap around when full, otherwise
+        storage stops when the buffers are full."""
+        self.setBufferDisplay()
+        if trigger:
+            srat = self.triggeredRate
+            self.bufferRate = None
+        else:
+            if rate is None:
+                rate = self.sampleRates[13]
+            srat = min(self.sampleRates, key=lambda i: abs(np.log2(self.sampleRates[i]/rate)))
+            self.bufferRate = self.sampleRates[srat]
+        self.write("SRAT {:d}".format(srat))
+        self.write("SEND {:d}".format(int(loop)))
+        self.write("REST")
+        return self.bufferRate
+
+    def startBuffer(self):
+        """Start or resume storing data in the buffers"""
+        self.write("STRT")
+
+    def pauseBuffer(self):
+        """Pause storing data in the buffers"""
+        self.write("PAUS")
+
+    def resetBuffer(self):
+        """Clear the data buffers"""
+        self.write("REST")
+
+    def triggerBuffer(self):
+        """Software trigger to store one sample when armed with trigger=True"""
+        self.write("TRIG")
+
+    def getBufferCount(self):
+        """Return the number of points stored in the buffers"""
+        return int(self.query("SPTS?"))
+
+    def readBuffer(self, npts=None, start=0):
+        """Read npts points from the data buffers, starting at point <start>,
+        using binary (TRCB) transfers.  Returns a complex numpy array in the
+        current format"""
+        if npts is None:
+            npts = self.getBufferCount() - start
+        if npts <= 0:
+            return np.empty(0, dtype=complex)
+
+        channels = []
+        for ch in (1, 2):
+            channels.append(self.query_binary_values("TRCB? {:d},{:d},{:d}".format(ch, start, npts),
+                                                     datatype="f", is_big_endian=False, container=np.array,
+                                                     header_fmt="empty", data_points=npts,
+                                                     expect_termination=False))
+        return self._toComplex(channels[0].astype(float), channels[1].astype(float))
+
+    def getBufferedTransmission(self, npts, rate=None, trigger=False, timeout=None):
+        """Collect npts points in the data buffers and return them as a complex
+        numpy array, in one binary transfer per channel.
+
+        If trigger is True, points are stored on each external or software
+        trigger instead of at <rate> Hz.  Raises RuntimeError if npts points
+        haven't been stored after timeout seconds."""
+        if npts > self.bufferSize:
+            raise ValueError("SR844: Requested {:d} points exceeds buffer size of {:d}".format(npts, self.bufferSize))
+
+        rate = self.armBuffer(rate=rate, trigger=trigger)
+        start = self.now()
+        self.startBuffer()
+
+        # Sleep through most of the acquisition before polling
+        if rate:
+            self.sleep(npts/rate)
+        while self.getBufferCount() < npts:
+            if timeout is not None and self.now() - start > timeout:
+                self.pauseBuffer()
+                raise RuntimeError("SR844: Timed out waiting for {:d} buffered points".format(npts))
+            self.sleep(0.01)
+        self.pauseBuffer()
+
+        return self.readBuffer(npts)
@@ -0,0 +1,397 @@
+# UDPTransport.py
+#
+# Pipelined request/response transport for simple UDP instruments (e.g. the
+# Micro Lambda MLBF and MLBS YIG devices).
+#
+# The devices answer requests in the order they are received and don't tag
+# their replies, so replies are matched to the requests sent in order.
+# Several requests can be in flight at once.  If the oldest outstanding
+# request times out, all the outstanding requests are sent again in order.
+#
+# Each reply is matched to the earliest send not yet accounted for that it
+# can belong to: a send of a request already answered if the reply is the
+# same (a late duplicate, which is dropped), or a send of an outstanding
+# request whose reply check, if it has one, accepts it.  A check can be the
+# exact reply expected (e.g. for a fixed register): a reply that is exactly
+# what a later request expects is taken as its reply in preference to an
+# earlier request that only checks the form, whose reply may have been lost
+# (if it wasn't, the earlier request is just retried).  Sends passed over
+# are taken as lost.  Stale datagrams are drained whenever nothing is in
+# flight, and replies that match no send are discarded.
+#
+# e.g.
+#     t = UDPTransport(ip_address, 30303)
+#     fmax, fmin, f = t.queryMany(["R0004", "R0003", "R0016"])
+#     t.send("F12000.000")
+#     readback = t.submit("R0016")
+#     ...
+#     f = t.result(readback)
+#
+# AsyncUDPTransport does the same over an asyncio datagram endpoint, for
+# drivers running in an event loop.
+#
+import asyncio
+import collections
+import socket
+import time
+
+from LabEquipment.lib import latency
+
+
+def isNumber(reply):
+    """Return True if reply is a number, for use as a reply check"""
+    try:
+        float(reply)
+    except ValueError:
+        return False
+    return True
+
+
+def inRange(low, high):
+    """Return a reply check for a number between low and high"""
+    def check(reply):
+        return isNumber(reply) and low <= float(reply) <= high
+    return check
+
+
+def accepts(check, reply):
+    """Return True if reply passes check, a function, the exact reply
+    expected or None"""
+    if check is None:
+        return True
+    if isinstance(check, str):
+        return reply == check
+    return check(reply)
+
+
+class ReplyError(socket.timeout):
+    """No reply of the form expected for a request, although other replies
+    arrived"""
+
+
+class Request(object):
+    """A request waiting for a reply"""
+    __slots__ = ("message", "check", "reply", "done", "first", "sent", "attempts", "rejected")
+
+    def __init__(self, message, check=None):
+        self.message = message
+        self.check = check
+        self.reply = None
+        self.done = False
+        self.first = None
+        self.sent = None
+        self.attempts = 0
+        # The last reply that didn't pass the check while this was outstanding
+        self.rejected = None
+
+
+class BaseUDPTransport(object):
+    """Request/response matching, adaptive timeout and retries shared by
+    UDPTransport and AsyncUDPTransport, which provide the waiting.
+
+    A request is sent up to retries more times, and for at least deadline
+    seconds, before giving up.  checks maps request messages to functions
+    check(reply) returning True if reply has the form expected for the
+    request (see isNumber), or to the exact reply expected as a string."""
+    def __init__(self, ip_address, port, sock=None, decode=None, retries=3,
+                 initialTimeout=0.25, minTimeout=0.01, maxTimeout=1.0, bufsize=1024, deadline=1.0, checks=None):
+        self.ip_address = ip_address
+        self.port = port
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock = sock
+        if decode is None:
+            decode = lambda data: data.decode("utf-8").strip().strip("\x00")
+        self.decode = decode
+        self.retries = retries
+        self.deadline = deadline
+        self.bufsize = bufsize
+        self.checks = dict(checks or {})
+
+        self.latency = latency.LatencyEstimator(initial=initialTimeout, minTimeout=minTimeout, maxTimeout=maxTimeout)
+        self._pending = collections.deque()
+        # Sends not yet accounted for by a reply, in order, as (request, time)
+        self._sends = collections.deque()
+
+        # Counts of datagrams sent and received, requests resent and stale
+        # replies discarded
+        self.stats = {"sent": 0, "received": 0, "retries": 0, "discarded": 0}
+
+    @property
+    def pending(self):
+        """The number of requests waiting for a reply"""
+        return len(self._pending)
+
+    def send(self, message):
+        """Send a message that has no reply"""
+        self._sendto(message)
+
+    def submit(self, message, check=None):
+        """Send a request and return the Request without waiting for the reply.
+
+        check(reply) returns True if reply has the expected form (default: the
+        check for message in checks, if any)"""
+        if not self._pending:
+            # Nothing is waiting for a reply, so anything on the socket is stale
+            self.discard()
+        if check is None:
+            check = self.checks.get(message)
+        req = Request(message, check)
+        self._pending.append(req)
+        self._transmit(req)
+        return req
+
+    def _transmit(self, req):
+        req.attempts += 1
+        req.sent = time.perf_counter()
+        if req.first is None:
+            req.first = req.sent
+        self._sends.append((req, req.sent))
+        self._sendto(req.message)
+
+    def _checkPending(self, req):
+        if req not in self._pending:
+            raise socket.timeout("UDPTransport: request {:s} to {:}:{:} abandoned after an earlier one failed".format(
+                req.message, self.ip_address, self.port))
+
+    def _timedOut(self, oldest):
+        """Resend all outstanding requests after the oldest timed out, or give
+        up if it has been retried enough"""
+        self.latency.backoff()
+        if oldest.attempts > self.retries and time.perf_counter() - oldest.first >= self.deadline:
+            self._pending.clear()
+            self._sends.clear()
+            self.discard()
+            message = "UDPTransport: no reply to {:s} from {:}:{:} after {:d} attempts".format(
+                oldest.message, self.ip_address, self.port, oldest.attempts)
+            if oldest.rejected is not None:
+                raise ReplyError("{:s} (last unexpected reply {!r})".format(message, oldest.rejected))
+            raise socket.timeout(message)
+        # Late replies to the earlier sends are still matched as they arrive
+        for req in self._pending:
+            self.stats["retries"] += 1
+            self._transmit(req)
+
+    def _match(self, reply, discard=False):
+        """Account for reply against the sends in order (see above).  If
+        discard is True, it isn't taken as the reply to any request"""
+        # Late duplicates aren't expected after the longest timeout
+        stale = time.perf_counter() - (self.latency.maxTimeout or self.deadline)
+        for i, (req, sent) in enumerate(self._sends):
+            if req.done:
+                if reply == req.reply and sent >= stale:
+                    break
+            elif discard:
+                continue
+            elif accepts(req.check, reply):
+                if not isinstance(req.check, str):
+                    i, req = self._expecting(reply, i, req)
+                break
+            else:
+                req.rejected = reply
+        else:
+            self.stats["discarded"] += 1
+            return
+
+        for j in range(i + 1):
+            self._sends.popleft()
+        if req.done:
+            self.stats["discarded"] += 1
+            return
+        self._pending.remove(req)
+        if req.attempts == 1:
+            # Only unambiguous measurements are used to set the timeout
+            self.latency.update(time.perf_counter() - req.sent)
+        req.reply = reply
+        req.done = True
+
+    def _expecting(self, reply, i, req):
+        """Return the index and request of the first outstanding send after i
+        whose check is exactly reply, or i and req if there is none"""
+        for j in range(i + 1, len(self._sends)):
+            later, sent = self._sends[j]
+            if not later.done and later.check == reply:
+                return j, later
+        return i, req
+
+
+class UDPTransport(BaseUDPTransport):
+    """Request/response transport over a UDP socket with several requests in
+    flight, an adaptive timeout and fast retries.
+
+    Only settimeout, sendto and recvfrom are used on the socket, so a socket
+    like object such as an ioTrace proxy can be passed in as sock."""
+    def __init__(self, ip_address, port, **kwargs):
+        super().__init__(ip_address, port, **kwargs)
+        self._timeout = None
+
+    def _settimeout(self, timeout):
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+
+    def _sendto(self, message):
+        self.sock.sendto(bytes(message, "UTF-8"), (self.ip_address, self.port))
+        self.stats["sent"] += 1
+
+    def receive(self, timeout=None):
+        """Receive a single datagram, outside of the request/response
+        matching, and return it decoded.  Raises socket.timeout if nothing
+        arrives within timeout (default: the current adaptive timeout)"""
+        if timeout is None:
+            timeout = self.latency.timeout
+        self._settimeout(timeout)
+        data, addr = self.sock.recvfrom(self.bufsize)
+        self.stats["received"] += 1
+        return self.decode(data)
+
+    def result(self, req):
+        """Wait for the reply to a submitted request and return it"""
+        while not req.done:
+            self._checkPending(req)
+            self._receiveNext()
+        return req.reply
+
+    def _receiveNext(self):
+        """Receive a reply, retrying all outstanding requests if none arrives
+        in time"""
+        oldest = self._pending[0]
+        self._settimeout(self.latency.timeout)
+        try:
+            data, addr = self.sock.recvfrom(self.bufsize)
+        except socket.timeout:
+            self._timedOut(oldest)
+            return
+
+        self.stats["received"] += 1
+        self._match(self.decode(data))
+
+    def discard(self):
+        """Discard any datagrams already waiting on the socket"""
+        self._settimeout(0.0)
+        try:
+            while True:
+                data, addr = self.sock.recvfrom(self.bufsize)
+                self.stats["received"] += 1
+                # Account for late duplicates, so they aren't expected again
+                self._match(self.decode(data), discard=True)
+        except (socket.timeout, BlockingIOError):
+            pass
+
+    def query(self, message):
+        """Send a request and wait for the reply"""
+        return self.result(self.submit(message))
+
+    def queryMany(self, messages, window=8):
+        """Send a list of requests, keeping up to <window> in flight at a
+        time, and return the list of replies"""
+        reqs = []
+        replies = []
+        for message in messages:
+            reqs.append(self.submit(message))
+            if len(reqs) - len(replies) >= window:
+                replies.append(self.result(reqs[len(replies)]))
+        for req in reqs[len(replies):]:
+            replies.append(self.result(req))
+        return replies
+
+    def flush(self):
+        """Wait for the replies to all outstanding requests"""
+        while self._pending:
+            self._receiveNext()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Protocol passing received datagrams to an AsyncUDPTransport"""
+    def __init__(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport._datagramReceived(data)
+
+    def error_received(self, exc):
+        self.transport.error = exc
+
+
+class AsyncUDPTransport(BaseUDPTransport):
+    """UDPTransport over an asyncio datagram endpoint, so that replies are
+    waited for without blocking the event loop.
+
+    Call open() from the event loop before use.  result(), query(),
+    queryMany() and flush() are coroutines; send() and submit() don't wait
+    and are the same as for UDPTransport.  There is no receive(), as all
+    datagrams are matched to requests.  Replies are matched to requests
+    as they arrive, so several coroutines can wait on requests at once."""
+    def __init__(self, ip_address, port, **kwargs):
+        super().__init__(ip_address, port, **kwargs)
+        self.endpoint = None
+        self.error = None
+        self._arrived = None
+
+    async def open(self):
+        """Create the datagram endpoint on the socket"""
+        loop = asyncio.get_running_loop()
+        self.endpoint, protocol = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(self),
+                                                                      sock=self.sock)
+        self._arrived = asyncio.Event()
+
+    def close(self):
+        """Close the datagram endpoint"""
+        if self.endpoint is not None:
+            self.endpoint.close()
+        self.endpoint = None
+
+    def _sendto(self, message):
+        self.endpoint.sendto(bytes(message, "UTF-8"), (self.ip_address, self.port))
+        self.stats["sent"] += 1
+
+    def _datagramReceived(self, data):
+        self.stats["received"] += 1
+        self._match(self.decode(data))
+        # Wake everything waiting for a reply
+        self._arrived.set()
+        self._arrived = asyncio.Event()
+
+    def discard(self):
+        """Nothing to do, as datagrams are accounted for as they arrive"""
+
+    async def result(self, req):
+        """Wait for the reply to a submitted request and return it"""
+        while not req.done:
+            self._checkPending(req)
+            await self._receiveNext()
+        return req.reply
+
+    async def _receiveNext(self):
+        """Wait for a reply, retrying all outstanding requests if none arrives
+        in time"""
+        oldest = self._pending[0]
+        sent = oldest.sent
+        try:
+            await asyncio.wait_for(self._arrived.wait(), self.latency.timeout)
+        except asyncio.TimeoutError:
+            # Unless another waiter has already retried
+            if self._pending and self._pending[0] is oldest and oldest.sent == sent:
+                self._timedOut(oldest)
+
+    async def query(self, message):
+        """Send a request and wait for the reply"""
+        return await self.result(self.submit(message))
+
+    async def queryMany(self, messages, window=8):
+        """Send a list of requests, keeping up to <window> in flight at a
+        time, and return the list of replies"""
+        reqs = []
+        replies = []
+        for message in messages:
+            reqs.append(self.submit(message))
+            if len(reqs) - len(replies) >= window:
+                replies.append(await self.result(reqs[len(replies)]))
+        for req in reqs[len(replies):]:
+            replies.append(await self.result(req))
+        return replies
+
+    async def flush(self):
+        """Wait for the replies to all outstanding requests"""
+        while self._pending:
+            await self._receiveNext()
@@ -7,6 +7,9 @@
 import pyvisa
 from numpy import sign
 
+from ..Instrument import Instrument
+from . import ResourceRegistry
+
 class Unidex11(object):
     """Class for communicating with a Unidex 11 motion controller"""
     def __init__(self, InstAddr="GPIB::2", strict=False):
@@ -14,14 +17,12 @@ class Unidex11(object):
 
           InstAddr is the address of the motion controller - try "GPIB::2" by default"""
 
-        rm = pyvisa.ResourceManager()
-
         read_termination="\r\n"
 
         if InstAddr[0:3] == "COM": # We are using RS232 and need to set up the instrument more carefully
-            self.inst = rm.open_resource(InstAddr, baud_rate=9600, data_bits=7, stop_bits=1, parity=pyvisa.odd_parity, term_chars=read_termination, delay = 0.05)
+            self.inst = ResourceRegistry.openResource(InstAddr, baud_rate=9600, data_bits=7, stop_bits=1, parity=pyvisa.odd_parity, term_chars=read_termination, delay = 0.05)
         else:  # We are probably using GPIB, but don't really know.
-            self.inst = rm.open_resource(InstAddr)
+            self.inst = ResourceRegistry.openResource(InstAddr)
 
         self.verbose = False
         self.Uspeed = 100
@@ -71,12 +72,17 @@ class Unidex11(object):
         if self.posMode == "Inc":
             self.inst.write("I IN *\n")
 
-    def waitForStop(self):
-        """Wait until the current move command finishes"""
-        while not (self.inst.stb & 64):
-            time.sleep(0.1)
-        while (self.inst.stb & 64):
-            time.sleep(0.1)
+    def waitForStop(self, timeout=None):
+        """Wait until the current move command finishes
+
+        The Unidex requests service at the end of the move.  Over GPIB this
+        waits on the service request event, otherwise the status byte is
+        polled"""
+        try:
+            self.inst.wait_for_srq(None if timeout is None else int(timeout*1000))
+        except AttributeError:
+            Instrument.pollUntil(lambda: self.inst.stb & 64, timeout=timeout, maxInterval=0.05)
+        Instrument.pollUntil(lambda: not (self.inst.stb & 64), timeout=timeout, maxInterval=0.05)
 
 
     def getUAxisPosition(self):
@@ -0,0 +1,119 @@
+# DAQ.py
+#
+# Stand-in for LabEquipment.drivers.DAQ.DAQ, with analog inputs computed
+# from the analog outputs, e.g. by an SIS junction model.
+#
+# e.g.
+#     iv = IV.IV(daq=SimDAQ(response=SISJunction()))
+#
+import time
+
+import numpy as np
+
+
+class Range(object):
+    """Analog range with range_min and range_max in volts"""
+    def __init__(self, range_min, range_max):
+        self.range_min = range_min
+        self.range_max = range_max
+        self.value = range_max
+
+
+class SimDAQ(object):
+    """Simulated DAQ with the interface of DAQ.DAQ used by the mixer
+    applications.
+
+    response(outputs, t) returns the analog input voltages of all channels
+    given the array of analog output voltages.  Scans take
+    samples_per_channel/rate seconds on the clock.  Noise is drawn from rng
+    (default: numpy's global generator)."""
+    def __init__(self, response=None, number_of_channels=8, noise=1e-4, clock=time, rng=None):
+        if response is None:
+            response = lambda outputs, t: np.resize(outputs, number_of_channels)
+        self.response = response
+        self.number_of_channels = number_of_channels
+        self.noise = noise
+        self.clock = clock
+        self.rng = np.random if rng is None else rng
+        self.config = {}
+        self.AoRange = Range(0.0, 5.0)
+        self.AiRange = Range(-5.0, 5.0)
+        self.outputs = np.zeros(2)
+        self.bits = {}
+        self.connected = False
+
+    def setConfig(self, config):
+        self.config.update(config)
+
+    def connect(self, boardnum=None):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def setAiRange(self, r):
+        self.AiRange = r
+
+    def setAiRangeValue(self, v):
+        pass
+
+    def _inputs(self, t):
+        values = np.asarray(self.response(self.outputs, t), dtype=float)
+        return np.clip(values, self.AiRange.range_min, self.AiRange.range_max)
+
+    def AIn(self, channel=0):
+        """Read analog input <channel>"""
+        return float(self._inputs(self.clock.time())[channel] + self.noise*self.rng.normal())
+
+    def AOut(self, data, channel=0):
+        """Set analog output <channel> to <data> volts"""
+        if channel >= len(self.outputs):
+            self.outputs = np.resize(self.outputs, channel + 1)
+        self.outputs[channel] = min(max(data, self.AoRange.range_min), self.AoRange.range_max)
+
+    def DOut(self, data, channel=0, port=None):
+        """Set digital output bit <channel>"""
+        self.bits[channel] = data
+
+    def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time=None):
+        """Scan analog inputs low_channel to high_channel, returning an array
+        of shape (samples_per_channel, channel_count)"""
+        high_channel = min(high_channel, self.number_of_channels - 1)
+        self.clock.sleep(samples_per_channel/rate)
+        values = self._inputs(self.clock.time())[low_channel:high_channel+1]
+        return values + self.noise*self.rng.normal(size=(samples_per_channel, len(values)))
+
+
+class SISJunction(object):
+    """Response of an SIS junction on a bias box, for SimDAQ.
+
+    The bias in mV is set by the vOut channel through the bias box gain and
+    offset (as in the IV configuration), and the junction voltage and current
+    are read back on the vIn and iIn channels.  The junction has a gap voltage
+    Vgap in mV, normal resistance Rn and subgap resistance Rsg in ohms"""
+    def __init__(self, Vgap=2.8, Rn=20.0, Rsg=400.0, vOut=(0, 0.5, 2.5), vIn=(0, 1.0, 0.0), iIn=(1, 1.0, 0.0),
+                 number_of_channels=8):
+        self.Vgap = Vgap
+        self.Rn = Rn
+        self.Rsg = Rsg
+        # (channel, gain, offset) of each signal
+        self.vOut = vOut
+        self.vIn = vIn
+        self.iIn = iIn
+        self.number_of_channels = number_of_channels
+
+    def current(self, V):
+        """Return the current in mA at bias V in mV"""
+        if abs(V) < self.Vgap:
+            return V/self.Rsg
+        return V/self.Rn
+
+    def __call__(self, outputs, t):
+        channel, gain, offset = self.vOut
+        V = (outputs[channel] - offset)/gain if channel < len(outputs) else 0.0
+        inputs = np.zeros(self.number_of_channels)
+        channel, gain, offset = self.vIn
+        inputs[channel] = V*gain/1000 + offset
+        channel, gain, offset = self.iIn
+        inputs[channel] = self.current(V)*gain + offset
+        return inputs
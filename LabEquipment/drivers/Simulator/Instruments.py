@@ -0,0 +1,932 @@
+# Instruments.py
+#
+# Simulated instruments answering the command sets used by the drivers in
+# LabEquipment.drivers.Instrument, for use with Resource.SimResourceManager.
+#
+# Measured signals come from source functions of time, so that readings
+# follow simulated motion and source settings.  Measurement, sweep and
+# motion times are simulated on the model's clock.
+#
+import datetime
+import math
+import re
+
+import numpy as np
+
+from . import Kinematics
+from .Resource import SimModel
+
+
+def parseNumber(value, units=None):
+    """Parse a number with an optional unit suffix, using the multipliers in
+    the units dict"""
+    m = re.fullmatch(r"\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*([A-Za-z]*)\s*", value)
+    if m is None:
+        raise ValueError("Can't parse number from {!r}".format(value))
+    number = float(m.group(1))
+    if units and m.group(2):
+        number *= units[m.group(2).upper()]
+    return number
+
+
+frequencyUnits = {"HZ": 1.0, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9, "MZ": 1e6, "GZ": 1e9}
+
+
+class SignalGenerator(SimModel):
+    """SCPI signal generator, as used by the HMCT2240, HP83630A and
+    AgilentE8257D drivers, with CW and list modes.
+
+    Settings not otherwise handled are stored, and returned by the
+    corresponding query."""
+    commands = (
+        (r"\*IDN\?", "idn"),
+        (r"\*OPC\?", "opc"),
+        (r"\*TRG", "trg"),
+        (r"FREQ(?::CW)?\?", "freqQuery"),
+        (r"FREQ(?::CW)?\s+(.+)", "setFreq"),
+        (r"POW(?::LEV)?\?", "powQuery"),
+        (r"POW(?::LEV)?\s+(.+)", "setPow"),
+        (r"(?:OUTP|POW:STAT)\s+(\S+)", "setOutput"),
+        (r"(?:OUTP|POW:STAT)\?", "outputQuery"),
+        (r"LIST:FREQ\s+(.+)", "setListFreq"),
+        (r"LIST:POW(?::CORR)?\s+(.+)", "setListPow"),
+        (r"LIST:DWEL\s+(.+)", "setListDwell"),
+        (r"INIT", "init"),
+        (r"([:A-Z*]+)\?", "settingQuery"),
+        (r"([:A-Z*]+)\s+(.+)", "setting"),
+    )
+
+    def __init__(self, freq=10e9, power=0.0, idString="Simulated signal generator"):
+        super().__init__()
+        self.idString = idString
+        self.freq = freq
+        self.power = power
+        self.output = False
+        self.settings = {"FREQ:MODE": "CW", "POW:MODE": "FIX"}
+        self.listFreqs = []
+        self.listPowers = []
+        self.listIndex = -1
+        self.armed = False
+
+    def idn(self):
+        return self.idString
+
+    def opc(self):
+        return "1"
+
+    def inList(self):
+        return self.settings.get("FREQ:MODE", "CW").upper().startswith("LIST") and self.listIndex >= 0
+
+    def continuous(self):
+        return self.settings.get("INIT:CONT", "OFF").upper() in ("1", "ON")
+
+    def trg(self):
+        """Step to the next list point.  A single sweep (INIT:CONT OFF) stops
+        at the last point, ignoring triggers until the next INIT"""
+        if not self.settings.get("FREQ:MODE", "CW").upper().startswith("LIST") or not self.listFreqs:
+            return None
+        if not (self.armed or self.continuous()):
+            return None
+        if self.listIndex + 1 < len(self.listFreqs):
+            self.listIndex += 1
+        elif self.continuous():
+            self.listIndex = 0
+        if self.listIndex == len(self.listFreqs) - 1 and not self.continuous():
+            self.armed = False
+        return None
+
+    def init(self):
+        self.listIndex = -1
+        self.armed = True
+        return None
+
+    def getFreq(self, t=None):
+        """Return the output frequency in Hz"""
+        if self.inList():
+            return self.listFreqs[self.listIndex]
+        return self.freq
+
+    def getPower(self, t=None):
+        """Return the output power in dBm, or None if the output is off"""
+        if not self.output:
+            return None
+        if self.inList() and self.listPowers and self.settings.get("POW:MODE", "FIX").upper().startswith("LIST"):
+            return self.listPowers[self.listIndex % len(self.listPowers)]
+        return self.power
+
+    def freqQuery(self):
+        return "{:.10g}".format(self.getFreq())
+
+    def setFreq(self, value):
+        self.freq = parseNumber(value, frequencyUnits)
+        return None
+
+    def powQuery(self):
+        return "{:g}".format(self.power)
+
+    def setPow(self, value):
+        self.power = parseNumber(value, {"DBM": 1.0})
+        return None
+
+    def setOutput(self, value):
+        self.output = value.upper() in ("1", "ON")
+        return None
+
+    def outputQuery(self):
+        return "1" if self.output else "0"
+
+    def setListFreq(self, values):
+        self.listFreqs = [parseNumber(v, frequencyUnits) for v in values.split(",")]
+        self.listIndex = -1
+        return None
+
+    def setListPow(self, values):
+        self.listPowers = [parseNumber(v, {"DBM": 1.0}) for v in values.split(",")]
+        return None
+
+    def setListDwell(self, values):
+        self.settings["LIST:DWEL"] = values
+        return None
+
+    def settingQuery(self, header):
+        return self.settings.get(header.upper().lstrip(":"), "0")
+
+    def setting(self, header, value):
+        self.settings[header.upper().lstrip(":")] = value.strip()
+        return None
+
+
+class HP8508A(SimModel):
+    """HP 8508A vector voltmeter.
+
+    signal(t) returns the complex A and B channel voltages at time t.  Each
+    reading takes readingTime*2**averaging seconds from its trigger (or from
+    the MEAS? query when free running), with noise falling with averaging."""
+    commands = (
+        (r"\*IDN\?", "idn"),
+        (r"\*TRG", "trg"),
+        (r"FORMAT\?", "formatQuery"),
+        (r"FORMAT\s+(.+)", "setFormat"),
+        (r"AVER:COUN\?", "averQuery"),
+        (r"AVER:COUN\s+(\d+)", "setAver"),
+        (r"SENSE\s+(.+)", "setSense"),
+        (r"TRIG:SOUR\s+(\w+)", "setTrigger"),
+        (r"DISP:STAT\s+(\w+)", "setDisplay"),
+        (r"MEAS\?\s*(.*)", "meas"),
+    )
+
+    def __init__(self, signal=None, readingTime=0.002, noise=1e-3):
+        super().__init__()
+        if signal is None:
+            signal = lambda t: (0.1+0j, 0.1+0j)
+        self.signal = signal
+        self.readingTime = readingTime
+        self.noise = noise
+        self.scale = "LOGARITHMIC"
+        self.coords = "POLAR"
+        self.averaging = 0
+        self.sense = "TRANSMISSION"
+        self.triggerSource = "FREE"
+        self.display = True
+        self.triggerTime = None
+
+    def idn(self):
+        return "HEWLETT-PACKARD,8508A,0,8508A-050"
+
+    def trg(self):
+        self.triggerTime = self.clock.time()
+        return None
+
+    def formatQuery(self):
+        return "{},{}".format(self.scale, self.coords)
+
+    def setFormat(self, fmt):
+        for word in fmt.upper().split(","):
+            if word.startswith("LOG"):
+                self.scale = "LOGARITHMIC"
+            elif word.startswith("LIN"):
+                self.scale = "LINEAR"
+            elif word.startswith("POL"):
+                self.coords = "POLAR"
+            elif word.startswith("RECT") or word.startswith("CART"):
+                self.coords = "RECTANGULAR"
+        return None
+
+    def averQuery(self):
+        return "{:d}".format(self.averaging)
+
+    def setAver(self, window):
+        self.averaging = min(int(window), 10)
+        return None
+
+    def setSense(self, sense):
+        self.sense = sense.strip().upper()
+        return None
+
+    def setTrigger(self, source):
+        self.triggerSource = source.upper()
+        return None
+
+    def setDisplay(self, state):
+        self.display = state.upper() in ("1", "ON")
+        return None
+
+    @property
+    def measurementTime(self):
+        """Time in seconds taken by one (averaged) reading"""
+        return self.readingTime*2**self.averaging
+
+    def meas(self, sense):
+        if not sense:
+            sense = self.sense
+        now = self.clock.time()
+        start = now
+        if self.triggerSource == "BUS" and self.triggerTime is not None:
+            start = self.triggerTime
+        self.triggerTime = None
+        done = start + self.measurementTime
+        if done > now:
+            self.clock.sleep(done - now)
+
+        a, b = self.signal(start + 0.5*self.measurementTime)
+        sigma = self.noise/math.sqrt(2**self.averaging)
+        a += sigma*abs(a)*complex(*self.rng.normal(size=2))
+        b += sigma*abs(b)*complex(*self.rng.normal(size=2))
+
+        values = []
+        for item in sense.upper().split(","):
+            item = item.strip()
+            if item.startswith("TRAN"):
+                values.extend(self.complexValues(a/b if b else 0j))
+            elif item.startswith("APOW"):
+                values.append(self.powerValue(a))
+            elif item.startswith("BPOW"):
+                values.append(self.powerValue(b))
+            elif item.startswith("AVOL"):
+                values.append("{:.6g}".format(abs(a)))
+            elif item.startswith("BVOL"):
+                values.append("{:.6g}".format(abs(b)))
+            elif item.startswith("PHAS"):
+                values.append("{:.3f}".format(np.angle(a/b if b else 0j, deg=True)))
+        return ",".join(values)
+
+    def complexValues(self, z):
+        if self.coords == "POLAR":
+            if self.scale == "LOGARITHMIC":
+                amp = 20*math.log10(abs(z)) if z else -200.0
+                return ["{:.4f}".format(amp), "{:.3f}".format(np.angle(z, deg=True))]
+            return ["{:.6g}".format(abs(z)), "{:.3f}".format(np.angle(z, deg=True))]
+        return ["{:.6g}".format(z.real), "{:.6g}".format(z.imag)]
+
+    def powerValue(self, v):
+        # Power in dBm of a voltage amplitude across 50 ohms
+        p = abs(v)**2/50/1e-3
+        return "{:.4f}".format(10*math.log10(p) if p > 0 else -200.0)
+
+
+class HP436A(SimModel):
+    """HP 436A power meter with an 8481A sensor.
+
+    power(t) returns the power in Watts at time t.  Program codes return a
+    reading after the settling time of the requested rate, and in the free
+    running rates further reads return a new reading every readingTime
+    seconds."""
+    separator = None
+
+    commands = (
+        (r"([1-59])([A-D])([+-])([HTIRV])", "program"),
+    )
+
+    settleTimes = {"H": 0.0, "T": 0.15, "I": 0.0, "R": 0.0, "V": 0.15}
+
+    def __init__(self, power=None, readingTime=0.045, noise=1e-3):
+        super().__init__()
+        if power is None:
+            power = lambda t: 1e-6
+        self.power = power
+        self.readingTime = readingTime
+        self.noise = noise
+        self.range = "9"
+        self.mode = "A"
+        self.calFactor = "+"
+        self.rate = "V"
+        self.lastReading = None
+
+    def program(self, range, mode, calFactor, rate):
+        self.range, self.mode, self.calFactor, self.rate = range, mode, calFactor, rate
+        now = self.clock.time()
+        delay = self.settleTimes[rate] + self.readingTime
+        self.clock.sleep(delay)
+        self.lastReading = now + delay
+        return self.reading(now + delay)
+
+    def idleRead(self):
+        if self.lastReading is None or self.rate not in "RV":
+            return None
+        next = self.lastReading + self.readingTime
+        now = self.clock.time()
+        if next > now:
+            self.clock.sleep(next - now)
+        else:
+            next = now
+        self.lastReading = next
+        return self.reading(next)
+
+    def reading(self, t):
+        """Return the reading string for the power at time t"""
+        p = self.power(t)*(1 + self.noise*self.rng.normal())
+
+        # Ranges 1-5 have full scales of 10 uW to 100 mW
+        if self.range == "9":
+            rng = min(max(int(math.ceil(math.log10(max(p, 1e-12)/1e-6))), 1), 5)
+        else:
+            rng = int(self.range)
+        status = "P"
+        if p > 10**(rng - 6)*1.2:
+            status = "R"
+        elif self.mode == "A" and p < 10**(rng - 6)*1e-3:
+            status = "Q"
+
+        if self.mode == "A":
+            if p > 0:
+                exponent = int(math.floor(math.log10(p))) - 3
+                mantissa = int(round(p/10**exponent))
+                if mantissa >= 10000:
+                    mantissa //= 10
+                    exponent += 1
+            else:
+                mantissa, exponent = 0, 0
+        else:
+            mantissa = int(round(10*math.log10(max(p, 1e-12)/1e-3)*100))
+            exponent = -2
+        sign = "-" if mantissa < 0 else " "
+        return "{}{}{}{}{:04d}E{:+03d}".format(status, " IJKLM"[rng], self.mode, sign, abs(mantissa), exponent)
+
+
+class HP8562A(SimModel):
+    """HP 8562A spectrum analyzer.
+
+    spectrum(freqs, t) returns the power in dBm at an array of frequencies in
+    Hz at time t (default: a noise floor).  Each sweep of 601 points takes a
+    time set by the span and resolution bandwidth."""
+    separator = ";"
+
+    commands = (
+        (r"ID\?", "idn"),
+        (r"(SP|CF|FA|FB|RB|VB|RL)\?", "query"),
+        (r"(SP|CF|FA|FB|RB|VB|RL)\s*([-+\d.eE]+\s*[A-Z]*)", "set"),
+        (r"TS", "takeSweep"),
+        (r"DONE\?", "done"),
+        (r"TDF\s*(\w+)", "setTraceFormat"),
+        (r"LG\?", "logScale"),
+        (r"AUNITS\?", "aunits"),
+        (r"TRA\?", "trace"),
+    )
+
+    points = 601
+
+    def __init__(self, spectrum=None, noiseFloor=-90.0):
+        super().__init__()
+        if spectrum is None:
+            spectrum = lambda freqs, t: np.full(len(freqs), noiseFloor)
+        self.spectrum = spectrum
+        self.noiseFloor = noiseFloor
+        self.fa = 0.0
+        self.fb = 2.9e9
+        self.rb = 1e6
+        self.vb = 1e6
+        self.rl = 0.0
+        self.traceFormat = "P"
+        self.sweepEnd = 0.0
+        self.traceData = None
+
+    def idn(self):
+        return "HP8562A"
+
+    def query(self, param):
+        param = param.upper()
+        if param == "SP":
+            value = self.fb - self.fa
+        elif param == "CF":
+            value = 0.5*(self.fa + self.fb)
+        elif param == "RL":
+            return "{:.2f}".format(self.rl)
+        else:
+            value = getattr(self, param.lower())
+        return "{:.6E}".format(value)
+
+    def set(self, param, value):
+        param = param.upper()
+        if param == "RL":
+            self.rl = parseNumber(value, {"DBM": 1.0, "DB": 1.0})
+            return None
+        value = parseNumber(value, frequencyUnits)
+        if param == "SP":
+            cf = 0.5*(self.fa + self.fb)
+            self.fa, self.fb = cf - 0.5*value, cf + 0.5*value
+        elif param == "CF":
+            span = self.fb - self.fa
+            self.fa, self.fb = value - 0.5*span, value + 0.5*span
+        else:
+            setattr(self, param.lower(), value)
+        return None
+
+    @property
+    def sweepTime(self):
+        """Time in seconds for one sweep"""
+        return max(2.5*(self.fb - self.fa)/min(self.rb, self.vb)**2, 0.05)
+
+    def takeSweep(self):
+        start = max(self.clock.time(), self.sweepEnd)
+        self.sweepEnd = start + self.sweepTime
+        freqs = np.linspace(self.fa, self.fb, self.points)
+        noise = self.rng.normal(scale=0.5, size=self.points)
+        self.traceData = np.asarray(self.spectrum(freqs, start + 0.5*self.sweepTime)) + noise
+        return None
+
+    def done(self):
+        now = self.clock.time()
+        if self.sweepEnd > now:
+            self.clock.sleep(self.sweepEnd - now)
+        return "1"
+
+    def setTraceFormat(self, fmt):
+        self.traceFormat = fmt.upper()
+        return None
+
+    def logScale(self):
+        return "10"
+
+    def aunits(self):
+        return "DBM"
+
+    def trace(self):
+        if self.traceData is None:
+            self.takeSweep()
+        self.done()
+        return ",".join("{:.2f}".format(v) for v in self.traceData)
+
+
+class MSLAxis(object):
+    """One Newmark MSL stage axis with an MDrive motor.
+
+    Positions are in motor steps.  Moves follow a trapezoidal velocity
+    profile and stop at the limit switches at negLimit and posLimit."""
+    def __init__(self, clock, negLimit=-300000, posLimit=300000, position=0):
+        self.clock = clock
+        self.negLimit = negLimit
+        self.posLimit = posLimit
+        self.offset = 0
+        self.velInit = 1000
+        self.velMax = 768000
+        self.accel = 1000000
+        self.decel = 1000000
+        self.echo = 0
+        self.move = None
+        self._position = position
+
+    def physical(self, t=None):
+        """Return the position relative to the limit switches at time t"""
+        if t is None:
+            t = self.clock.time()
+        if self.move is None:
+            return self._position
+        return self.move.position(t)
+
+    def position(self, t=None):
+        """Return the position counter value at time t"""
+        return self.physical(t) + self.offset
+
+    def velocity(self, t=None):
+        if t is None:
+            t = self.clock.time()
+        return 0.0 if self.move is None else self.move.velocity(t)
+
+    def moving(self, t=None):
+        if t is None:
+            t = self.clock.time()
+        return self.move is not None and self.move.moving(t)
+
+    def moveTo(self, target):
+        """Start a move to the position counter value <target>"""
+        now = self.clock.time()
+        start = self.physical(now)
+        end = min(max(target - self.offset, self.negLimit), self.posLimit)
+        self._position = end
+        if end == start:
+            self.move = None
+        else:
+            # Moves started while moving start from rest at the current
+            # position, which is close enough for the simulation
+            self.move = Kinematics.TrapezoidMove(start, end, self.velMax, self.accel, self.decel, t0=now)
+
+    def setPosition(self, value):
+        """Set the position counter to <value> at the current position"""
+        self.offset = value - self.physical()
+
+
+class MSLBus(SimModel):
+    """Newmark MSL stages sharing a serial port, addressed by party name
+    prefix (e.g. "X MA 100"), or a single stage with no party name.
+
+    axes is a dict of MSLAxis by party name, or an MSLAxis"""
+    separator = None
+
+    commands = (
+        (r"EM\s*=\s*(\d+)", "setEcho"),
+        (r"(VI|VM|A|D)\s*=\s*([-+\d.eE]+)", "setParam"),
+        (r"PR\s+(VI|VM|V|A|D|P|MV)", "printParam"),
+        (r"PR\s+AL", "printAll"),
+        (r"MA\s+([-+\d.]+)", "moveAbs"),
+        (r"MR\s+([-+\d.]+)", "moveRel"),
+        (r"P\s*=\s*([-+\d.]+)", "setPos"),
+        (r"SC", "calibrate"),
+        (r"IP", "initialize"),
+    )
+
+    params = {"VI": "velInit", "VM": "velMax", "A": "accel", "D": "decel"}
+
+    def __init__(self, axes=None):
+        super().__init__()
+        if axes is None:
+            axes = {"X": MSLAxis(self), "Y": MSLAxis(self)}
+        self.axes = axes
+        self.axis = None
+
+    def time(self):
+        return self.clock.time()
+
+    def handle(self, message):
+        message = message.strip()
+        if isinstance(self.axes, MSLAxis):
+            self.axis = self.axes
+            return self.command(message)
+        name, _, cmd = message.partition(" ")
+        if name == "*":
+            responses = []
+            for axis in self.axes.values():
+                self.axis = axis
+                resp = self.command(cmd.strip())
+                if resp is not None:
+                    responses.extend(resp if isinstance(resp, list) else [resp])
+            return responses or None
+        if name not in self.axes:
+            return self.unknown(message)
+        self.axis = self.axes[name]
+        return self.command(cmd.strip())
+
+    def setEcho(self, mode):
+        self.axis.echo = int(mode)
+        return None
+
+    def setParam(self, param, value):
+        setattr(self.axis, self.params[param.upper()], float(value))
+        return None
+
+    def printParam(self, param):
+        param = param.upper()
+        if param == "P":
+            value = self.axis.position()
+        elif param == "V":
+            value = self.axis.velocity()
+        elif param == "MV":
+            value = 1 if self.axis.moving() else 0
+        else:
+            value = getattr(self.axis, self.params[param])
+        return "{:d}".format(int(round(value)))
+
+    def printAll(self):
+        lines = ["{}={:d}".format(p, int(getattr(self.axis, name))) for p, name in self.params.items()]
+        lines.append("P={:d}".format(int(round(self.axis.position()))))
+        return lines + [""]
+
+    def moveAbs(self, pos):
+        self.axis.moveTo(float(pos))
+        return None
+
+    def moveRel(self, pos):
+        self.axis.moveTo(self.axis.position() + float(pos))
+        return None
+
+    def setPos(self, value):
+        self.axis.setPosition(float(value))
+        return None
+
+    def calibrate(self):
+        return None
+
+    def initialize(self):
+        axis = self.axis
+        axis.velInit, axis.velMax, axis.accel, axis.decel = 1000, 768000, 1000000, 1000000
+        return "Copyright 2001-2008 by Intelligent Motion Systems, Inc."
+
+
+class SR844(SimModel):
+    """Stanford Research SR844 RF lock-in amplifier.
+
+    signal(t) returns the complex input voltage at time t.  The data buffers
+    sample the channel 1 and 2 displays at the SRAT rate, or on each TRIG
+    when SRAT is 14."""
+    commands = (
+        (r"\*IDN\?", "idn"),
+        (r"OUTX\s*(\d)", "setOutx"),
+        (r"OFLT\?", "ofltQuery"),
+        (r"OFLT\s*(\d+)", "setOflt"),
+        (r"SNAP\?\s*(\d+)\s*,\s*(\d+)((?:\s*,\s*\d+)*)", "snap"),
+        (r"OUTP\?\s*(\d+)", "outp"),
+        (r"DDEF\s*(\d)\s*,\s*(\d)", "setDisplay"),
+        (r"SRAT\s*(\d+)", "setRate"),
+        (r"SEND\s*(\d)", "setEnd"),
+        (r"REST", "reset"),
+        (r"STRT", "startBuffer"),
+        (r"PAUS", "pauseBuffer"),
+        (r"TRIG", "trig"),
+        (r"SPTS\?", "spts"),
+        (r"TRCB\?\s*(\d)\s*,\s*(\d+)\s*,\s*(\d+)", "trcb"),
+    )
+
+    bufferSize = 16383
+
+    # Channel 1 displays X, R (V), R (dBm); channel 2 displays Y, theta
+    ch1Outputs = {0: 1, 1: 3, 2: 4}
+    ch2Outputs = {0: 2, 1: 5}
+
+    def __init__(self, signal=None, noise=1e-3):
+        super().__init__()
+        if signal is None:
+            signal = lambda t: 0.01+0j
+        self.signal = signal
+        self.noise = noise
+        self.outx = 1
+        self.oflt = 8
+        self.displays = {1: 0, 2: 0}
+        self.srat = 13
+        self.loop = False
+        self.running = False
+        self.bufferStart = None
+        self.bufferTimes = []
+
+    def idn(self):
+        return "Stanford_Research_Systems,SR844,s/n00000,ver1.006"
+
+    def setOutx(self, value):
+        self.outx = int(value)
+        return None
+
+    def ofltQuery(self):
+        return "{:d}".format(self.oflt)
+
+    def setOflt(self, value):
+        self.oflt = int(value)
+        return None
+
+    def output(self, i, z):
+        """Return output <i> (1 X, 2 Y, 3 R, 4 R dBm, 5 theta) for input z"""
+        if i == 1:
+            return z.real
+        if i == 2:
+            return z.imag
+        if i == 3:
+            return abs(z)
+        if i == 4:
+            p = abs(z)**2/50/1e-3
+            return 10*math.log10(p) if p > 0 else -200.0
+        return math.degrees(math.atan2(z.imag, z.real))
+
+    def sample(self, t):
+        z = self.signal(t)
+        return z + self.noise*abs(z)*complex(*self.rng.normal(size=2))
+
+    def snap(self, i, j, more):
+        z = self.sample(self.clock.time())
+        outputs = [int(i), int(j)] + [int(k) for k in more.replace(",", " ").split()]
+        return ",".join("{:.6g}".format(self.output(k, z)) for k in outputs)
+
+    def outp(self, i):
+        return "{:.6g}".format(self.output(int(i), self.sample(self.clock.time())))
+
+    def setDisplay(self, ch, j):
+        self.displays[int(ch)] = int(j)
+        return None
+
+    def setRate(self, srat):
+        self._fill()
+        self.srat = int(srat)
+        return None
+
+    def setEnd(self, loop):
+        self.loop = bool(int(loop))
+        return None
+
+    def reset(self):
+        self.running = False
+        self.bufferStart = None
+        self.bufferTimes = []
+        return None
+
+    def startBuffer(self):
+        if not self.running:
+            self.running = True
+            self.bufferStart = self.clock.time()
+        return None
+
+    def pauseBuffer(self):
+        self._fill()
+        self.running = False
+        return None
+
+    def trig(self):
+        if self.running and self.srat == 14:
+            self._store([self.clock.time()])
+        return None
+
+    def _store(self, times):
+        self.bufferTimes.extend(times)
+        if len(self.bufferTimes) > self.bufferSize:
+            if self.loop:
+                self.bufferTimes = self.bufferTimes[-self.bufferSize:]
+            else:
+                self.bufferTimes = self.bufferTimes[:self.bufferSize]
+                self.running = False
+
+    def _fill(self):
+        """Store the samples taken at the sample rate since the last fill"""
+        if not self.running or self.srat == 14:
+            return
+        rate = 0.0625*2**self.srat
+        now = self.clock.time()
+        n = int((now - self.bufferStart)*rate)
+        if n > 0:
+            self._store([self.bufferStart + k/rate for k in range(n)])
+            self.bufferStart += n/rate
+
+    def spts(self):
+        self._fill()
+        return "{:d}".format(len(self.bufferTimes))
+
+    def trcb(self, ch, start, npts):
+        self._fill()
+        ch, start, npts = int(ch), int(start), int(npts)
+        outputs = self.ch1Outputs if ch == 1 else self.ch2Outputs
+        i = outputs[self.displays[ch]]
+        values = [self.output(i, self.sample(t)) for t in self.bufferTimes[start:start+npts]]
+        return np.asarray(values, dtype="<f4").tobytes()
+
+
+class Lakeshore(SimModel):
+    """Lakeshore 218 temperature monitor with eight inputs and a data log.
+
+    temps(t) returns the eight temperatures in K at time t.  The log records
+    every logPeriod seconds from the time the model was created."""
+    commands = (
+        (r"\*IDN\?", "idn"),
+        (r"([KCSL])RDG\?\s*(\d)", "rdg"),
+        (r"INPUT\?\s*(\d)", "inputQuery"),
+        (r"INCRV\?\s*(\d)", "incrvQuery"),
+        (r"LOGNUM\?", "lognum"),
+        (r"LOGSET\?", "logset"),
+        (r"LOGREAD\?\s*(\d+)", "logread"),
+        (r"LOGVIEW\?\s*(\d+)[\s,]+(\d+)", "logview"),
+        (r"DATETIME\?", "datetimeQuery"),
+    )
+
+    def __init__(self, temps=None, noise=0.01, logPeriod=10.0, maxRecords=1500, enabled=(True,)*8, curves=(2,)*8):
+        super().__init__()
+        if temps is None:
+            temps = lambda t: np.array([292.5, 77.0, 4.2, 4.2, 292.5, 292.5, 292.5, 292.5])
+        self.temps = temps
+        self.noise = noise
+        self.logPeriod = logPeriod
+        self.maxRecords = maxRecords
+        self.enabled = list(enabled)
+        self.curves = list(curves)
+        self.logStart = None
+        self._log = {}
+
+    def idn(self):
+        return "LSCI,MODEL218S,0,0"
+
+    def read(self, t, unit="K"):
+        """Return the eight readings at time t in <unit>"""
+        T = np.asarray(self.temps(t), dtype=float) + self.noise*self.rng.normal(size=8)
+        if unit == "C":
+            return T - 273.15
+        if unit == "S":
+            # Diode-like sensor voltage
+            return 1.7 - 0.0042*T
+        return T
+
+    def rdg(self, unit, sensor):
+        values = self.read(self.clock.time(), unit.upper())
+        sensor = int(sensor)
+        if sensor == 0:
+            return ",".join("{:+08.3f}".format(v) for v in values)
+        return "{:+08.3f}".format(values[sensor - 1])
+
+    def inputQuery(self, sensor):
+        return "1" if self.enabled[int(sensor) - 1] else "0"
+
+    def incrvQuery(self, sensor):
+        return "{:02d}".format(self.curves[int(sensor) - 1])
+
+    def _logStart(self):
+        if self.logStart is None:
+            self.logStart = self.clock.time()
+        return self.logStart
+
+    def lognum(self):
+        n = int((self.clock.time() - self._logStart())/self.logPeriod)
+        return "{:d}".format(min(n, self.maxRecords))
+
+    def logset(self):
+        return "1,0,0,{:d},8".format(int(self.logPeriod))
+
+    def logread(self, reading):
+        return "{:d},1".format(int(reading))
+
+    def logview(self, record, reading):
+        record, reading = int(record), int(reading)
+        if record not in self._log:
+            t = self._logStart() + record*self.logPeriod
+            self._log[record] = (t, self.read(t))
+        t, values = self._log[record]
+        stamp = datetime.datetime.fromtimestamp(t)
+        return "{},{},{:+08.3f},0".format(stamp.strftime("%m/%d/%y"), stamp.strftime("%H:%M:%S"), values[reading - 1])
+
+    def datetimeQuery(self):
+        return datetime.datetime.fromtimestamp(self.clock.time()).strftime("%m,%d,%Y,%H,%M,%S,000")
+
+
+class GaussianBeam(object):
+    """Complex field of a Gaussian beam across a scan plane, for driving
+    the simulated vector voltmeter from the simulated stage positions.
+
+    Positions are in stage steps.  The field has a peak amplitude of
+    <peak> dB relative to the reference channel at (x0, y0), a 1/e
+    amplitude radius of <width>, and a quadratic phase curvature of
+    <curvature> degrees at a radius of <width>."""
+    def __init__(self, x0=0.0, y0=0.0, width=50000.0, peak=-10.0, curvature=30.0, floor=-80.0):
+        self.x0 = x0
+        self.y0 = y0
+        self.width = width
+        self.peak = peak
+        self.curvature = curvature
+        self.floor = floor
+
+    def __call__(self, x, y):
+        r2 = ((x - self.x0)**2 + (y - self.y0)**2)/self.width**2
+        amp = 10**(self.peak/20)*np.exp(-r2) + 10**(self.floor/20)
+        return amp*np.exp(1j*np.deg2rad(self.curvature*r2))
+
+
+# Standard addresses of the simulated instruments in labResourceManager
+labAddresses = {
+    "vvm": "GPIB0::8::INSTR",
+    "rf": "GPIB0::30::INSTR",
+    "lo": "GPIB0::19::INSTR",
+    "msl": "ASRL/dev/ttyUSB0::INSTR",
+    "pm": "GPIB0::13::INST",
+    "lakeshore": "GPIB0::12::INSTR",
+    "lockin": "GPIB0::9::INSTR",
+    "specA": "GPIB0::21::INSTR",
+}
+
+
+def labResourceManager(latency=None, serialLatency=None, clock=None, beam=None, rng=None):
+    """Return a SimResourceManager serving a simulated beamscanner and mixer
+    test lab at the addresses in labAddresses.
+
+    The vector voltmeter and lock-in measure <beam> (default: a
+    GaussianBeam) at the positions of the "X" and "Y" MSL stages whenever
+    both signal generators are on.  latency is the latency of the GPIB
+    instruments (default: 2 ms plus 1 us/byte), and serialLatency that of the
+    serial port MSL stages (default: 1 ms plus 9600 baud).  rng is the random
+    number generator for the noise (see SimResourceManager)."""
+    import time
+    from .Resource import SimResourceManager
+
+    if clock is None:
+        clock = time
+    if latency is None:
+        latency = {"base": 0.002, "perByte": 1e-6}
+    if serialLatency is None:
+        serialLatency = {"base": 0.001, "perByte": 10/9600}
+    if beam is None:
+        beam = GaussianBeam()
+
+    rm = SimResourceManager(latency=latency, clock=clock, rng=rng)
+    rf = rm.add(labAddresses["rf"], SignalGenerator(idString="Hittite,HMC-T2240,0,0"))
+    lo = rm.add(labAddresses["lo"], SignalGenerator(idString="HEWLETT-PACKARD,83630A,0,0"))
+    msl = rm.add(labAddresses["msl"], MSLBus(), latency=serialLatency)
+
+    def field(t):
+        if rf.getPower() is None or lo.getPower() is None:
+            return 0j
+        return complex(beam(msl.axes["X"].physical(t), msl.axes["Y"].physical(t)))
+
+    rm.add(labAddresses["vvm"], HP8508A(signal=lambda t: (field(t), 1.0+0j)))
+    rm.add(labAddresses["lockin"], SR844(signal=field))
+    rm.add(labAddresses["pm"], HP436A())
+    rm.add(labAddresses["lakeshore"], Lakeshore())
+    rm.add(labAddresses["specA"], HP8562A())
+    return rm
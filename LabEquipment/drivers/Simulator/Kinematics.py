@@ -0,0 +1,7 @@
+# Kinematics.py
+#
+# Trapezoidal velocity profile motion for the simulated stages.  The model
+# lives in LabEquipment.lib.kinematics, so that it can be used outside the
+# simulator.
+#
+from LabEquipment.lib.kinematics import moveTime, TrapezoidMove
@@ -0,0 +1,266 @@
+# Resource.py
+#
+# Stand-ins for pyvisa resources and resource managers, serving simulated
+# instruments (see Instruments.py).
+#
+# e.g.
+#     rm = SimResourceManager()
+#     rm.add("GPIB0::8::INSTR", Instruments.HP8508A(), latency=0.005)
+#     vvm = HP8508A.HP8508A(rm.open_resource("GPIB0::8::INSTR"))
+#
+import collections
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import pyvisa
+
+    def timeoutError(resource_name):
+        return pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+except ImportError:
+    def timeoutError(resource_name):
+        return TimeoutError("{}: timeout expired before operation completed".format(resource_name))
+
+
+class Latency(object):
+    """Simulated latency of a transaction: base seconds, plus perByte
+    seconds for each byte transferred, plus a uniformly distributed random
+    jitter of up to jitter seconds, drawn from rng (default: numpy's global
+    generator)"""
+    def __init__(self, base=0.0, perByte=0.0, jitter=0.0, rng=None):
+        self.base = base
+        self.perByte = perByte
+        self.jitter = jitter
+        self.rng = np.random if rng is None else rng
+
+    def __call__(self, nbytes=0):
+        delay = self.base + self.perByte*nbytes
+        if self.jitter:
+            delay += self.rng.uniform(0, self.jitter)
+        return delay
+
+
+def makeLatency(spec):
+    """Make a Latency from None (no latency), a number of seconds, a dict of
+    Latency arguments or a Latency"""
+    if spec is None:
+        return Latency()
+    if isinstance(spec, Latency):
+        return spec
+    if isinstance(spec, dict):
+        return Latency(**spec)
+    return Latency(base=float(spec))
+
+
+class SimModel(object):
+    """Base class for simulated instruments.
+
+    Subclasses list (regex, method) pairs in commands.  Each command in a
+    message is matched against the regexes in order, and the method is
+    called with the match groups.  Methods return the response (a string or
+    bytes), a list of responses to be read one at a time, or None if the
+    command has no response.  Scripts can override the response to any
+    command with script().  The clock is set by the resource manager, and
+    provides time() and sleep().  Noise is drawn from rng, also set by the
+    resource manager (default: numpy's global generator)."""
+    commands = ()
+
+    # Character separating several commands in one message, or None
+    separator = ";"
+
+    def __init__(self):
+        self.clock = time
+        self.rng = np.random
+        self.log = []
+        self._scripts = []
+        self._commands = [(re.compile(pattern, re.IGNORECASE), name) for pattern, name in self.commands]
+
+    def script(self, pattern, response):
+        """Answer commands matching the regex <pattern> with <response>
+        instead of the normal response.  response is a string, None for no
+        response, or a function called with the match groups"""
+        self._scripts.insert(0, (re.compile(pattern, re.IGNORECASE), response))
+
+    def clearScripts(self):
+        """Remove all scripted responses"""
+        self._scripts = []
+
+    def handle(self, message):
+        """Handle a message from the driver, and return the response or None"""
+        if self.separator:
+            parts = [m.strip() for m in message.split(self.separator) if m.strip()]
+        else:
+            parts = [message.strip()]
+        responses = []
+        for cmd in parts:
+            resp = self.command(cmd)
+            if resp is not None:
+                responses.append(resp)
+        if not responses:
+            return None
+        if len(responses) == 1:
+            return responses[0]
+        if all(isinstance(r, str) for r in responses):
+            return (self.separator or "").join(responses)
+        return b"".join(r if isinstance(r, bytes) else r.encode("latin-1") for r in responses)
+
+    def command(self, cmd):
+        """Handle a single command"""
+        for regex, response in self._scripts:
+            m = regex.fullmatch(cmd)
+            if m:
+                return response(*m.groups()) if callable(response) else response
+        for regex, name in self._commands:
+            m = regex.fullmatch(cmd)
+            if m:
+                return getattr(self, name)(*m.groups())
+        return self.unknown(cmd)
+
+    def unknown(self, cmd):
+        """Called for commands that don't match any regex"""
+        self.log.append(cmd)
+        return None
+
+    def idleRead(self):
+        """Called when the driver reads with no response pending.  Return a
+        response, or None to time out"""
+        return None
+
+
+class FakeResource(object):
+    """Stand-in for a pyvisa message based resource talking to a SimModel.
+
+    Resources opened on the same name share the model and a lock, like
+    several drivers sharing a serial port."""
+    def __init__(self, resource_name, model, latency=None, lock=None):
+        self.resource_name = resource_name
+        self.model = model
+        self.latency = makeLatency(latency)
+        self.lock = lock or threading.RLock()
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = None
+        self.stb = 0
+        self._output = collections.deque()
+
+    def _delay(self, nbytes):
+        delay = self.latency(nbytes)
+        if delay > 0:
+            self.model.clock.sleep(delay)
+
+    def write(self, message, termination=None, encoding=None):
+        with self.lock:
+            self._delay(len(message))
+            resp = self.model.handle(message)
+            if isinstance(resp, list):
+                self._output.extend(resp)
+            elif resp is not None:
+                self._output.append(resp)
+        return len(message)
+
+    def _read(self):
+        if self._output:
+            return self._output.popleft()
+        resp = self.model.idleRead()
+        if resp is None:
+            raise timeoutError(self.resource_name)
+        return resp
+
+    def read(self, termination=None, encoding=None):
+        with self.lock:
+            resp = self._read()
+            if isinstance(resp, bytes):
+                resp = resp.decode("latin-1")
+            self._delay(len(resp))
+            return resp
+
+    def read_raw(self, size=None):
+        with self.lock:
+            resp = self._read()
+            if isinstance(resp, str):
+                resp = resp.encode("latin-1")
+            self._delay(len(resp))
+            return resp
+
+    def query(self, message, delay=None):
+        with self.lock:
+            self.write(message)
+            return self.read()
+
+    def query_binary_values(self, message, datatype="f", is_big_endian=False, container=list,
+                            delay=None, header_fmt="ieee", expect_termination=True, data_points=0, chunk_size=None):
+        with self.lock:
+            self.write(message)
+            data = self.read_raw()
+        fmt = (">" if is_big_endian else "<") + datatype
+        values = np.frombuffer(data, dtype=np.dtype(fmt))
+        if container is list:
+            return values.tolist()
+        return container(values)
+
+    def assert_trigger(self):
+        self.write("*TRG")
+
+    def wait_for_srq(self, timeout=25000):
+        """Wait for the model to request service"""
+        deadline = None if timeout is None else self.model.clock.time() + timeout/1000.0
+        while not (self.read_stb() & 64):
+            if deadline is not None and self.model.clock.time() > deadline:
+                raise timeoutError(self.resource_name)
+            self.model.clock.sleep(0.001)
+
+    def read_stb(self):
+        return getattr(self.model, "stb", self.stb)
+
+    def clear(self):
+        with self.lock:
+            self._output.clear()
+
+    def close(self):
+        pass
+
+
+class SimResourceManager(object):
+    """Stand-in for a pyvisa ResourceManager serving simulated instruments.
+
+    latency is the default latency of each resource (see makeLatency), and
+    clock provides time() and sleep() for the models (default: the time
+    module).  rng is the random number generator for the models' noise and
+    the latency jitter (default: numpy's global generator), e.g.
+    np.random.default_rng(seed) for repeatable runs"""
+    def __init__(self, latency=None, clock=time, rng=None):
+        self.latency = latency
+        self.clock = clock
+        self.rng = np.random if rng is None else rng
+        self.models = collections.OrderedDict()
+        self._latencies = {}
+        self._locks = {}
+
+    def add(self, resource_name, model, latency=None):
+        """Serve <model> as <resource_name>, with its own latency if given"""
+        model.clock = self.clock
+        model.rng = self.rng
+        self.models[resource_name] = model
+        self._latencies[resource_name] = self.latency if latency is None else latency
+        self._locks[resource_name] = threading.RLock()
+        return model
+
+    def list_resources(self, query="?*::INSTR"):
+        return tuple(self.models.keys())
+
+    def open_resource(self, resource_name, *args, **kwargs):
+        try:
+            model = self.models[resource_name]
+        except KeyError:
+            raise ValueError("SimResourceManager: no simulated instrument at {}".format(resource_name))
+        resource = FakeResource(resource_name, model, self._latencies[resource_name], self._locks[resource_name])
+        resource.latency.rng = self.rng
+        for name, value in kwargs.items():
+            setattr(resource, name, value)
+        return resource
+
+    def close(self):
+        pass
@@ -0,0 +1,115 @@
+# YIG.py
+#
+# Local UDP stand-ins for the Micro Lambda MLBF YIG filters and MLBS YIG
+# synthesizers, answering the register reads and frequency/power commands
+# used by the MLBF and MLBS drivers.
+#
+# e.g.
+#     server = MLBFServer(latency=0.001, dropRate=0.01).start()
+#     yig = MLBF.MLBF(*server.address)
+#     ...
+#     server.stop()
+#
+import random
+import socket
+import threading
+import time
+
+
+class YIGServer(threading.Thread):
+    """UDP server simulating a Micro Lambda YIG device on 127.0.0.1.
+
+    Requests are answered in order after <latency> seconds, and a fraction
+    <dropRate> of requests are lost, chosen with rng (default: the random
+    module).  Frequency and power commands have no reply.  Binds an
+    ephemeral port unless one is given; the bound (ip_address, port) is in
+    address."""
+    def __init__(self, fmin=2000.0, fmax=18000.0, model="MLBF-SIM", serial="000000",
+                 latency=0.0005, dropRate=0.0, port=0, rng=None):
+        super().__init__(daemon=True)
+        self.fmin = fmin
+        self.fmax = fmax
+        self.f = fmin
+        self.latency = latency
+        self.dropRate = dropRate
+        self.rng = random if rng is None else rng
+        self.registers = {"R0000": lambda: model, "R0001": lambda: serial,
+                          "R0003": lambda: "{:.3f}".format(self.fmin),
+                          "R0004": lambda: "{:.3f}".format(self.fmax),
+                          "R0016": lambda: "{:.3f}".format(self.f)}
+
+        # Counts of requests received, replies sent and requests dropped
+        self.stats = {"received": 0, "replied": 0, "dropped": 0}
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.settimeout(0.1)
+        self.address = self.sock.getsockname()
+        self._stopEvent = threading.Event()
+
+    def start(self):
+        """Start serving, and return the server"""
+        super().start()
+        return self
+
+    def run(self):
+        while not self._stopEvent.is_set():
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.stats["received"] += 1
+            if self.dropRate and self.rng.random() < self.dropRate:
+                self.stats["dropped"] += 1
+                continue
+            reply = self.handle(data.decode("utf-8").strip())
+            if reply is None:
+                continue
+            if self.latency:
+                time.sleep(self.latency)
+            self.sock.sendto(bytes(reply, "UTF-8") + b"\x00", addr)
+            self.stats["replied"] += 1
+
+    def handle(self, message):
+        """Act on a message and return the reply, or None"""
+        if message.startswith("F"):
+            self.f = min(max(float(message[1:]), self.fmin), self.fmax)
+            return None
+        register = self.registers.get(message)
+        if register is None:
+            return None
+        return register()
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
+        self.sock.close()
+
+
+class MLBFServer(YIGServer):
+    """Simulated MLBF YIG filter"""
+    def __init__(self, fmin=2000.0, fmax=18000.0, model="MLBF-SIM", **kwargs):
+        super().__init__(fmin=fmin, fmax=fmax, model=model, **kwargs)
+
+
+class MLBSServer(YIGServer):
+    """Simulated MLBS YIG synthesizer with power control"""
+    def __init__(self, fmin=2000.0, fmax=18000.0, pmin=-10.0, pmax=15.0, model="MLBS-SIM", **kwargs):
+        super().__init__(fmin=fmin, fmax=fmax, model=model, **kwargs)
+        self.pmin = pmin
+        self.pmax = pmax
+        self.power = pmin
+        self.registers.update({"R0043": lambda: "Yes",
+                               "R0044": lambda: "{:.3f}".format(self.pmax),
+                               "R0045": lambda: "{:.3f}".format(self.pmin),
+                               "R0048": lambda: "{:.3f}".format(self.power)})
+
+    def handle(self, message):
+        if message.startswith("L"):
+            self.power = min(max(float(message[1:]), self.pmin), self.pmax)
+            return None
+        return super().handle(message)
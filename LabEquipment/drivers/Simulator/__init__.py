@@ -0,0 +1 @@
+__all__ = ["DAQ", "Instruments", "Kinematics", "Resource", "YIG"]
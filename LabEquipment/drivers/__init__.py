@@ -1 +1 @@
-__all__ = ["DAQ", "Instrument"]
+__all__ = ["DAQ", "Instrument", "Simulator"]
@@ -1 +1 @@
-__all__ = ["hjsonConfig"]
+__all__ = ["hjsonConfig", "instrumentation", "ioTrace", "kinematics", "latency", "ringBuffer"]
@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Timing instrumentation for instrument          #
+# transactions                                   #
+#                                                #
+##################################################
+"""Pluggable timing hook for instrument I/O.
+
+The drivers pass every write/read/query (and the DAQ I/O calls) through
+timed() when a hook is installed.  When instrumentation is disabled the hook
+is None and the drivers call straight through to the resource.
+
+    from LabEquipment.lib import instrumentation
+    stats = instrumentation.enable()
+    bs.scan()
+    stats.report()
+    stats.export("scan_timing.json")
+    instrumentation.disable()
+
+A hook is any callable taking (device, command, latency, nbytes).
+"""
+
+from __future__ import print_function, division
+
+import functools
+import json
+import math
+import re
+import sys
+import threading
+import time
+
+# The active hook, or None if instrumentation is disabled.
+hook = None
+
+# Numeric arguments are replaced with "#" so that commands group together.
+# Integers attached to a command name (e.g. the MLBF register "R0016") are kept.
+_numbers = re.compile(r"(?<=[\s,=])[-+]?\d+\.?\d*([eE][-+]?\d+)?|[-+]?\d*\.\d+([eE][-+]?\d+)?")
+
+# Histogram bins per decade of latency, and the latency of bin 0 in seconds
+BINS_PER_DECADE = 5
+BIN0_LATENCY = 1e-6
+
+
+def commandKey(command):
+    """Return the command string with its numeric arguments removed"""
+    if isinstance(command, bytes):
+        command = command.decode("utf-8", "replace")
+    elif not isinstance(command, str):
+        return ""
+    return _numbers.sub("#", command.strip())[:40]
+
+
+def payloadSize(obj):
+    """Return the approximate size in bytes of a command or response"""
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    try:
+        return obj.nbytes
+    except AttributeError:
+        pass
+    if isinstance(obj, (tuple, list)):
+        return sum(payloadSize(o) for o in obj)
+    return 0
+
+
+def timed(device, op, func, *args, **kwargs):
+    """Call func(*args, **kwargs), reporting its latency and payload size to
+    the active hook as a transaction of <op> on <device>"""
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    latency = time.perf_counter() - t0
+
+    h = hook
+    if h is not None:
+        key = commandKey(args[0]) if args else ""
+        if key:
+            command = "{} {}".format(op, key)
+        else:
+            command = op
+        h(device, command, latency, payloadSize(args[:1]) + payloadSize(result))
+    return result
+
+
+def instrumented(op):
+    """Decorator for driver methods to pass them through the timing hook.
+    The device is taken from the driver's instrumentationName() method if it
+    has one, otherwise from the class name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if hook is None:
+                return func(self, *args, **kwargs)
+            try:
+                device = self.instrumentationName()
+            except AttributeError:
+                device = type(self).__name__
+            return timed(device, op, functools.partial(func, self), *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def latencyBin(latency):
+    """Return the histogram bin index for latency in seconds"""
+    if latency <= BIN0_LATENCY:
+        return 0
+    return int(math.log10(latency/BIN0_LATENCY)*BINS_PER_DECADE)
+
+
+def binLatency(index):
+    """Return the upper latency edge of histogram bin <index> in seconds"""
+    return BIN0_LATENCY*10**((index+1)/BINS_PER_DECADE)
+
+
+class TimingStats(object):
+    """Accumulates count, total, min and max latency, payload size and a
+    log-spaced latency histogram for one command on one device"""
+    __slots__ = ("count", "total", "min", "max", "nbytes", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.nbytes = 0
+        self.histogram = {}
+
+    def add(self, latency, nbytes):
+        self.count += 1
+        self.total += latency
+        if latency < self.min:
+            self.min = latency
+        if latency > self.max:
+            self.max = latency
+        self.nbytes += nbytes
+        b = latencyBin(latency)
+        self.histogram[b] = self.histogram.get(b, 0) + 1
+
+    def percentile(self, p):
+        """Return an estimate of the p'th percentile latency from the histogram"""
+        target = self.count*p/100.0
+        n = 0
+        for b in sorted(self.histogram):
+            n += self.histogram[b]
+            if n >= target:
+                return min(binLatency(b), self.max)
+        return self.max
+
+    def asDict(self):
+        return {"count": self.count, "total": self.total, "min": self.min, "max": self.max,
+                "bytes": self.nbytes, "p50": self.percentile(50), "p95": self.percentile(95),
+                "histogram": {"{:.3g}".format(binLatency(b)): n for b, n in sorted(self.histogram.items())}}
+
+
+class TimingRecorder(object):
+    """Timing hook that accumulates TimingStats per (device, command)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def __call__(self, device, command, latency, nbytes):
+        key = (device, command)
+        with self._lock:
+            s = self.stats.get(key)
+            if s is None:
+                s = self.stats[key] = TimingStats()
+            s.add(latency, nbytes)
+
+    def reset(self):
+        """Clear the accumulated statistics"""
+        with self._lock:
+            self.stats = {}
+
+    def deviceTotals(self):
+        """Return a dictionary of total latency per device"""
+        totals = {}
+        for (device, command), s in self.stats.items():
+            totals[device] = totals.get(device, 0.0) + s.total
+        return totals
+
+    def report(self, file=None, top=20):
+        """Print a summary of the time spent per device and the <top> most
+        expensive commands"""
+        if file is None:
+            file = sys.stdout
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda i: i[1].total, reverse=True)
+        totals = self.deviceTotals()
+
+        print("\nInstrument timing summary:", file=file)
+        for device, total in sorted(totals.items(), key=lambda i: i[1], reverse=True):
+            print("    {:40s} {:10.3f} s".format(device, total), file=file)
+        print("\n    {:30s} {:24s} {:>8s} {:>10s} {:>9s} {:>9s} {:>9s} {:>10s}".format(
+            "Device", "Command", "Count", "Total (s)", "Mean (ms)", "p95 (ms)", "Max (ms)", "Bytes"), file=file)
+        for (device, command), s in items[:top]:
+            print("    {:30.30s} {:24.24s} {:8d} {:10.3f} {:9.3f} {:9.3f} {:9.3f} {:10d}".format(
+                device, command, s.count, s.total, 1000*s.total/s.count, 1000*s.percentile(95),
+                1000*s.max, s.nbytes), file=file)
+
+    def export(self, filename):
+        """Write the accumulated statistics to a JSON file"""
+        with self._lock:
+            data = [dict(device=device, command=command, **s.asDict())
+                    for (device, command), s in self.stats.items()]
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=1)
+
+
+def enable(recorder=None):
+    """Install recorder (a new TimingRecorder by default) as the timing hook,
+    and return it"""
+    global hook
+    if recorder is None:
+        recorder = TimingRecorder()
+    hook = recorder
+    return recorder
+
+
+def disable():
+    """Remove the timing hook"""
+    global hook
+    hook = None
+
+
+def enabled():
+    """Return True if a timing hook is installed"""
+    return hook is not None
+
+
+def report(file=None, top=20):
+    """Print the report of the active hook, if it has one"""
+    h = hook
+    if h is not None and hasattr(h, "report"):
+        h.report(file=file, top=top)
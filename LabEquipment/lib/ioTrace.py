@@ -0,0 +1,290 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Instrument I/O trace recorder and replay       #
+# backend                                        #
+#                                                #
+##################################################
+"""Record the traffic between the drivers and the hardware, and serve it back
+later without the hardware.
+
+Recording:
+    recorder = ioTrace.TraceRecorder("beamscan.trace")
+    rm = recorder.resourceManager(pyvisa.ResourceManager("@py"))
+    vvm = HP8508A.HP8508A(rm.open_resource("GPIB0::8::INSTR"))
+    yig = MLBF.MLBF(address, sock=recorder.socket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), address))
+    ivy = IVY.IVY(daq=recorder.daq(DAQ.DAQ(autoConnect=False)))
+    ...
+    recorder.close()
+
+Replay:
+    replay = ioTrace.TraceReplay("beamscan.trace", speed=10.0)
+    rm = replay.resourceManager()
+    vvm = HP8508A.HP8508A(rm.open_resource("GPIB0::8::INSTR"))
+    yig = MLBF.MLBF(address, sock=replay.socket(address))
+    ivy = IVY.IVY(daq=replay.daq())
+
+Each record holds the start time relative to the start of the recording, the
+latency, the device, the operation, its arguments and either its result or
+the exception it raised.  Records are pickled into a gzip stream.
+"""
+
+from __future__ import print_function, division
+
+import collections
+import gzip
+import pickle
+import threading
+import time
+
+# Methods of pyvisa resources that talk to the instrument
+RESOURCE_METHODS = ("write", "read", "query", "write_raw", "read_raw", "read_bytes",
+                    "query_ascii_values", "query_binary_values", "assert_trigger",
+                    "wait_on_event")
+
+# Methods of UDP sockets used by the MLBF and MLBS drivers
+SOCKET_METHODS = ("sendto", "recvfrom")
+
+# Methods and attributes of the DAQ drivers used by the mixer applications
+DAQ_METHODS = ("AIn", "AOut", "AInScan", "DOut")
+DAQ_ATTRIBUTES = ("AiRange", "AoRange", "number_of_channels")
+
+# Methods that are accepted and ignored during replay
+REPLAY_NOOPS = ("settimeout", "setblocking", "close", "clear", "lock", "unlock",
+                "enable_event", "disable_event", "discard_events",
+                "connect", "disconnect", "setConfig", "readConfig", "setAiRangeValue")
+
+Record = collections.namedtuple("Record", ["t", "latency", "device", "op", "args", "kwargs", "result", "error"])
+
+
+class TraceMismatch(RuntimeError):
+    """Raised when a replayed driver makes a request that doesn't match the
+    recorded trace"""
+    pass
+
+
+class TraceRecorder(object):
+    """Write a trace of instrument I/O to <filename>"""
+    def __init__(self, filename, flushEvery=100):
+        self.filename = filename
+        self.flushEvery = flushEvery
+        self._file = gzip.open(filename, "wb")
+        self._lock = threading.Lock()
+        self._count = 0
+        self.start = time.time()
+
+    def record(self, t, latency, device, op, args, kwargs, result=None, error=None):
+        """Append a single record to the trace"""
+        rec = Record(t - self.start, latency, device, op, args, kwargs, result, error)
+        with self._lock:
+            try:
+                data = pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # Store unpicklable exceptions as a generic error
+                rec = rec._replace(error=RuntimeError(repr(error)))
+                data = pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL)
+            self._file.write(data)
+            self._count += 1
+            if self._count % self.flushEvery == 0:
+                self._file.flush()
+
+    def close(self):
+        """Flush and close the trace file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def proxy(self, target, device, methods, attributes=()):
+        """Return a RecordingProxy for target that records calls to <methods>
+        and reads of <attributes>"""
+        return RecordingProxy(self, target, device, methods, attributes)
+
+    def resource(self, resource, device=None):
+        """Return a recording proxy for a pyvisa resource"""
+        if device is None:
+            device = resource.resource_name
+        return self.proxy(resource, device, RESOURCE_METHODS)
+
+    def resourceManager(self, rm):
+        """Return a resource manager whose resources are recorded"""
+        return RecordingResourceManager(self, rm)
+
+    def socket(self, sock, device):
+        """Return a recording proxy for a UDP socket talking to <device>"""
+        return self.proxy(sock, device, SOCKET_METHODS)
+
+    def daq(self, daq, device="daq"):
+        """Return a recording proxy for a DAQ object"""
+        return self.proxy(daq, device, DAQ_METHODS, DAQ_ATTRIBUTES)
+
+
+class RecordingProxy(object):
+    """Pass everything through to the target object, recording calls to the
+    named methods and reads of the named attributes"""
+    def __init__(self, recorder, target, device, methods, attributes=()):
+        object.__setattr__(self, "_recorder", recorder)
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_device", device)
+        object.__setattr__(self, "_methods", frozenset(methods))
+        object.__setattr__(self, "_attributes", frozenset(attributes))
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self._attributes:
+            now = time.time()
+            self._recorder.record(now, 0.0, self._device, "__attr__", (name,), {}, result=attr)
+            return attr
+        if name not in self._methods:
+            return attr
+
+        def recorded(*args, **kwargs):
+            start = time.time()
+            t0 = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as err:
+                self._recorder.record(start, time.perf_counter()-t0, self._device, name, args, kwargs, error=err)
+                raise
+            self._recorder.record(start, time.perf_counter()-t0, self._device, name, args, kwargs, result=result)
+            return result
+        return recorded
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class RecordingResourceManager(object):
+    """Wrap a pyvisa ResourceManager so that opened resources are recorded"""
+    def __init__(self, recorder, rm):
+        self.recorder = recorder
+        self.rm = rm
+
+    def open_resource(self, resource_name, *args, **kwargs):
+        return self.recorder.resource(self.rm.open_resource(resource_name, *args, **kwargs), resource_name)
+
+    def __getattr__(self, name):
+        return getattr(self.rm, name)
+
+
+def readTrace(filename):
+    """Return the list of Records in the trace file <filename>"""
+    records = []
+    with gzip.open(filename, "rb") as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+    return records
+
+
+class TraceReplay(object):
+    """Serve the responses in a recorded trace back to the drivers.
+
+    speed sets how fast the recorded latencies are replayed: 1.0 for the
+    recorded speed, >1 for accelerated replay, or None to return responses
+    immediately.  With strict=True, the operation and arguments of each
+    request must match the trace, otherwise TraceMismatch is raised."""
+    def __init__(self, filename, speed=None, strict=True):
+        self.filename = filename
+        self.speed = speed
+        self.strict = strict
+        self._lock = threading.Lock()
+
+        self._queues = collections.OrderedDict()
+        self._attrs = {}
+        for rec in readTrace(filename):
+            if rec.op == "__attr__":
+                self._attrs.setdefault(rec.device, {}).setdefault(rec.args[0], rec.result)
+            else:
+                self._queues.setdefault(rec.device, collections.deque()).append(rec)
+        self._ops = {device: set(rec.op for rec in queue) for device, queue in self._queues.items()}
+
+    @property
+    def devices(self):
+        """The devices in the trace"""
+        return tuple(self._queues.keys())
+
+    def remaining(self, device=None):
+        """Return the number of unreplayed records for device, or for all
+        devices if device is None"""
+        if device is not None:
+            return len(self._queues.get(device, ()))
+        return sum(len(q) for q in self._queues.values())
+
+    def next(self, device, op, args, kwargs):
+        """Return the result of the next recorded request for device, waiting
+        for the recorded latency if replaying at speed"""
+        with self._lock:
+            try:
+                rec = self._queues[device].popleft()
+            except (KeyError, IndexError):
+                raise TraceMismatch("ioTrace: no more recorded requests for {}".format(device))
+        if self.strict and (rec.op != op or (op not in ("read", "recvfrom") and rec.args != args)):
+            raise TraceMismatch("ioTrace: {} got {}{} but trace has {}{}".format(device, op, args, rec.op, rec.args))
+        if self.speed:
+            time.sleep(rec.latency/self.speed)
+        if rec.error is not None:
+            raise rec.error
+        return rec.result
+
+    def proxy(self, device):
+        """Return a ReplayProxy for device"""
+        return ReplayProxy(self, device)
+
+    def resource(self, device):
+        """Return a stand-in for the pyvisa resource <device>"""
+        return self.proxy(device)
+
+    def resourceManager(self):
+        """Return a stand-in ResourceManager serving the recorded resources"""
+        return ReplayResourceManager(self)
+
+    def socket(self, device):
+        """Return a stand-in for the socket used to talk to <device>"""
+        return self.proxy(device)
+
+    def daq(self, device="daq"):
+        """Return a stand-in for the DAQ object"""
+        return self.proxy(device)
+
+
+class ReplayProxy(object):
+    """Stand-in for a resource, socket or DAQ object that serves recorded
+    responses.  Attributes set by the drivers (e.g. termination characters)
+    are simply stored."""
+    def __init__(self, replay, device):
+        self._replay = replay
+        self._device = device
+        self.resource_name = device
+        self.timeout = None
+
+        for name, value in replay._attrs.get(device, {}).items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._replay._ops.get(self._device, ()):
+            def replayed(*args, **kwargs):
+                return self._replay.next(self._device, name, args, kwargs)
+            return replayed
+        if name in REPLAY_NOOPS:
+            return lambda *args, **kwargs: None
+        raise AttributeError("ioTrace: {} has no recorded '{}'".format(self._device, name))
+
+
+class ReplayResourceManager(object):
+    """Stand-in for a pyvisa ResourceManager serving recorded resources"""
+    def __init__(self, replay):
+        self.replay = replay
+
+    def list_resources(self, query=None):
+        return self.replay.devices
+
+    def open_resource(self, resource_name, *args, **kwargs):
+        return self.replay.resource(resource_name)
+
+    def close(self):
+        pass
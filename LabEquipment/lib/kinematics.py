@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Trapezoidal velocity profile motion            #
+#                                                #
+##################################################
+"""Motion with a trapezoidal velocity profile, as used by stepper motor
+controllers such as the MDrive in the Newmark MSL stages: accelerate up to
+a maximum velocity, cruise, then decelerate to a stop.
+
+    kinematics.moveTime(10000, vmax=10000, accel=500000)
+    move = kinematics.TrapezoidMove(0, 10000, vmax=10000, accel=500000)
+    move.duration, move.position(0.5)
+"""
+
+from __future__ import print_function, division
+
+import math
+
+import numpy as np
+
+
+def moveTime(distance, vmax, accel, decel=None):
+    """Return the time in seconds taken to move <distance> starting and
+    ending at rest, with maximum velocity vmax, acceleration accel and
+    deceleration decel (default: accel).  distance may be an array"""
+    if decel is None:
+        decel = accel
+    d = np.abs(distance)
+    # Moves shorter than dmax never reach vmax
+    dmax = vmax**2/(2*accel) + vmax**2/(2*decel)
+    vpeak = np.sqrt(2*np.minimum(d, dmax)*accel*decel/(accel + decel))
+    t = vpeak/accel + vpeak/decel + np.maximum(d - dmax, 0)/vmax
+    if np.ndim(t) == 0:
+        return float(t)
+    return t
+
+
+class TrapezoidMove(object):
+    """A move from start to end starting at time t0, accelerating at accel
+    up to vmax, cruising, then decelerating at decel to stop at end.  Moves
+    too short to reach vmax have a triangular velocity profile"""
+    def __init__(self, start, end, vmax, accel, decel=None, t0=0.0):
+        if decel is None:
+            decel = accel
+        if vmax <= 0 or accel <= 0 or decel <= 0:
+            raise ValueError("TrapezoidMove: vmax, accel and decel must be positive")
+        self.start = start
+        self.end = end
+        self.t0 = t0
+        self.accel = accel
+        self.decel = decel
+        self.direction = 1 if end >= start else -1
+
+        distance = abs(end - start)
+        # Distances needed to reach vmax and to stop from vmax
+        da = vmax**2/(2*accel)
+        dd = vmax**2/(2*decel)
+        if da + dd > distance:
+            vmax = math.sqrt(2*distance*accel*decel/(accel + decel))
+            da = vmax**2/(2*accel)
+            dd = vmax**2/(2*decel)
+        self.vpeak = vmax
+        self.ta = vmax/accel
+        self.td = vmax/decel
+        self.tc = (distance - da - dd)/vmax if vmax > 0 else 0.0
+        self.da = da
+        self.dc = distance - da - dd
+        self.duration = self.ta + self.tc + self.td
+
+    @property
+    def tEnd(self):
+        """The time at which the move finishes"""
+        return self.t0 + self.duration
+
+    def _distance(self, t):
+        if t <= 0:
+            return 0.0
+        if t < self.ta:
+            return 0.5*self.accel*t**2
+        t -= self.ta
+        if t < self.tc:
+            return self.da + self.vpeak*t
+        t -= self.tc
+        if t < self.td:
+            return self.da + self.dc + self.vpeak*t - 0.5*self.decel*t**2
+        return abs(self.end - self.start)
+
+    def position(self, t):
+        """Return the position at time t"""
+        if t >= self.tEnd:
+            return self.end
+        return self.start + self.direction*self._distance(t - self.t0)
+
+    def velocity(self, t):
+        """Return the (signed) velocity at time t"""
+        t -= self.t0
+        if t <= 0 or t >= self.duration:
+            return 0.0
+        if t < self.ta:
+            v = self.accel*t
+        elif t < self.ta + self.tc:
+            v = self.vpeak
+        else:
+            v = self.vpeak - self.decel*(t - self.ta - self.tc)
+        return self.direction*v
+
+    def moving(self, t):
+        """Return True if the move is still in progress at time t"""
+        return self.t0 <= t < self.tEnd
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Round trip latency estimation for adaptive     #
+# timeouts                                       #
+#                                                #
+##################################################
+"""Estimate the round trip time of an instrument link from measured
+latencies, and derive a timeout from it.
+
+The estimator follows the TCP retransmission timer (RFC 6298): a smoothed
+mean and mean deviation of the measured latencies, with the timeout set to
+mean + k*deviation, at least minTimeout.  After a timeout, backoff()
+doubles the timeout until the next good measurement, and the result is
+limited to maxTimeout.
+initial=None gives no timeout until the first measurement, and
+maxTimeout=None leaves the timeout unlimited.
+
+    est = latency.LatencyEstimator(initial=0.25, minTimeout=0.01, maxTimeout=1.0)
+    sock.settimeout(est.timeout)
+    ...
+    est.update(measured)
+"""
+
+from __future__ import print_function, division
+
+
+class LatencyEstimator(object):
+    """Smoothed round trip time estimator providing an adaptive timeout"""
+    def __init__(self, initial=0.25, minTimeout=0.01, maxTimeout=1.0, alpha=0.125, beta=0.25, k=4.0):
+        self.initial = initial
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.reset()
+
+    def reset(self):
+        """Forget all measurements"""
+        self.srtt = None
+        self.rttvar = None
+        self.count = 0
+        self.timeouts = 0
+        self.max = 0.0
+        self._backoff = 1.0
+
+    def update(self, sample):
+        """Add a measured latency in seconds.
+
+        Only latencies of requests that were answered first time should be
+        added, as it is ambiguous which attempt a retried request's reply
+        belongs to."""
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample/2
+        else:
+            self.rttvar = (1 - self.beta)*self.rttvar + self.beta*abs(self.srtt - sample)
+            self.srtt = (1 - self.alpha)*self.srtt + self.alpha*sample
+        self.count += 1
+        if sample > self.max:
+            self.max = sample
+        self._backoff = 1.0
+
+    def backoff(self):
+        """Record a timeout, doubling the timeout until the next measurement"""
+        self.timeouts += 1
+        self._backoff *= 2
+
+    @property
+    def timeout(self):
+        """The current timeout in seconds, or None if there is no limit"""
+        if self.srtt is None:
+            t = self.initial
+        else:
+            t = self.srtt + self.k*self.rttvar
+        if t is None:
+            return None
+        # Clamp before backing off, so that retries of fast links still back off
+        t = max(t, self.minTimeout)*self._backoff
+        if self.maxTimeout is not None:
+            t = min(t, self.maxTimeout)
+        return t
+
+    def asDict(self):
+        """Return the current estimates and counts as a dictionary"""
+        return {"srtt": self.srtt, "rttvar": self.rttvar, "timeout": self.timeout,
+                "count": self.count, "timeouts": self.timeouts, "max": self.max}
@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Fixed size timestamped ring buffer             #
+#                                                #
+##################################################
+"""Fixed size history of timestamped readings, written by a single background
+thread and read by any number of others.
+
+    rb = ringBuffer.RingBuffer(3600, width=8)
+    rb.append(time.time(), temps)
+    t, latest = rb.latest()
+    t, temps = rb.window(10.0)
+    meanTemps = rb.mean(10.0)
+
+The writer stores the reading before advancing the count, so readers never
+take a lock.  A reader only sees a torn reading if the writer wraps all the
+way around the buffer while it is copying, so size the buffer to hold much
+more history than is read at once.
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """Ring buffer of <size> readings of <width> values, each with a timestamp"""
+    def __init__(self, size, width=1, dtype=float):
+        self.size = int(size)
+        self.width = width
+        self.t = np.full(self.size, np.nan)
+        self.data = np.full((self.size, width), np.nan, dtype=dtype)
+        # Total number of readings ever appended
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def clear(self):
+        """Discard all readings"""
+        self.count = 0
+
+    def append(self, t, values):
+        """Add a reading of values taken at time t"""
+        i = self.count % self.size
+        self.data[i] = values
+        self.t[i] = t
+        self.count += 1
+
+    def latest(self):
+        """Return (t, values) for the newest reading, or (None, None) if the
+        buffer is empty"""
+        count = self.count
+        if count == 0:
+            return None, None
+        i = (count - 1) % self.size
+        return self.t[i], self.data[i].copy()
+
+    def _ordered(self, count):
+        """Return copies of the timestamps and readings, oldest first"""
+        n = min(count, self.size)
+        idx = np.arange(count - n, count) % self.size
+        return self.t[idx], self.data[idx]
+
+    def window(self, seconds=None, now=None):
+        """Return arrays (t, values) of the readings taken in the last <seconds>
+        seconds before now (default: the newest reading), oldest first.  All
+        readings are returned if seconds is None."""
+        t, data = self._ordered(self.count)
+        if seconds is None or len(t) == 0:
+            return t, data
+        if now is None:
+            now = t[-1]
+        sel = t >= now - seconds
+        return t[sel], data[sel]
+
+    def mean(self, seconds=None, now=None):
+        """Return the mean of the readings taken in the last <seconds> seconds,
+        or NaNs if there are none"""
+        t, data = self.window(seconds, now)
+        if len(t) == 0:
+            return np.full(self.width, np.nan)
+        return data.mean(axis=0)